@@ -0,0 +1,72 @@
+"""
+Async Database Connector - async wrapper của DatabaseConnector cho FastAPI
+pyodbc là blocking nên mỗi query chạy trên 1 thread pool riêng, giới hạn
+số query đồng thời; event loop (và /chat) không bao giờ chờ SQL Server.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from db_connector import ConnectionPool, DatabaseConnector
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabaseConnector:
+    def __init__(self, pool: ConnectionPool, max_concurrency: Optional[int] = None):
+        """
+        Async DatabaseConnector trên 1 ConnectionPool dùng chung
+
+        Mỗi lời gọi mượn 1 connection từ pool trong 1 thread riêng, nên các
+        query đồng thời không bao giờ dùng chung 1 pyodbc connection.
+
+        Args:
+            pool: ConnectionPool (thường là pool của app)
+            max_concurrency: Số query chạy đồng thời tối đa (mặc định pool.max_size)
+        """
+        self.pool = pool
+        self.max_concurrency = max_concurrency or pool.max_size
+        self._db = DatabaseConnector(pool.connection_string, pool=pool)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="db-query")
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def get_all_products(self) -> List[Dict]:
+        """Xem DatabaseConnector.get_all_products"""
+        return await self._run(self._db.get_all_products)
+
+    async def get_product_by_id(self, product_id: int) -> Optional[Dict]:
+        """Xem DatabaseConnector.get_product_by_id"""
+        return await self._run(self._db.get_product_by_id, product_id)
+
+    async def search_products(
+        self,
+        category_id: Optional[int] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        metal_type: Optional[str] = None,
+        in_stock_only: bool = True
+    ) -> List[Dict]:
+        """Xem DatabaseConnector.search_products"""
+        return await self._run(
+            self._db.search_products,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            metal_type=metal_type,
+            in_stock_only=in_stock_only
+        )
+
+    async def get_categories(self) -> List[Dict]:
+        """Xem DatabaseConnector.get_categories"""
+        return await self._run(self._db.get_categories)
+
+    def close(self):
+        """Hủy query đang chờ; pool do owner đóng"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,177 @@
+"""
+Batching Encoder - gom query từ nhiều request thành 1 batch model.encode
+Tận dụng khả năng batch của transformer khi nhiều user chat cùng lúc
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchingEncoder:
+    # Bucket (upper bound) cho batch-size histogram
+    HISTOGRAM_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0
+    ):
+        """
+        Dynamic micro-batching cho query encoding
+
+        A query that finds no other query queued behind it is encoded right
+        away, so a lone request never pays max_wait_ms. When queries are
+        already waiting (concurrent traffic, or arrivals during the previous
+        encode) the worker keeps collecting until max_batch_size is reached
+        or max_wait_ms has passed, then encodes them all with a single call
+        and hands each caller its own vector.
+
+        Args:
+            encode_fn: Hàm encode list text → matrix (n, dimension)
+            max_batch_size: Số query tối đa mỗi batch
+            max_wait_ms: Thời gian tối đa chờ gom thêm query (ms)
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # Stats
+        self.batches = 0
+        self.items = 0
+        self._histogram = {bucket: 0 for bucket in self.HISTOGRAM_BUCKETS}
+        self._histogram_overflow = 0
+
+    def start(self):
+        """Start the background worker thread"""
+        if self._thread and self._thread.is_alive():
+            return
+
+        self._thread = threading.Thread(target=self._worker, name="embedding-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"✅ Embedding batcher started (max_batch={self.max_batch_size}, max_wait={self.max_wait * 1000:.1f}ms)")
+
+    def stop(self):
+        """Stop the worker after the batch in progress"""
+        if self._thread and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5)
+        self._thread = None
+
+    def encode(self, text: str, timeout: Optional[float] = 30) -> np.ndarray:
+        """
+        Encode 1 text, dùng chung batch với các request đồng thời
+
+        Args:
+            text: Query text
+            timeout: Thời gian tối đa chờ kết quả (s)
+
+        Returns:
+            Vector shape (dimension,)
+        """
+        future = Future()
+        self._queue.put((text, future))
+        return future.result(timeout=timeout)
+
+    def _worker(self):
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            if self._queue.empty():
+                # Không có request đồng thời → encode ngay, không chờ max_wait
+                self._encode_batch(batch)
+                continue
+
+            deadline = time.monotonic() + self.max_wait
+
+            # Gom thêm query đến khi đủ batch hoặc hết thời gian chờ
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._encode_batch(batch)
+
+        # Không bỏ rơi caller nào đang chờ
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[1].set_exception(RuntimeError("Embedding batcher stopped"))
+
+    def _encode_batch(self, batch: List):
+        # Query trùng nhau trong cùng batch chỉ encode 1 lần
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+
+        try:
+            vectors = self.encode_fn(unique_texts)
+            by_text = dict(zip(unique_texts, vectors))
+            for text, future in batch:
+                future.set_result(by_text[text])
+        except Exception as e:
+            logger.error(f"❌ Batch encode failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+        self._record(len(batch))
+
+    def _record(self, size: int):
+        with self._lock:
+            self.batches += 1
+            self.items += size
+            for bucket in self.HISTOGRAM_BUCKETS:
+                if size <= bucket:
+                    self._histogram[bucket] += 1
+                    break
+            else:
+                self._histogram_overflow += 1
+
+    def histogram(self) -> Dict[str, int]:
+        """Batch-size histogram (không cộng dồn): bucket "<=n" → số batch"""
+        with self._lock:
+            histogram = {f"<={bucket}": count for bucket, count in self._histogram.items()}
+            histogram[f">{self.HISTOGRAM_BUCKETS[-1]}"] = self._histogram_overflow
+            return histogram
+
+    def stats(self) -> Dict:
+        """Batching stats cho /health"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "queries": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+            "batch_size_histogram": self.histogram()
+        }
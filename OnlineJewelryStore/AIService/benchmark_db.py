@@ -0,0 +1,229 @@
+"""
+Benchmark full-catalog extraction query
+So sánh query cũ (JOIN variants × reviews rồi GROUP BY) với ALL_PRODUCTS_QUERY (CTE pre-aggregate):
+estimated plan (cost, số dòng trung gian lớn nhất), logical reads, thời gian chạy
+và kiểm tra kết quả 2 query có khớp nhau
+
+Usage:
+    python benchmark_db.py
+    python benchmark_db.py --repeats 10 --output db_benchmark.json
+    python benchmark_db.py --connection "Driver={ODBC Driver 17 for SQL Server};Server=...;"
+"""
+
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Dict, List
+
+from db_connector import ALL_PRODUCTS_QUERY, DatabaseConnector
+
+CONNECTION_STRING = "Driver={SQL Server};Server=DESKTOP-195HJGO\\SQLEXPRESS;Database=OnlineJewelryStore;UID=sa;PWD=1;TrustServerCertificate=yes;"
+
+# Query trước khi rewrite: mỗi product sinh variants × reviews dòng trung gian,
+# cộng correlated subquery ProductMedia cho từng product
+LEGACY_PRODUCTS_QUERY = """
+SELECT
+    p.ProductID,
+    p.ProductName,
+    p.Description,
+    p.BasePrice,
+    p.CategoryID,
+    p.IsActive,
+    c.CategoryName,
+    c.ParentCategoryID,
+    STRING_AGG(CAST(pv.MetalType AS NVARCHAR(MAX)), ', ') as AvailableMetals,
+    MIN(pv.AdditionalPrice) as MinAdditionalPrice,
+    MAX(pv.AdditionalPrice) as MaxAdditionalPrice,
+    SUM(pv.StockQuantity) as TotalStock,
+    (SELECT TOP 1 URL FROM ProductMedia
+     WHERE ProductID = p.ProductID AND IsMain = 1) as MainImageURL,
+    COUNT(DISTINCT r.ReviewID) as ReviewCount,
+    AVG(CAST(r.Rating AS FLOAT)) as AvgRating
+FROM Products p
+INNER JOIN Categories c ON p.CategoryID = c.CategoryID
+LEFT JOIN ProductVariants pv ON p.ProductID = pv.ProductID
+LEFT JOIN Reviews r ON p.ProductID = r.ProductID
+WHERE p.IsActive = 1
+GROUP BY
+    p.ProductID, p.ProductName, p.Description,
+    p.BasePrice, p.CategoryID, p.IsActive,
+    c.CategoryName, c.ParentCategoryID
+ORDER BY p.ProductID
+"""
+
+QUERIES = {
+    "legacy_join": LEGACY_PRODUCTS_QUERY,
+    "cte_preaggregated": ALL_PRODUCTS_QUERY
+}
+
+SHOWPLAN_NS = {"sp": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+
+
+def estimated_plan(conn, query: str) -> Dict:
+    """
+    Lấy estimated execution plan (SHOWPLAN_XML, query không thực sự chạy)
+
+    Returns:
+        {"estimated_cost", "estimated_rows", "max_intermediate_rows", "operators"}
+    """
+    cursor = conn.cursor()
+    cursor.execute("SET SHOWPLAN_XML ON")
+    try:
+        cursor.execute(query)
+        plan_xml = cursor.fetchone()[0]
+    finally:
+        cursor.execute("SET SHOWPLAN_XML OFF")
+
+    root = ET.fromstring(plan_xml)
+    statement = root.find(".//sp:StmtSimple", SHOWPLAN_NS)
+    operators = root.findall(".//sp:RelOp", SHOWPLAN_NS)
+
+    return {
+        "estimated_cost": float(statement.get("StatementSubTreeCost", 0)),
+        "estimated_rows": float(statement.get("StatementEstRows", 0)),
+        # Dòng trung gian lớn nhất trong plan: chỗ join fan-out lộ ra
+        "max_intermediate_rows": max((float(op.get("EstimateRows", 0)) for op in operators), default=0.0),
+        "operators": dict(Counter(op.get("PhysicalOp") for op in operators).most_common())
+    }
+
+
+def timed_runs(conn, query: str, repeats: int) -> Dict:
+    """
+    Chạy query + fetch toàn bộ, đo thời gian và logical reads (STATISTICS IO)
+
+    Returns:
+        {"rows", "p50_ms", "min_ms", "max_ms", "logical_reads", "result"}
+    """
+    cursor = conn.cursor()
+    durations, logical_reads, rows, columns = [], {}, [], []
+
+    for i in range(repeats):
+        cursor.execute("SET STATISTICS IO ON")
+        start = time.perf_counter()
+        cursor.execute(query)
+        rows = cursor.fetchall()
+        durations.append((time.perf_counter() - start) * 1000)
+        columns = [column[0] for column in cursor.description]
+
+        # STATISTICS IO message có thể đến trước hoặc sau result set
+        messages = list(getattr(cursor, "messages", None) or [])
+        while cursor.nextset():
+            pass
+        messages += list(getattr(cursor, "messages", None) or [])
+
+        if i == 0:
+            # "Table 'Reviews'. Scan count 1, logical reads 12, ..."
+            for _, message in messages:
+                match = re.search(r"Table '([^']+)'\. Scan count (\d+), logical reads (\d+)", message)
+                if match:
+                    table, scans, reads = match.group(1), int(match.group(2)), int(match.group(3))
+                    entry = logical_reads.setdefault(table, {"scans": 0, "logical_reads": 0})
+                    entry["scans"] += scans
+                    entry["logical_reads"] += reads
+        cursor.execute("SET STATISTICS IO OFF")
+
+    return {
+        "rows": len(rows),
+        "p50_ms": round(statistics.median(durations), 2),
+        "min_ms": round(min(durations), 2),
+        "max_ms": round(max(durations), 2),
+        "logical_reads": logical_reads,
+        "result": [dict(zip(columns, row)) for row in rows]
+    }
+
+
+def compare_results(legacy: List[Dict], current: List[Dict]) -> Dict[str, int]:
+    """
+    Đếm số sản phẩm khác nhau theo từng cột
+
+    Khác biệt mong đợi: AvailableMetals (query cũ lặp metal theo số review)
+    và TotalStock (query cũ cộng stock nhiều lần khi có review).
+    """
+    by_id = {p["ProductID"]: p for p in current}
+    diffs = Counter()
+
+    for product in legacy:
+        other = by_id.get(product["ProductID"])
+        if other is None:
+            diffs["missing"] += 1
+            continue
+        for column, value in product.items():
+            other_value = other.get(column)
+            if isinstance(value, float) and isinstance(other_value, float):
+                if abs(value - other_value) > 1e-9:
+                    diffs[column] += 1
+            elif value != other_value:
+                diffs[column] += 1
+
+    diffs["extra"] = len(set(by_id) - {p["ProductID"] for p in legacy})
+    return dict(diffs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the full-catalog product extraction query")
+    parser.add_argument("--connection", default=CONNECTION_STRING, help="SQL Server connection string")
+    parser.add_argument("--repeats", type=int, default=5, help="Số lần chạy mỗi query")
+    parser.add_argument("--output", help="Lưu kết quả ra file JSON")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📈 PRODUCT EXTRACTION QUERY BENCHMARK")
+    print("="*60 + "\n")
+
+    db = DatabaseConnector(args.connection)
+    if not db.connect():
+        print("❌ Failed to connect to database")
+        return False
+
+    results = {}
+    try:
+        for name, query in QUERIES.items():
+            print(f"🔍 {name}...")
+            plan = estimated_plan(db.conn, query)
+            runs = timed_runs(db.conn, query, args.repeats)
+            results[name] = {**plan, **runs}
+    finally:
+        db.disconnect()
+
+    diffs = compare_results(results["legacy_join"].pop("result"), results["cte_preaggregated"].pop("result"))
+
+    # ===== REPORT =====
+    print("\n" + "-"*92)
+    print(f"{'query':<20} {'rows':>7} {'est. cost':>10} {'max interm. rows':>17} {'reads':>9} {'p50 (ms)':>10} {'max (ms)':>10}")
+    print("-"*92)
+    for name, r in results.items():
+        reads = sum(t["logical_reads"] for t in r["logical_reads"].values())
+        print(
+            f"{name:<20} {r['rows']:>7} {r['estimated_cost']:>10.3f} {r['max_intermediate_rows']:>17,.0f} "
+            f"{reads:>9,} {r['p50_ms']:>10.1f} {r['max_ms']:>10.1f}"
+        )
+    print("-"*92)
+
+    for name, r in results.items():
+        print(f"\n{name} operators: {r['operators']}")
+        for table, io in r["logical_reads"].items():
+            print(f"   - {table}: scans={io['scans']}, logical reads={io['logical_reads']}")
+
+    print(f"\n🔎 Result differences (legacy vs CTE): {diffs or 'none'}")
+    print("   (AvailableMetals/TotalStock differ where the legacy join duplicated variant rows per review)\n")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"repeats": args.repeats, "results": results, "differences": diffs}, f, indent=2, default=str)
+        print(f"💾 Results saved to {args.output}")
+
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
@@ -0,0 +1,205 @@
+"""
+Benchmark FAISS index types
+So sánh recall@k (so với flat baseline) và latency p50/p99 của từng loại index
+
+Usage:
+    python benchmark_index.py                          # 100k synthetic vectors
+    python benchmark_index.py --n 500000 --k 10
+    python benchmark_index.py --from-index data/faiss_index
+    python benchmark_index.py --types flat,hnsw --nprobe 16 --ef-search 128
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import faiss
+import numpy as np
+
+from embeddings_manager import EmbeddingsManager, read_manifest
+
+
+def synthetic_vectors(n: int, dimension: int, n_clusters: int = 200, seed: int = 42) -> np.ndarray:
+    """
+    Tạo vector giả lập có cấu trúc cluster (giống embedding thật hơn random đều)
+
+    Args:
+        n: Số vector
+        dimension: Vector dimension
+        n_clusters: Số cụm (≈ nhóm sản phẩm tương tự)
+        seed: Random seed để kết quả lặp lại được
+
+    Returns:
+        Normalized float32 matrix (n, dimension)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, n_clusters, size=n)
+
+    vectors = np.empty((n, dimension), dtype='float32')
+    chunk = 100_000
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        noise = rng.normal(scale=0.6, size=(end - start, dimension)).astype('float32')
+        vectors[start:end] = centers[assignments[start:end]] + noise
+
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def load_vectors(filepath: str) -> np.ndarray:
+    """Lấy vectors từ index đã build (chỉ hỗ trợ index lưu đủ vector, vd. flat)"""
+    manifest = read_manifest(filepath)
+    index = faiss.downcast_index(faiss.read_index(manifest[".index"] if manifest else f"{filepath}.index"))
+    if isinstance(index, faiss.IndexIDMap2):
+        index = index.index  # id = ProductID → đọc theo vị trí từ base index
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, seed: int = 7) -> np.ndarray:
+    """Query = vector có sẵn + nhiễu nhỏ (giống user hỏi về sản phẩm có thật)"""
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=n_queries)
+    queries = vectors[picks] + rng.normal(scale=0.05, size=(n_queries, vectors.shape[1])).astype('float32')
+    queries = queries.astype('float32')
+    faiss.normalize_L2(queries)
+    return queries
+
+
+def recall_at_k(found: np.ndarray, ground_truth: np.ndarray) -> float:
+    """Tỉ lệ trung bình kết quả đúng (so với flat) trong top-k"""
+    k = ground_truth.shape[1]
+    hits = sum(
+        len(np.intersect1d(found[i][found[i] >= 0], ground_truth[i]))
+        for i in range(len(ground_truth))
+    )
+    return hits / (len(ground_truth) * k)
+
+
+def benchmark_type(index_type: str, vectors: np.ndarray, queries: np.ndarray, ground_truth: np.ndarray, args) -> dict:
+    """
+    Build 1 loại index và đo build time, recall@k, latency từng query
+
+    Returns:
+        Dictionary với kết quả benchmark
+    """
+    em = EmbeddingsManager(
+        index_type=index_type,
+        nlist=args.nlist,
+        nprobe=args.nprobe,
+        pq_m=args.pq_m,
+        hnsw_m=args.hnsw_m,
+        ef_search=args.ef_search
+    )
+    em.dimension = vectors.shape[1]
+
+    t0 = time.perf_counter()
+    index = em.create_index(vectors)
+    index.add(vectors)
+    em._apply_search_params(index)
+    build_time = time.perf_counter() - t0
+
+    # Batch search cho recall
+    _, found = index.search(queries, args.k)
+
+    # Single-query latency (giống 1 request /chat)
+    latencies = []
+    for i in range(len(queries)):
+        t = time.perf_counter()
+        index.search(queries[i:i + 1], args.k)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    return {
+        "index_type": index_type,
+        "build_time_s": round(build_time, 3),
+        f"recall@{args.k}": round(recall_at_k(found, ground_truth), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+        "qps_single_thread": round(1000 / float(np.mean(latencies)), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index types for the product catalog")
+    parser.add_argument("--n", type=int, default=100_000, help="Số synthetic vectors")
+    parser.add_argument("--from-index", help="Dùng vectors từ index đã build thay vì synthetic")
+    parser.add_argument("--queries", type=int, default=1000, help="Số query")
+    parser.add_argument("--k", type=int, default=10, help="top-k")
+    parser.add_argument("--types", default=",".join(EmbeddingsManager.INDEX_TYPES), help="Danh sách index type")
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--output", help="Lưu kết quả ra file JSON")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📈 FAISS INDEX BENCHMARK")
+    print("="*60 + "\n")
+
+    if args.from_index:
+        print(f"📂 Loading vectors from {args.from_index}...")
+        vectors = load_vectors(args.from_index)
+    else:
+        print(f"🎲 Generating {args.n:,} synthetic vectors...")
+        vectors = synthetic_vectors(args.n, 384)
+
+    queries = make_queries(vectors, args.queries)
+    k = min(args.k, len(vectors))
+    args.k = k
+
+    # Ground truth = exact search
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, k)
+
+    print(f"   - Vectors: {len(vectors):,} x {vectors.shape[1]}")
+    print(f"   - Queries: {len(queries):,}, k={k}\n")
+
+    results = []
+    for index_type in args.types.split(","):
+        index_type = index_type.strip()
+        print(f"🔨 {index_type}...")
+        result = benchmark_type(index_type, vectors, queries, ground_truth, args)
+        results.append(result)
+
+    # ===== REPORT =====
+    print("\n" + "-"*76)
+    print(f"{'type':<10} {'build (s)':>10} {f'recall@{k}':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'QPS (1 thread)':>16}")
+    print("-"*76)
+    for r in results:
+        print(
+            f"{r['index_type']:<10} {r['build_time_s']:>10.2f} {r[f'recall@{k}']:>10.4f} "
+            f"{r['p50_ms']:>10.3f} {r['p99_ms']:>10.3f} {r['qps_single_thread']:>16.1f}"
+        )
+    print("-"*76 + "\n")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                "n_vectors": len(vectors),
+                "n_queries": len(queries),
+                "k": k,
+                "params": {
+                    "nlist": args.nlist,
+                    "nprobe": args.nprobe,
+                    "pq_m": args.pq_m,
+                    "hnsw_m": args.hnsw_m,
+                    "ef_search": args.ef_search
+                },
+                "results": results
+            }, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
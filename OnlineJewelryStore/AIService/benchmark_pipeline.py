@@ -0,0 +1,322 @@
+"""
+Benchmark RAG pipeline stages trên synthetic catalog
+Đo create_product_text, encode (batch + 1 query), FAISS index.search và
+RAGService.search_products (có / không filter) cho catalog 1k / 100k / 1M sản phẩm
+
+Vector của catalog là synthetic (không encode 1M text) nên latency search đúng
+với kích thước catalog; encode được đo trên 1 mẫu text rồi ước lượng thời gian
+encode cả catalog. search_products dùng query vector đã cache sẵn, nên chỉ đo
+filter + FAISS + BM25 + fusion (encode query đo riêng).
+
+1M sản phẩm cần khoảng 4-5 GB RAM (product dicts + vectors + BM25).
+
+Usage:
+    python benchmark_pipeline.py                                  # 1k, 100k, 1M
+    python benchmark_pipeline.py --sizes 1000,100000 --queries 200
+    python benchmark_pipeline.py --index-type hnsw --output results/pipeline.json
+    python benchmark_pipeline.py --compare results/pipeline.json  # so với lần chạy trước
+"""
+
+import argparse
+import logging
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmark_index import make_queries, synthetic_vectors
+from benchmark_report import latency_summary, load_results, print_comparison, run_metadata, save_results
+from embeddings_manager import EmbeddingsManager
+from rag_service import RAGService
+
+CATEGORIES = ["Rings", "Wedding Rings", "Necklaces", "Earrings", "Bracelets", "Pendants", "Anklets", "Brooches"]
+METALS = ["18K Gold", "14K Gold", "White Gold", "Rose Gold", "Sterling Silver", "Platinum"]
+GEMSTONES = ["Diamond", "Ruby", "Sapphire", "Emerald", "Pearl", "Topaz", "Amethyst", "Moissanite"]
+STYLES = ["Classic", "Vintage", "Modern", "Minimalist", "Luxury", "Halo", "Solitaire", "Eternity"]
+OCCASIONS = ["engagement", "wedding", "anniversary", "birthday gift", "everyday wear", "evening party"]
+
+# Filter mỗi query: (tên, category?, tỉ lệ catalog trong khoảng giá)
+FILTER_CASES = [
+    ("none", False, None),
+    ("category", True, None),
+    ("price_20pct", False, 0.20),
+    ("category+price_2pct", True, 0.02)
+]
+
+
+def synthetic_catalog(n: int, seed: int = 42) -> List[Dict]:
+    """
+    Catalog giả lập cùng schema với DatabaseConnector.get_all_products
+
+    Args:
+        n: Số sản phẩm
+        seed: Random seed để kết quả lặp lại được
+
+    Returns:
+        List of product dictionaries
+    """
+    rng = np.random.default_rng(seed)
+    category = rng.integers(0, len(CATEGORIES), size=n)
+    style = rng.integers(0, len(STYLES), size=n)
+    gem = rng.integers(0, len(GEMSTONES), size=n)
+    occasion = rng.integers(0, len(OCCASIONS), size=n)
+    metals = rng.integers(0, len(METALS), size=(n, 2))
+    # Giá VND kiểu log-normal: đa số 3-30 triệu, vài món > 100 triệu
+    base_price = np.round(np.exp(rng.normal(16.2, 0.8, size=n)), -4)
+    extra = np.round(base_price * rng.uniform(0, 0.3, size=n), -4)
+    stock = rng.integers(0, 50, size=n)
+    reviews = rng.integers(0, 200, size=n)
+    rating = np.round(rng.uniform(3.0, 5.0, size=n), 2)
+
+    products = []
+    for i in range(n):
+        cat = CATEGORIES[category[i]]
+        name = f"{STYLES[style[i]]} {GEMSTONES[gem[i]]} {cat.rstrip('s')} #{i + 1}"
+        products.append({
+            "ProductID": i + 1,
+            "ProductName": name,
+            "Description": (
+                f"{STYLES[style[i]]} {cat.lower()} set with a {GEMSTONES[gem[i]].lower()}, "
+                f"handcrafted for {OCCASIONS[occasion[i]]}."
+            ),
+            "BasePrice": float(base_price[i]),
+            "CategoryID": int(category[i]) + 1,
+            "IsActive": True,
+            "CategoryName": cat,
+            "ParentCategoryID": None,
+            "AvailableMetals": ", ".join(dict.fromkeys(METALS[m] for m in metals[i])),
+            "MinAdditionalPrice": 0.0,
+            "MaxAdditionalPrice": float(extra[i]),
+            "MinPrice": float(base_price[i]),
+            "MaxPrice": float(base_price[i] + extra[i]),
+            "TotalStock": int(stock[i]),
+            "MainImageURL": f"/images/products/{i + 1}.jpg",
+            "ReviewCount": int(reviews[i]),
+            "AvgRating": float(rating[i]) if reviews[i] else None
+        })
+    return products
+
+
+def synthetic_queries(n: int, seed: int = 7) -> List[str]:
+    """Câu hỏi kiểu khách hàng, không trùng nhau (query cache không che latency)"""
+    rng = np.random.default_rng(seed)
+    return [
+        f"{STYLES[rng.integers(len(STYLES))].lower()} {GEMSTONES[rng.integers(len(GEMSTONES))].lower()} "
+        f"{CATEGORIES[rng.integers(len(CATEGORIES))].lower()} in {METALS[rng.integers(len(METALS))].lower()} "
+        f"for {OCCASIONS[rng.integers(len(OCCASIONS))]} #{i}"
+        for i in range(n)
+    ]
+
+
+def timed(fn, items) -> List[float]:
+    """Latency (ms) của fn(item) cho từng item"""
+    latencies = []
+    for item in items:
+        t = time.perf_counter()
+        fn(item)
+        latencies.append((time.perf_counter() - t) * 1000)
+    return latencies
+
+
+def benchmark_encode(em: EmbeddingsManager, texts: List[str], queries: List[str]) -> Dict:
+    """Throughput encode batch (build/rebuild) và latency encode 1 query (/chat)"""
+    em.model.encode(texts[:8], convert_to_numpy=True)  # warm-up, không tính giờ
+
+    start = time.perf_counter()
+    em.model.encode(texts, convert_to_numpy=True)
+    batch_s = time.perf_counter() - start
+
+    query_latencies = timed(lambda q: em._encode_normalized([q]), queries)
+    return {
+        "backend": em.encoder_backend,
+        "batch_texts": len(texts),
+        "batch_s": round(batch_s, 3),
+        "texts_per_s": round(len(texts) / batch_s, 1),
+        "query": latency_summary(query_latencies)
+    }
+
+
+def filter_args(sorted_prices: np.ndarray, with_category: bool, price_fraction: Optional[float],
+                rng: np.random.Generator) -> Dict:
+    """category/min_price/max_price ngẫu nhiên cho 1 query theo filter case"""
+    kwargs = {}
+    if with_category:
+        kwargs["category"] = CATEGORIES[rng.integers(len(CATEGORIES))]
+    if price_fraction is not None:
+        lo = rng.uniform(0, 1 - price_fraction)
+        kwargs["min_price"] = float(np.quantile(sorted_prices, lo))
+        kwargs["max_price"] = float(np.quantile(sorted_prices, lo + price_fraction))
+    return kwargs
+
+
+def benchmark_size(n: int, em: EmbeddingsManager, rag: RAGService, queries: List[str], encode_stats: Dict, args) -> Dict:
+    """Tất cả stage cho 1 kích thước catalog"""
+    print(f"\n🎲 Catalog: {n:,} products")
+    products = synthetic_catalog(n)
+
+    # create_product_text (chạy cho mọi sản phẩm mỗi lần build/sync)
+    start = time.perf_counter()
+    texts = [em.create_product_text(p) for p in products]
+    text_s = time.perf_counter() - start
+    print(f"   - create_product_text: {n / text_s:,.0f} products/s")
+
+    # Index + snapshot (filter lookups, BM25) như sau 1 lần build
+    vectors = synthetic_vectors(n, em.dimension)
+    ids = np.array([p["ProductID"] for p in products], dtype='int64')
+    start = time.perf_counter()
+    index = em._index_from_pending([(vectors, ids)])
+    index_build_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    product_data = {p["ProductID"]: p for p in products}
+    em._publish(index, product_data, content_hashes={}, lexical=em._build_lexical(product_data, texts))
+    publish_s = time.perf_counter() - start
+    print(f"   - FAISS {args.index_type} build: {index_build_s:.2f}s, snapshot (filters + BM25): {publish_s:.2f}s")
+
+    # Query vector gần sản phẩm có thật, đặt sẵn vào query cache
+    query_vectors = make_queries(vectors, len(queries))
+    for query, vector in zip(queries, query_vectors):
+        cached = vector[np.newaxis, :].copy()
+        cached.flags.writeable = False
+        em.query_cache.put(em.normalize_query(query), cached)
+
+    # FAISS index.search, 1 query / lần như 1 request /chat
+    raw_latencies = timed(lambda v: em.index.search(v[np.newaxis, :], args.k), query_vectors)
+
+    # search_products theo từng filter case
+    rng = np.random.default_rng(123)
+    sorted_prices = np.sort([p["MinPrice"] for p in products])
+    search_results = {}
+    for case, with_category, price_fraction in FILTER_CASES:
+        calls = [(q, filter_args(sorted_prices, with_category, price_fraction, rng)) for q in queries]
+
+        candidates = [em.candidate_positions(**kw) for _, kw in calls]
+        selectivity = float(np.mean([1.0 if c is None else len(c) / n for c in candidates]))
+
+        found = []
+        latencies = timed(lambda call: found.append(len(rag.search_products(call[0], top_k=args.k, **call[1]))), calls)
+        search_results[case] = {
+            **latency_summary(latencies),
+            "selectivity": round(selectivity, 5),
+            "avg_results": round(float(np.mean(found)), 2)
+        }
+
+    result = {
+        "products": n,
+        "create_product_text": {
+            "total_s": round(text_s, 3),
+            "products_per_s": round(n / text_s, 1),
+            "us_per_product": round(text_s / n * 1e6, 3)
+        },
+        "encode_catalog_estimate_s": round(n / encode_stats["texts_per_s"], 1),
+        "index_build_s": round(index_build_s, 3),
+        "snapshot_publish_s": round(publish_s, 3),
+        "index_search": latency_summary(raw_latencies),
+        "search_products": search_results
+    }
+    return result
+
+
+def report(results: Dict):
+    encode = results["encode"]
+    print("\n" + "-"*96)
+    print(f"encode ({encode['backend']}): {encode['texts_per_s']:,.0f} texts/s batch, "
+          f"query p50 {encode['query']['p50_ms']:.2f}ms / p95 {encode['query']['p95_ms']:.2f}ms")
+    print("-"*96)
+    print(f"{'products':>10} {'stage':<38} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'selectivity':>12}")
+    print("-"*96)
+    for size in results["sizes"]:
+        n = size["products"]
+        print(f"{n:>10,} {'create_product_text (µs/product)':<38} {size['create_product_text']['us_per_product']:>10.2f}")
+        print(f"{n:>10,} {'encode whole catalog (est. s)':<38} {size['encode_catalog_estimate_s']:>10.1f}")
+        s = size["index_search"]
+        print(f"{n:>10,} {'index.search':<38} {s['p50_ms']:>10.3f} {s['p95_ms']:>10.3f} {s['p99_ms']:>10.3f}")
+        for case, s in size["search_products"].items():
+            label = f"search_products [{case}]"
+            print(f"{n:>10,} {label:<38} {s['p50_ms']:>10.3f} {s['p95_ms']:>10.3f} {s['p99_ms']:>10.3f} {s['selectivity']:>12.4f}")
+    print("-"*96 + "\n")
+
+
+def comparison_rows(results: Dict) -> Dict[str, Dict]:
+    """label → latency row, để so sánh 2 file kết quả"""
+    rows = {"encode query": results["encode"]["query"]}
+    for size in results["sizes"]:
+        n = size["products"]
+        rows[f"{n} index.search"] = size["index_search"]
+        for case, s in size["search_products"].items():
+            rows[f"{n} search_products[{case}]"] = s
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the RAG pipeline on synthetic catalogs")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Kích thước catalog, cách nhau bởi dấu phẩy")
+    parser.add_argument("--queries", type=int, default=500, help="Số query mỗi stage")
+    parser.add_argument("--k", type=int, default=5, help="top-k")
+    parser.add_argument("--encode-sample", type=int, default=1024, help="Số text để đo throughput encode batch")
+    parser.add_argument("--index-type", default="flat", choices=EmbeddingsManager.INDEX_TYPES)
+    parser.add_argument("--encoder-backend", default="torch", help="torch | onnx | onnx_int8")
+    parser.add_argument("--no-hybrid", dest="hybrid", action="store_false", help="Tắt BM25 + fusion trong search_products")
+    parser.add_argument("--output", help="Lưu kết quả ra file JSON")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    # Log INFO mỗi lần search làm sai số đo
+    logging.disable(logging.INFO)
+
+    print("\n" + "="*60)
+    print("📈 RAG PIPELINE MICRO-BENCHMARK")
+    print("="*60 + "\n")
+
+    em = EmbeddingsManager(
+        index_type=args.index_type,
+        micro_batching=False,
+        query_cache_size=args.queries,
+        encoder_backend=args.encoder_backend
+    )
+    print("🤖 Loading embedding model...")
+    if not em.load_model():
+        print("❌ Failed to load embedding model")
+        return False
+
+    rag = RAGService(em, response_cache_size=0, hybrid_search=args.hybrid)
+    queries = synthetic_queries(args.queries)
+
+    print(f"⏱️  Encoding {args.encode_sample} product texts + {len(queries)} queries...")
+    sample_texts = [em.create_product_text(p) for p in synthetic_catalog(args.encode_sample, seed=1)]
+    encode_stats = benchmark_encode(em, sample_texts, queries)
+
+    results = {
+        **run_metadata(args),
+        "encode": encode_stats,
+        "sizes": []
+    }
+    try:
+        for size in (int(s) for s in args.sizes.split(",")):
+            results["sizes"].append(benchmark_size(size, em, rag, queries, encode_stats, args))
+    finally:
+        rag.close()
+
+    report(results)
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print_comparison(
+            comparison_rows(results), args.compare, comparison_rows(baseline),
+            metrics=["p50_ms", "p95_ms", "p99_ms"], baseline_commit=baseline.get("commit")
+        )
+
+    if args.output:
+        save_results(args.output, results)
+
+    return True
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n⚠️  Benchmark interrupted by user")
+        sys.exit(1)
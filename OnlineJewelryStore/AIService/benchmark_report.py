@@ -0,0 +1,113 @@
+"""
+Benchmark Report - helpers dùng chung cho benchmark_pipeline.py và load_test.py
+Percentiles, metadata của lần chạy (commit, máy) và so sánh với file JSON
+của lần chạy trước để thấy thay đổi giữa các commit.
+"""
+
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def latency_summary(samples_ms: Sequence[float]) -> Dict:
+    """p50/p95/p99/mean/max (ms) của 1 list latency"""
+    if not len(samples_ms):
+        return {"count": 0, "p50_ms": None, "p95_ms": None, "p99_ms": None, "mean_ms": None, "max_ms": None}
+
+    samples = np.asarray(samples_ms, dtype='float64')
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {
+        "count": int(len(samples)),
+        "p50_ms": round(float(p50), 4),
+        "p95_ms": round(float(p95), 4),
+        "p99_ms": round(float(p99), 4),
+        "mean_ms": round(float(samples.mean()), 4),
+        "max_ms": round(float(samples.max()), 4)
+    }
+
+
+def git_commit() -> Optional[str]:
+    """Commit hiện tại của repo (None nếu không phải git checkout)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5
+        )
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+    if commit.returncode != 0:
+        return None
+    return commit.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+
+def run_metadata(args) -> Dict:
+    """Thông tin để biết 2 file kết quả có so sánh được không"""
+    return {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+    }
+
+
+def save_results(path: str, results: Dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False, default=str)
+    print(f"💾 Results saved to {path}")
+
+
+def print_comparison(
+    current: Dict[str, Dict],
+    baseline_path: str,
+    baseline_rows: Dict[str, Dict],
+    metrics: List[str],
+    baseline_commit: Optional[str] = None
+):
+    """
+    In % thay đổi của từng metric so với lần chạy trước (cùng label)
+
+    Args:
+        current: label → row của lần chạy này
+        baseline_path: File JSON của lần chạy trước (để in ra)
+        baseline_rows: label → row của lần chạy trước
+        metrics: Các key cần so (vd. "p95_ms", "throughput_rps")
+        baseline_commit: Commit của lần chạy trước
+    """
+    print(f"\n📊 Compared with {baseline_path} (commit {baseline_commit or '?'}):")
+    print("-"*92)
+    print(f"{'row':<36} {'metric':<16} {'before':>12} {'after':>12} {'change':>10}")
+    print("-"*92)
+    for label, row in current.items():
+        before = baseline_rows.get(label)
+        if not before:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), row.get(metric)
+            if old is None or new is None:
+                continue
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{label:<36} {metric:<16} {old:>12.3f} {new:>12.3f} {change:>10}")
+    print("-"*92 + "\n")
+
+
+def load_results(path: str) -> Dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,295 @@
+"""
+BM25 Index - lexical search trên cùng text với embeddings (create_product_text)
+Bắt các query chứa tên sản phẩm / thuật ngữ chính xác ("Rose Gold", "18K")
+mà MiniLM vector match kém
+
+Postings lưu dạng CSR (indptr + doc array + weight array), BM25 weight được
+tính sẵn lúc build nên 1 query chỉ là vài slice + cộng numpy.
+
+Term frequency + độ dài doc cũng được giữ lại: change feed thêm sản phẩm vào 1
+index delta nhỏ (chấm điểm theo thống kê của index chính), rồi merged() gộp
+2 index bằng numpy mà không phải tokenize lại cả catalog.
+"""
+
+import re
+from array import array
+import unicodedata
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Inverted BM25 index keyed by ProductID
+
+        Args:
+            k1: Term-frequency saturation
+            b: Length normalization (0 = không chuẩn hóa theo độ dài)
+        """
+        self.k1 = k1
+        self.b = b
+
+        self.vocabulary = {}                            # term → term id
+        self.doc_ids = np.empty(0, dtype='int64')       # ProductIDs, sorted
+        self.indptr = np.zeros(1, dtype='int64')        # term id → [start, end) trong postings
+        self.postings = np.empty(0, dtype='int32')      # doc position
+        self.weights = np.empty(0, dtype='float32')     # BM25 weight (idf * tf-norm)
+        self.tfs = np.empty(0, dtype='int32')           # term frequency
+        self.doc_lengths = np.empty(0, dtype='int32')   # số token mỗi doc
+        self.avg_length = 0.0
+
+        # Trạng thái build dở (add_document → finalize)
+        self._term_docs = {}  # term → (array ProductID, array tf)
+        self._doc_lengths = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """
+        Lowercase, bỏ dấu tiếng Việt, tách theo ký tự chữ/số
+
+        "Nhẫn Vàng 18K" và "nhan vang 18k" cho cùng tokens.
+        """
+        text = unicodedata.normalize('NFD', text.casefold())
+        text = "".join(ch for ch in text if not unicodedata.combining(ch)).replace('đ', 'd')
+        return _TOKEN_RE.findall(text)
+
+    def add_document(self, product_id: int, text: str):
+        """
+        Thêm 1 document (streaming build); gọi finalize() sau document cuối
+
+        Only token counts are kept (compact arrays), not the text itself.
+        """
+        tokens = self.tokenize(text)
+        self._doc_lengths[product_id] = len(tokens)
+        for term, tf in Counter(tokens).items():
+            pids, tfs = self._term_docs.get(term) or self._term_docs.setdefault(term, (array('q'), array('i')))
+            pids.append(product_id)
+            tfs.append(tf)
+
+    def build(self, product_ids: Iterable[int], texts: Iterable[str]) -> "BM25Index":
+        """
+        Build index từ (ProductID, text)
+
+        Args:
+            product_ids: ProductIDs
+            texts: Text tương ứng (create_product_text)
+
+        Returns:
+            self
+        """
+        for product_id, text in zip(product_ids, texts):
+            self.add_document(product_id, text)
+        return self.finalize()
+
+    def finalize(self, corpus: Optional["BM25Index"] = None) -> "BM25Index":
+        """
+        Chuyển các document đã add thành CSR postings + BM25 weights
+
+        Args:
+            corpus: Index chính khi đây là index delta - idf và độ dài trung bình
+                    tính trên corpus + delta để điểm 2 index so sánh được
+        """
+        term_docs, lengths = self._term_docs, self._doc_lengths
+        self._term_docs, self._doc_lengths = {}, {}
+
+        self.doc_ids = np.array(sorted(lengths), dtype='int64')
+        self.doc_lengths = np.array([lengths[pid] for pid in self.doc_ids], dtype='int32')
+
+        terms = sorted(term_docs)
+        self.vocabulary = {term: i for i, term in enumerate(terms)}
+        sizes = np.array([len(term_docs[t][0]) for t in terms], dtype='int64')
+        self.indptr = np.concatenate([[0], np.cumsum(sizes)]).astype('int64')
+
+        self.postings = np.empty(int(self.indptr[-1]), dtype='int32')
+        self.tfs = np.empty(int(self.indptr[-1]), dtype='int32')
+        for i, term in enumerate(terms):
+            pids, freqs = term_docs.pop(term)
+            # ProductID → vị trí doc (doc_ids đã sort)
+            self.postings[self.indptr[i]:self.indptr[i + 1]] = np.searchsorted(self.doc_ids, np.frombuffer(pids, dtype='int64'))
+            self.tfs[self.indptr[i]:self.indptr[i + 1]] = np.frombuffer(freqs, dtype='int32')
+
+        n_docs, doc_freqs = len(self.doc_ids), sizes
+        total_length = float(self.doc_lengths.sum())
+        if corpus is not None and len(corpus):
+            n_docs += len(corpus)
+            doc_freqs = sizes + np.array([corpus.document_frequency(t) for t in terms], dtype='int64')
+            if corpus.avg_length:
+                total_length += corpus.avg_length * len(corpus)
+
+        self.avg_length = total_length / n_docs if n_docs else 0.0
+        self._compute_weights(sizes, doc_freqs, n_docs)
+
+        if corpus is None:
+            logger.info(f"✅ BM25 index built: {len(self.doc_ids)} docs, {len(terms)} terms, {len(self.postings)} postings")
+        return self
+
+    def _compute_weights(self, sizes: np.ndarray, doc_freqs: np.ndarray, n_docs: int):
+        """Precompute BM25 weight cho từng posting (sizes = số posting của mỗi term)"""
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype('float32')
+        tfs = self.tfs.astype('float32')
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[self.postings] / max(self.avg_length, 1e-9))
+        self.weights = (np.repeat(idf, sizes) * tfs * (self.k1 + 1) / (tfs + norm)).astype('float32')
+
+    def document_frequency(self, term: str) -> int:
+        term_id = self.vocabulary.get(term)
+        return 0 if term_id is None else int(self.indptr[term_id + 1] - self.indptr[term_id])
+
+    def merged(self, removed_ids: np.ndarray, delta: Optional["BM25Index"] = None) -> "BM25Index":
+        """
+        Index mới = index này bỏ removed_ids + các doc của delta, không tokenize lại
+
+        Postings của 2 index được nối rồi sắp lại theo (term, doc) bằng numpy;
+        weights tính lại trên corpus mới.
+
+        Args:
+            removed_ids: ProductIDs cần bỏ (đã xóa hoặc có text mới trong delta)
+            delta: Index delta (None = chỉ xóa)
+        """
+        parts = [(self, ~np.isin(self.doc_ids, removed_ids))]
+        if delta is not None:
+            parts.append((delta, np.ones(len(delta.doc_ids), dtype='bool')))
+
+        terms = sorted(set().union(*(index.vocabulary for index, _ in parts)))
+        vocabulary = {term: i for i, term in enumerate(terms)}
+
+        term_ids, pids, tfs, doc_pids, doc_lengths = [], [], [], [], []
+        for index, keep_doc in parts:
+            # Term id (theo vocabulary mới) của từng posting
+            remap = np.empty(len(index.vocabulary), dtype='int64')
+            for term, i in index.vocabulary.items():
+                remap[i] = vocabulary[term]
+            posting_terms = np.repeat(remap, np.diff(index.indptr))
+
+            keep = keep_doc[index.postings]
+            term_ids.append(posting_terms[keep])
+            pids.append(index.doc_ids[index.postings[keep]])
+            tfs.append(index.tfs[keep])
+            doc_pids.append(index.doc_ids[keep_doc])
+            doc_lengths.append(index.doc_lengths[keep_doc])
+
+        merged = BM25Index(k1=self.k1, b=self.b)
+        doc_pids = np.concatenate(doc_pids)
+        order = np.argsort(doc_pids, kind='stable')
+        merged.doc_ids = doc_pids[order]
+        merged.doc_lengths = np.concatenate(doc_lengths)[order]
+        merged.avg_length = float(merged.doc_lengths.mean()) if len(order) else 0.0
+
+        term_ids, tfs = np.concatenate(term_ids), np.concatenate(tfs)
+        sizes = np.bincount(term_ids, minlength=len(terms)).astype('int64')
+
+        # Bỏ term chỉ còn ở doc đã xóa (vocabulary không phình ra sau mỗi compaction)
+        live = sizes > 0
+        if not live.all():
+            term_ids = (np.cumsum(live) - 1)[term_ids]
+            terms = [term for term, keep in zip(terms, live) if keep]
+            vocabulary = {term: i for i, term in enumerate(terms)}
+            sizes = sizes[live]
+
+        postings = np.searchsorted(merged.doc_ids, np.concatenate(pids))
+        order = np.lexsort((postings, term_ids))
+        merged.postings = postings[order].astype('int32')
+        merged.tfs = tfs[order]
+        merged.vocabulary = vocabulary
+
+        merged.indptr = np.concatenate([[0], np.cumsum(sizes)]).astype('int64')
+        merged._compute_weights(sizes, sizes, len(merged.doc_ids))
+        return merged
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        allowed_ids: Optional[np.ndarray] = None,
+        excluded_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Lexical search
+
+        Args:
+            query: User query
+            top_k: Số kết quả
+            allowed_ids: Chỉ trả về các ProductID này (filter), None = tất cả
+            excluded_ids: Bỏ các ProductID này (doc đã cũ, bản mới nằm ở index delta)
+
+        Returns:
+            List of (ProductID, bm25_score), score giảm dần
+        """
+        scores = np.zeros(len(self.doc_ids), dtype='float32')
+        matched = False
+
+        for term in set(self.tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            # Mỗi doc xuất hiện tối đa 1 lần trong 1 posting list → += an toàn
+            scores[self.postings[start:end]] += self.weights[start:end]
+            matched = True
+
+        if not matched:
+            return []
+
+        if allowed_ids is not None:
+            mask = np.zeros(len(self.doc_ids), dtype='bool')
+            mask[self._positions(allowed_ids)] = True
+            scores[~mask] = 0
+        if excluded_ids is not None and len(excluded_ids):
+            scores[self._positions(excluded_ids)] = 0
+
+        hits = np.flatnonzero(scores > 0)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+
+        return [(int(self.doc_ids[doc]), float(scores[doc])) for doc in hits]
+
+    def _positions(self, product_ids: np.ndarray) -> np.ndarray:
+        """Vị trí doc của các ProductID có trong index (bỏ qua ID không có)"""
+        positions = np.searchsorted(self.doc_ids, product_ids)
+        positions = positions[positions < len(self.doc_ids)]
+        return positions[np.isin(self.doc_ids[positions], product_ids)]
+
+    # ===== PERSISTENCE =====
+
+    def save(self, filepath: str):
+        """Lưu ra .npz (vocabulary lưu theo thứ tự term id)"""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(filepath, 'wb') as f:
+            np.savez(
+                f,
+                params=np.array([self.k1, self.b, self.avg_length], dtype='float64'),
+                terms=np.array(terms, dtype=str),
+                doc_ids=self.doc_ids,
+                indptr=self.indptr,
+                postings=self.postings,
+                weights=self.weights,
+                tfs=self.tfs,
+                doc_lengths=self.doc_lengths
+            )
+
+    @classmethod
+    def load(cls, filepath: str) -> "BM25Index":
+        with np.load(filepath) as data:
+            params = data["params"]
+            index = cls(k1=float(params[0]), b=float(params[1]))
+            index.avg_length = float(params[2])
+            index.vocabulary = {str(term): i for i, term in enumerate(data["terms"])}
+            index.doc_ids = data["doc_ids"]
+            index.indptr = data["indptr"]
+            index.postings = data["postings"]
+            index.weights = data["weights"]
+            index.tfs = data["tfs"]
+            index.doc_lengths = data["doc_lengths"]
+        return index
@@ -1,7 +1,7 @@
 import os
 import sys
 from db_connector import DatabaseConnector
-from embeddings_manager import EmbeddingsManager
+from embeddings_manager import GENERATION_FILES, EmbeddingsManager, read_manifest
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -17,6 +17,9 @@ def main():
     # Tạo thư mục data nếu chưa có
     os.makedirs("data", exist_ok=True)
     INDEX_PATH = "data/faiss_index"
+    FETCH_SIZE = 1000  # Số dòng mỗi lần fetchmany
+    CHUNK_SIZE = 1024  # Số sản phẩm encode + add vào index mỗi lượt
+    ENCODE_WORKERS = max(1, (os.cpu_count() or 1) // 2)  # Số process encode song song (1 = tắt)
     
     print("\n" + "="*60)
     print("🚀 BUILDING FAISS INDEX FOR JEWELRY STORE")
@@ -30,52 +33,58 @@ def main():
         logger.error("❌ Failed to connect to database. Please check connection string.")
         return False
     
-    # ===== STEP 2: Load Products =====
-    print("📦 Step 2: Loading products from database...")
-    products = db.get_all_products()
-    db.disconnect()
-    
-    if not products:
-        logger.error("❌ No products found in database")
-        return False
-    
-    print(f"✅ Loaded {len(products)} products")
-    
-    # Display sample
-    if products:
-        sample = products[0]
-        print(f"\n📋 Sample product:")
-        print(f"   - Name: {sample['ProductName']}")
-        print(f"   - Category: {sample.get('CategoryName', 'N/A')}")
-        print(f"   - Price: {sample.get('BasePrice', 0):,.0f} VND")
-    
-    # ===== STEP 3: Load Embedding Model =====
-    print("\n🤖 Step 3: Loading sentence transformer model...")
+    # ===== STEP 2: Load Embedding Model =====
+    print("\n🤖 Step 2: Loading sentence transformer model...")
     print("   (This may take a few minutes on first run)")
     
-    em = EmbeddingsManager()
+    em = EmbeddingsManager(encode_chunk_size=CHUNK_SIZE, encode_workers=ENCODE_WORKERS)
     if not em.load_model():
         logger.error("❌ Failed to load embedding model")
+        db.disconnect()
         return False
     
-    # ===== STEP 4: Build FAISS Index =====
-    print("\n🔨 Step 4: Building FAISS index...")
-    print("   - Generating embeddings for all products")
-    print("   - Creating vector index")
+    # ===== STEP 3: Stream Products → Build FAISS Index =====
+    print("\n🔨 Step 3: Streaming products and building FAISS index...")
+    print(f"   - Fetching {FETCH_SIZE} rows per batch from the database")
+    print(f"   - Encoding and indexing {CHUNK_SIZE} products per chunk")
+    print(f"   - Encoding on {ENCODE_WORKERS} worker process(es)")
     
-    if not em.build_index(products):
-        logger.error("❌ Failed to build index")
+    try:
+        built = em.build_index(db.iter_products(batch_size=FETCH_SIZE))
+    finally:
+        db.disconnect()
+    
+    if not built:
+        logger.error("❌ Failed to build index (no products or database error)")
         return False
     
-    # ===== STEP 5: Save Index =====
-    print(f"\n💾 Step 5: Saving index to {INDEX_PATH}...")
+    products = em.product_data
+    stats = em.last_build_stats
+    print(f"✅ Indexed {len(products)} products")
+    print(f"\n⏱️  Timing:")
+    print(f"   - Total build: {stats['total_s']:.1f}s, encoding: {stats['encode_s']:.1f}s")
+    print(f"   - Throughput: {stats['texts_per_s'] or 0:,.0f} texts/s on {stats['workers']} worker(s)")
+    if 'speedup' in stats:
+        print(f"   - Worker startup (model load): {stats['pool_startup_s']:.1f}s")
+        print(f"   - Single-process baseline: {stats['baseline_texts_per_s']:,.0f} texts/s")
+        print(f"   - Speedup: {stats['speedup']:.2f}x ({stats['speedup_per_worker']:.2f}x per worker, {stats['threads_per_worker']} thread(s) each)")
+    
+    # Display sample
+    sample = next(iter(products.values()))
+    print(f"\n📋 Sample product:")
+    print(f"   - Name: {sample['ProductName']}")
+    print(f"   - Category: {sample.get('CategoryName', 'N/A')}")
+    print(f"   - Price: {sample.get('BasePrice', 0):,.0f} VND")
+    
+    # ===== STEP 4: Save Index =====
+    print(f"\n💾 Step 4: Saving index to {INDEX_PATH}...")
     
     if not em.save_index(INDEX_PATH):
         logger.error("❌ Failed to save index")
         return False
     
-    # ===== STEP 6: Test Search =====
-    print("\n🔍 Step 6: Testing search functionality...")
+    # ===== STEP 5: Test Search =====
+    print("\n🔍 Step 5: Testing search functionality...")
     
     test_queries = [
         "gold ring",
@@ -99,8 +108,11 @@ def main():
     print("✅ INDEX BUILD COMPLETED SUCCESSFULLY!")
     print("="*60)
     print(f"\n📁 Files created:")
-    print(f"   - {INDEX_PATH}.index")
-    print(f"   - {INDEX_PATH}.pkl")
+    manifest = read_manifest(INDEX_PATH)
+    print(f"   - {INDEX_PATH}.manifest")
+    for ext in GENERATION_FILES:
+        if manifest[ext]:
+            print(f"   - {manifest[ext]}")
     print(f"\n📊 Statistics:")
     print(f"   - Total products indexed: {len(products)}")
     print(f"   - Vector dimension: {em.dimension}")
@@ -0,0 +1,207 @@
+"""
+Caches - in-process caches dùng chung cho AI service
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class LRUCache:
+    def __init__(self, max_entries: int = 1024):
+        """
+        Thread-safe LRU cache với hit/miss counters
+        
+        Args:
+            max_entries: Số entry tối đa, entry ít dùng nhất bị loại trước.
+                         0 = tắt cache
+        """
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Lookup a key and mark it as most recently used
+        
+        Returns:
+            Cached value hoặc None nếu không có
+        """
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value: Any):
+        """Insert/update a key, evicting the least recently used entry if full"""
+        if self.max_entries <= 0:
+            return
+        
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+    
+    def clear(self):
+        """Drop all entries (counters are kept)"""
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters cho /health"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.95
+    ):
+        """
+        Cache câu trả lời RAG theo độ tương đồng của query vector
+        
+        Một lookup trả về response đã lưu nếu có entry cùng filter key
+        (category, giá, index version, live stats generation...) và cosine
+        similarity giữa hai query vector >= similarity_threshold. Index hoặc
+        giá đổi → key mới, entry cũ hết hạn theo TTL / LRU.
+        
+        Args:
+            max_entries: Số response tối đa (LRU eviction). 0 = tắt cache
+            ttl_seconds: Thời gian sống của mỗi entry
+            similarity_threshold: Cosine similarity tối thiểu để coi là cùng câu hỏi
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        
+        # entry_id -> (filter_key, vector, response, created_at), theo thứ tự tạo
+        # → entry hết hạn luôn ở đầu
+        self._entries = OrderedDict()
+        # entry_id theo thứ tự dùng gần nhất (LRU eviction)
+        self._lru = OrderedDict()
+        # filter_key -> set of entry_ids (chỉ so sánh vector trong cùng filter)
+        self._by_key = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    def lookup(self, vector: np.ndarray, filter_key: Hashable) -> Optional[Dict]:
+        """
+        Find a cached response for a semantically equivalent query
+        
+        Args:
+            vector: L2-normalized query vector, shape (dimension,)
+            filter_key: Hashable key of everything else the answer depends on
+            
+        Returns:
+            Cached response hoặc None
+        """
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            self._evict_expired()
+            
+            entry_ids = list(self._by_key.get(filter_key, ()))
+            if not entry_ids:
+                self.misses += 1
+                return None
+            
+            # Vectors đã normalize → dot product = cosine similarity
+            matrix = np.vstack([self._entries[eid][1] for eid in entry_ids])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            
+            if scores[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+            
+            entry_id = entry_ids[best]
+            self._lru.move_to_end(entry_id)
+            self.hits += 1
+            return self._entries[entry_id][2]
+    
+    def store(self, vector: np.ndarray, filter_key: Hashable, response: Dict):
+        """Save a response, evicting the least recently used entries if full"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = (filter_key, np.array(vector, dtype='float32'), response, time.monotonic())
+            self._lru[entry_id] = None
+            self._by_key.setdefault(filter_key, set()).add(entry_id)
+            
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._lru)))
+    
+    def clear(self):
+        """Invalidate everything"""
+        with self._lock:
+            self._entries.clear()
+            self._lru.clear()
+            self._by_key.clear()
+    
+    def _remove(self, entry_id: int):
+        filter_key = self._entries.pop(entry_id)[0]
+        del self._lru[entry_id]
+        ids = self._by_key.get(filter_key)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_key[filter_key]
+    
+    def _evict_expired(self):
+        """Entry tạo trước luôn hết hạn trước → chỉ xét từ đầu dict"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry[3] >= cutoff:
+                return
+            self._remove(entry_id)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def stats(self) -> Dict:
+        """Hit/miss counters cho /health"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,354 @@
+"""
+Catalog Store - columnar, memory-mapped product catalog
+Thay cho pickle list[dict]: cột số là NumPy array, cột chuỗi là blob + offsets,
+tất cả nằm trong 1 file và được mmap read-only khi load
+
+File layout:
+    MAGIC (8 bytes) | header length (uint64) | header JSON | sections (64-byte aligned)
+
+Rows are sorted by ProductID so lookups are a binary search, and a product
+dict is only materialized when a caller asks for it (top-k search hits).
+Several uvicorn workers mapping the same file share its page-cache pages.
+"""
+
+import json
+import math
+import mmap
+import os
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAGIC = b"JCATLG01"
+ALIGNMENT = 64
+
+# Cột số: tên → dtype. Cột nullable lưu float64, NULL = NaN
+INT_COLUMNS = ("ProductID", "CategoryID", "ReviewCount")
+NULLABLE_INT_COLUMNS = ("ParentCategoryID", "TotalStock")
+FLOAT_COLUMNS = (
+    "BasePrice", "MinPrice", "MaxPrice",
+    "MinAdditionalPrice", "MaxAdditionalPrice", "AvgRating"
+)
+BOOL_COLUMNS = ("IsActive",)
+STRING_COLUMNS = (
+    "ProductName", "Description", "CategoryName",
+    "AvailableMetals", "MainImageURL"
+)
+# Field ngoài schema (nếu có) được lưu dạng JSON trong cột này
+EXTRA_COLUMN = "_extra"
+HASH_COLUMN = "_content_hash"
+
+KNOWN_FIELDS = set(INT_COLUMNS + NULLABLE_INT_COLUMNS + FLOAT_COLUMNS + BOOL_COLUMNS + STRING_COLUMNS)
+
+
+def _to_float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _encode_strings(values: List[Optional[str]]):
+    """List chuỗi → (offsets int64 (n+1), null mask, utf-8 blob)"""
+    offsets = np.zeros(len(values) + 1, dtype='int64')
+    nulls = np.zeros(len(values), dtype='bool')
+    chunks = []
+    position = 0
+    for i, value in enumerate(values):
+        if value is None:
+            nulls[i] = True
+        else:
+            data = str(value).encode('utf-8')
+            chunks.append(data)
+            position += len(data)
+        offsets[i + 1] = position
+    return offsets, nulls, b"".join(chunks)
+
+
+def write_catalog(
+    filepath: str,
+    products: Iterable[Dict],
+    content_hashes: Optional[Mapping] = None,
+    meta: Optional[Dict] = None
+):
+    """
+    Ghi products ra file catalog (ghi file tạm rồi rename)
+
+    Args:
+        filepath: Đường dẫn file .catalog
+        products: Product dictionaries (same shape as get_all_products)
+        content_hashes: ProductID → hash của create_product_text (optional)
+        meta: Thông tin thêm lưu trong header (vd. text_format của index)
+    """
+    products = sorted(products, key=lambda p: p['ProductID'])
+    content_hashes = content_hashes or {}
+
+    arrays = {}
+    for name in INT_COLUMNS:
+        arrays[name] = np.array([int(p.get(name) or 0) for p in products], dtype='int64')
+    for name in NULLABLE_INT_COLUMNS + FLOAT_COLUMNS:
+        arrays[name] = np.array([_to_float(p.get(name)) for p in products], dtype='float64')
+    for name in BOOL_COLUMNS:
+        arrays[name] = np.array([bool(p.get(name, True)) for p in products], dtype='bool')
+    arrays[HASH_COLUMN] = np.array(
+        [content_hashes.get(p['ProductID'], '') for p in products], dtype='S40'
+    )
+
+    string_values = {name: [p.get(name) for p in products] for name in STRING_COLUMNS}
+    extras = [
+        {k: v for k, v in p.items() if k not in KNOWN_FIELDS} for p in products
+    ]
+    if any(extras):
+        string_values[EXTRA_COLUMN] = [json.dumps(e, default=str) if e else None for e in extras]
+
+    for name, values in string_values.items():
+        offsets, nulls, blob = _encode_strings(values)
+        arrays[f"{name}.offsets"] = offsets
+        arrays[f"{name}.nulls"] = nulls
+        arrays[f"{name}.blob"] = np.frombuffer(blob, dtype='uint8')
+
+    # Header: vị trí + dtype của từng section
+    sections, cursor = {}, 0
+    for name, array in arrays.items():
+        cursor = -(-cursor // ALIGNMENT) * ALIGNMENT
+        sections[name] = {"dtype": array.dtype.str, "count": len(array), "offset": cursor}
+        cursor += array.nbytes
+
+    header = json.dumps({
+        "rows": len(products),
+        "strings": list(string_values),
+        "sections": sections,
+        "meta": meta or {}
+    }).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + sections[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + cursor)
+
+    os.replace(tmp_path, filepath)
+
+
+class CatalogStore(Mapping):
+    def __init__(self, filepath: str):
+        """
+        Read-only ProductID → product dict view over a mmap'd catalog file
+
+        Columns are zero-copy NumPy views into the mapping; nothing is
+        deserialized until a record is requested.
+
+        Args:
+            filepath: Đường dẫn file .catalog
+        """
+        self.filepath = filepath
+
+        with open(filepath, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Not a catalog file: {filepath}")
+
+        header_len = int.from_bytes(self._mmap[len(MAGIC):len(MAGIC) + 8], 'little')
+        header_start = len(MAGIC) + 8
+        header = json.loads(self._mmap[header_start:header_start + header_len])
+        data_start = -(-(header_start + header_len) // ALIGNMENT) * ALIGNMENT
+
+        self.rows = header["rows"]
+        self.meta = header["meta"]
+        self.string_columns = header["strings"]
+        self._columns = {
+            name: np.frombuffer(
+                self._mmap, dtype=np.dtype(spec["dtype"]),
+                count=spec["count"], offset=data_start + spec["offset"]
+            )
+            for name, spec in header["sections"].items()
+        }
+        self.product_ids = self._columns["ProductID"]
+
+    # ===== COLUMN ACCESS =====
+
+    def column(self, name: str) -> np.ndarray:
+        """Zero-copy view của 1 cột số (theo thứ tự row)"""
+        return self._columns[name]
+
+    def string_at(self, name: str, row: int) -> Optional[str]:
+        """Giải mã 1 ô của cột chuỗi"""
+        if self._columns[f"{name}.nulls"][row]:
+            return None
+        offsets = self._columns[f"{name}.offsets"]
+        return self._columns[f"{name}.blob"][offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+    def rows_for(self, product_ids: np.ndarray) -> np.ndarray:
+        """ProductIDs → row numbers (tất cả ID phải tồn tại)"""
+        return np.searchsorted(self.product_ids, product_ids)
+
+    def row_of(self, product_id: int) -> int:
+        """ProductID → row, -1 nếu không có"""
+        row = int(np.searchsorted(self.product_ids, product_id))
+        if row < self.rows and self.product_ids[row] == product_id:
+            return row
+        return -1
+
+    def min_prices(self) -> np.ndarray:
+        """MinPrice từng row (fallback BasePrice, NULL → 0) như trong filter"""
+        prices = np.where(
+            np.isnan(self._columns["MinPrice"]),
+            self._columns["BasePrice"],
+            self._columns["MinPrice"]
+        )
+        return np.nan_to_num(prices, nan=0.0)
+
+    def category_names(self) -> Dict[int, str]:
+        """CategoryID → CategoryName (chỉ giải mã 1 chuỗi cho mỗi category)"""
+        category_ids, first_rows = np.unique(self._columns["CategoryID"], return_index=True)
+        return {
+            int(cid): self.string_at("CategoryName", int(row)) or ''
+            for cid, row in zip(category_ids, first_rows)
+        }
+
+    def content_hashes(self) -> "CatalogHashes":
+        """Read-only ProductID → content hash view"""
+        return CatalogHashes(self)
+
+    # ===== RECORD MATERIALIZATION =====
+
+    def record_at(self, row: int) -> Dict:
+        """Build product dict cho 1 row"""
+        c = self._columns
+        product = {name: int(c[name][row]) for name in INT_COLUMNS}
+
+        for name in NULLABLE_INT_COLUMNS:
+            value = c[name][row]
+            product[name] = None if np.isnan(value) else int(value)
+        for name in FLOAT_COLUMNS:
+            value = c[name][row]
+            product[name] = None if np.isnan(value) else float(value)
+        for name in BOOL_COLUMNS:
+            product[name] = bool(c[name][row])
+        for name in STRING_COLUMNS:
+            product[name] = self.string_at(name, row)
+
+        if EXTRA_COLUMN in self.string_columns:
+            extra = self.string_at(EXTRA_COLUMN, row)
+            if extra:
+                product.update(json.loads(extra))
+
+        return product
+
+    def __getitem__(self, product_id) -> Dict:
+        row = self.row_of(product_id)
+        if row < 0:
+            raise KeyError(product_id)
+        return self.record_at(row)
+
+    def __contains__(self, product_id) -> bool:
+        return self.row_of(product_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(pid) for pid in self.product_ids)
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __eq__(self, other):
+        return self is other
+
+    __hash__ = object.__hash__
+
+
+class CatalogHashes(Mapping):
+    """ProductID → content hash, đọc thẳng từ cột _content_hash"""
+
+    def __init__(self, store: CatalogStore):
+        self._store = store
+        self._hashes = store.column(HASH_COLUMN)
+
+    def __getitem__(self, product_id) -> str:
+        row = self._store.row_of(product_id)
+        if row < 0 or not self._hashes[row]:
+            raise KeyError(product_id)
+        return self._hashes[row].decode('ascii')
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(pid) for pid, h in zip(self._store.product_ids, self._hashes) if h)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self._hashes))
+
+
+class CatalogOverlay(Mapping):
+    def __init__(self, base: Mapping, updates: Optional[Dict] = None, removed: frozenset = frozenset()):
+        """
+        Copy-on-write ProductID → value view: base + changed entries
+
+        Change-feed deltas create a new overlay that copies only the changed
+        entries, never the base. A mmap'd CatalogStore base therefore stays
+        shared by every worker process until the next full rebuild. Also
+        used for content hashes (value = hash string).
+
+        Args:
+            base: CatalogStore / CatalogHashes / dict
+            updates: ProductID → value mới (thêm hoặc sửa)
+            removed: ProductIDs của base đã bị xóa
+        """
+        self.base = base
+        self.updates = updates or {}
+        self.removed = removed
+        self._added = sorted(pid for pid in self.updates if pid not in base)
+        self._len = len(base) - len(removed) + len(self._added)
+
+    @classmethod
+    def of(cls, data: Mapping) -> "CatalogOverlay":
+        """Overlay rỗng trên data (trả về data nếu đã là overlay)"""
+        return data if isinstance(data, cls) else cls(data)
+
+    def apply(self, upserts: Dict, removed_ids: Iterable[int]) -> "CatalogOverlay":
+        """
+        Overlay mới với các thay đổi (overlay hiện tại không đổi)
+
+        Args:
+            upserts: ProductID → value mới
+            removed_ids: ProductIDs cần xóa
+        """
+        updates = {**self.updates, **upserts}
+        removed = set(self.removed).difference(upserts)
+        for pid in removed_ids:
+            updates.pop(pid, None)
+            if pid in self.base:
+                removed.add(pid)
+        return CatalogOverlay(self.base, updates, frozenset(removed))
+
+    def __getitem__(self, product_id):
+        if product_id in self.updates:
+            return self.updates[product_id]
+        if product_id in self.removed:
+            raise KeyError(product_id)
+        return self.base[product_id]
+
+    def __contains__(self, product_id) -> bool:
+        if product_id in self.updates:
+            return True
+        return product_id not in self.removed and product_id in self.base
+
+    def __iter__(self) -> Iterator[int]:
+        # Thứ tự của base, sản phẩm mới ở cuối
+        for product_id in self.base:
+            if product_id not in self.removed:
+                yield product_id
+        yield from self._added
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __eq__(self, other):
+        return self is other
+
+    __hash__ = object.__hash__
@@ -0,0 +1,159 @@
+"""
+Change Feed - giữ FAISS index đồng bộ với SQL Server qua Change Tracking
+Mỗi vòng poll chỉ lấy ProductID đã thay đổi (Products, ProductVariants,
+ProductMedia, Reviews), query lại đúng các sản phẩm đó và apply vào index
+đang chạy → giá / tồn kho trong câu trả lời cũ tối đa vài giây.
+
+Bật change tracking (1 lần, cần quyền ALTER):
+    ALTER DATABASE OnlineJewelryStore SET CHANGE_TRACKING = ON (CHANGE_RETENTION = 2 DAYS, AUTO_CLEANUP = ON);
+    ALTER TABLE dbo.Products ENABLE CHANGE_TRACKING;
+    ALTER TABLE dbo.ProductVariants ENABLE CHANGE_TRACKING;
+    ALTER TABLE dbo.ProductMedia ENABLE CHANGE_TRACKING;
+    ALTER TABLE dbo.Reviews ENABLE CHANGE_TRACKING;
+"""
+
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from db_connector import DatabaseConnector
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ChangeTrackingDisabled(Exception):
+    """Database chưa bật change tracking"""
+
+
+class ChangeFeedConsumer:
+    def __init__(
+        self,
+        db: DatabaseConnector,
+        embeddings_manager,
+        on_change: Optional[Callable[[Dict[str, int]], None]] = None
+    ):
+        """
+        Poll SQL Server change tracking và apply thay đổi vào index
+
+        Args:
+            db: DatabaseConnector (nên dùng pool, mỗi poll mượn connection)
+            embeddings_manager: EmbeddingsManager đang phục vụ search
+            on_change: Gọi sau mỗi lần index/product data thay đổi (vd. xóa response cache)
+        """
+        self.db = db
+        self.em = embeddings_manager
+        self.on_change = on_change
+
+        self.version = None  # Change tracking version đã apply xong
+
+        # Stats
+        self.polls = 0
+        self.full_syncs = 0
+        self.products_changed = 0
+        self.last_poll_at = None
+        self.last_poll_ms = None
+        self.last_change_at = None
+
+    def start(self) -> Dict[str, int]:
+        """
+        Chốt version hiện tại rồi full sync 1 lần
+
+        The index loaded from disk may predate changes that are no longer
+        in the change feed, so the first sync compares the whole catalog
+        (only products whose text changed are re-encoded).
+
+        Raises:
+            ChangeTrackingDisabled: Change tracking chưa bật
+        """
+        version = self.db.get_change_tracking_version()
+        if version is None:
+            raise ChangeTrackingDisabled("Change tracking is not enabled on the database")
+
+        counts = self._full_sync()
+        self.version = version
+        logger.info(f"✅ Change feed started at version {version}")
+        return counts
+
+    def poll(self) -> Optional[Dict[str, int]]:
+        """
+        1 vòng poll: ProductIDs thay đổi → get_products_by_ids → apply_changes
+
+        Returns:
+            Counters của apply_changes, None nếu không có thay đổi
+        """
+        start = time.perf_counter()
+
+        if self.version is None:
+            counts = self.start()
+            self._record_poll(start)
+            return counts
+
+        # Lấy version trước khi đọc thay đổi: thay đổi commit giữa 2 query
+        # sẽ được đọc lại ở vòng sau (apply lại là idempotent)
+        current = self.db.get_change_tracking_version()
+        if current is None:
+            raise ChangeTrackingDisabled("Change tracking is not enabled on the database")
+
+        changes = self.db.get_changed_product_ids(self.version)
+        counts = None
+
+        if changes is None:
+            logger.warning(f"⚠️  Change tracking version {self.version} expired, running full sync")
+            counts = self._full_sync()
+        else:
+            product_ids, unresolved = changes
+            if unresolved:
+                # Variant/media/review bị xóa → không biết ProductID
+                logger.info("Child rows deleted since last poll, running full sync")
+                counts = self._full_sync()
+            elif product_ids:
+                products = self.db.get_products_by_ids(product_ids)
+                found = {p['ProductID'] for p in products}
+                counts = self.em.apply_changes(
+                    upserts=products,
+                    removed_ids=[pid for pid in product_ids if pid not in found]
+                )
+                self._changed(counts, len(product_ids))
+
+        self.version = current
+        self._record_poll(start)
+
+        if counts:
+            logger.info(f"✅ Change feed applied {counts} in {self.last_poll_ms}ms (version {current})")
+        return counts
+
+    def _record_poll(self, start: float):
+        self.polls += 1
+        self.last_poll_at = datetime.now().isoformat()
+        self.last_poll_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def _full_sync(self) -> Dict[str, int]:
+        products = self.db.get_all_products()
+        if not products:
+            # get_all_products trả [] khi lỗi → không xóa cả index
+            raise RuntimeError("No products loaded from database")
+
+        counts = self.em.sync_products(products)
+        self.full_syncs += 1
+        self._changed(counts, counts["added"] + counts["updated"] + counts["removed"])
+        return counts
+
+    def _changed(self, counts: Dict[str, int], products: int):
+        self.products_changed += products
+        self.last_change_at = datetime.now().isoformat()
+        if self.on_change:
+            self.on_change(counts)
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "polls": self.polls,
+            "full_syncs": self.full_syncs,
+            "products_changed": self.products_changed,
+            "last_poll_at": self.last_poll_at,
+            "last_poll_ms": self.last_poll_ms,
+            "last_change_at": self.last_change_at
+        }
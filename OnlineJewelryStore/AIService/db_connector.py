@@ -1,26 +1,434 @@
-﻿import pyodbc
-from typing import List, Dict, Optional
+﻿import json
+import pyodbc
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Iterable, Iterator, Set, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Product export cho RAG indexing (dùng chung bởi full-catalog và theo ID).
+# Mỗi bảng con được aggregate riêng (1 dòng / ProductID) rồi mới join, nên
+# số dòng trung gian tuyến tính theo số sản phẩm thay vì variants × reviews.
+PRODUCTS_SELECT = """
+WITH VariantAgg AS (
+    SELECT
+        ProductID,
+        MIN(AdditionalPrice) AS MinAdditionalPrice,
+        MAX(AdditionalPrice) AS MaxAdditionalPrice,
+        SUM(StockQuantity) AS TotalStock
+    FROM ProductVariants
+    GROUP BY ProductID
+),
+MetalAgg AS (
+    -- Mỗi kim loại 1 lần (DISTINCT), thứ tự cố định → content hash ổn định
+    SELECT
+        ProductID,
+        STRING_AGG(CAST(MetalType AS NVARCHAR(MAX)), ', ') WITHIN GROUP (ORDER BY MetalType) AS AvailableMetals
+    FROM (
+        SELECT DISTINCT ProductID, MetalType
+        FROM ProductVariants
+        WHERE MetalType IS NOT NULL
+    ) metals
+    GROUP BY ProductID
+),
+ReviewAgg AS (
+    SELECT
+        ProductID,
+        COUNT(*) AS ReviewCount,
+        AVG(CAST(Rating AS FLOAT)) AS AvgRating
+    FROM Reviews
+    GROUP BY ProductID
+),
+MainMedia AS (
+    SELECT
+        ProductID,
+        URL AS MainImageURL,
+        ROW_NUMBER() OVER (PARTITION BY ProductID ORDER BY MediaID) AS rn
+    FROM ProductMedia
+    WHERE IsMain = 1
+)
+SELECT 
+    p.ProductID,
+    p.ProductName,
+    p.Description,
+    p.BasePrice,
+    p.CategoryID,
+    p.IsActive,
+    c.CategoryName,
+    c.ParentCategoryID,
+    ma.AvailableMetals,
+    va.MinAdditionalPrice,
+    va.MaxAdditionalPrice,
+    va.TotalStock,
+    mm.MainImageURL,
+    ISNULL(ra.ReviewCount, 0) AS ReviewCount,
+    ra.AvgRating
+FROM Products p
+INNER JOIN Categories c ON p.CategoryID = c.CategoryID
+LEFT JOIN VariantAgg va ON va.ProductID = p.ProductID
+LEFT JOIN MetalAgg ma ON ma.ProductID = p.ProductID
+LEFT JOIN ReviewAgg ra ON ra.ProductID = p.ProductID
+LEFT JOIN MainMedia mm ON mm.ProductID = p.ProductID AND mm.rn = 1
+"""
+
+ALL_PRODUCTS_QUERY = PRODUCTS_SELECT + """WHERE p.IsActive = 1
+ORDER BY p.ProductID
+"""
+
+# ID list truyền dạng 1 JSON array → 1 parameter, 1 cached plan cho mọi batch size
+PRODUCTS_BY_IDS_QUERY = PRODUCTS_SELECT + """WHERE p.IsActive = 1
+  AND p.ProductID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+ORDER BY p.ProductID
+"""
+
+# Field hay thay đổi (giá, tồn kho, rating) cho LiveStats: chỉ số, không text,
+# nên refresh định kỳ rẻ hơn nhiều so với ALL_PRODUCTS_QUERY
+LIVE_STATS_COLUMNS = (
+    "ProductID", "BasePrice", "MinAdditionalPrice", "MaxAdditionalPrice",
+    "TotalStock", "ReviewCount", "AvgRating"
+)
+LIVE_STATS_QUERY = """
+SELECT
+    p.ProductID,
+    p.BasePrice,
+    va.MinAdditionalPrice,
+    va.MaxAdditionalPrice,
+    va.TotalStock,
+    ISNULL(ra.ReviewCount, 0) AS ReviewCount,
+    ra.AvgRating
+FROM Products p
+LEFT JOIN (
+    SELECT
+        ProductID,
+        MIN(AdditionalPrice) AS MinAdditionalPrice,
+        MAX(AdditionalPrice) AS MaxAdditionalPrice,
+        SUM(StockQuantity) AS TotalStock
+    FROM ProductVariants
+    GROUP BY ProductID
+) va ON va.ProductID = p.ProductID
+LEFT JOIN (
+    SELECT ProductID, COUNT(*) AS ReviewCount, AVG(CAST(Rating AS FLOAT)) AS AvgRating
+    FROM Reviews
+    GROUP BY ProductID
+) ra ON ra.ProductID = p.ProductID
+WHERE p.IsActive = 1
+ORDER BY p.ProductID
+"""
+
+# Bảng ảnh hưởng tới product text / index → (tên bảng, primary key)
+CHANGE_TRACKED_TABLES = (
+    ("Products", "ProductID"),
+    ("ProductVariants", "VariantID"),
+    ("ProductMedia", "MediaID"),
+    ("Reviews", "ReviewID")
+)
+
+# ProductID bị ảnh hưởng bởi mọi thay đổi sau version ?. Dòng con đã bị xóa
+# không còn ProductID (CHANGETABLE chỉ giữ primary key) → trả về NULL.
+CHANGED_PRODUCTS_QUERY = """
+SELECT ct.ProductID FROM CHANGETABLE(CHANGES dbo.Products, ?) AS ct
+UNION
+SELECT pv.ProductID FROM CHANGETABLE(CHANGES dbo.ProductVariants, ?) AS ct
+    LEFT JOIN ProductVariants pv ON pv.VariantID = ct.VariantID
+UNION
+SELECT pm.ProductID FROM CHANGETABLE(CHANGES dbo.ProductMedia, ?) AS ct
+    LEFT JOIN ProductMedia pm ON pm.MediaID = ct.MediaID
+UNION
+SELECT r.ProductID FROM CHANGETABLE(CHANGES dbo.Reviews, ?) AS ct
+    LEFT JOIN Reviews r ON r.ReviewID = ct.ReviewID
+"""
+
+
+def _product_from_row(columns: List[str], row) -> Dict:
+    product = dict(zip(columns, row))
+    # Tính giá thực tế
+    product['MinPrice'] = product['BasePrice'] + (product['MinAdditionalPrice'] or 0)
+    product['MaxPrice'] = product['BasePrice'] + (product['MaxAdditionalPrice'] or 0)
+    return product
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connection_string: str,
+        min_size: int = 1,
+        max_size: int = 5,
+        max_idle_s: float = 300.0,
+        health_check_after_s: float = 5.0,
+        acquire_timeout: float = 30.0
+    ):
+        """
+        Thread-safe pool of pyodbc connections
+
+        Connections are checked out per operation instead of logging in to
+        SQL Server every time; at most max_size are ever open.
+
+        Args:
+            connection_string: SQL Server connection string
+            min_size: Số connection luôn giữ mở (tạo sẵn trong open())
+            max_size: Số connection mở tối đa (kể cả đang dùng)
+            max_idle_s: Connection idle lâu hơn bị đóng (giữ lại min_size)
+            health_check_after_s: Connection idle lâu hơn được SELECT 1 trước khi trả cho caller
+            acquire_timeout: Thời gian tối đa chờ connection rảnh (s)
+        """
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool size must satisfy 0 <= min_size <= max_size, max_size >= 1")
+
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle_s = max_idle_s
+        self.health_check_after_s = health_check_after_s
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = deque()  # (connection, thời điểm trả về); phải = mới dùng nhất
+        self._size = 0        # Connection đang mở (idle + đang dùng + đang tạo)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._reaper = None
+        self._stop_event = threading.Event()
+
+        # Stats
+        self.created = 0
+        self.evicted = 0
+        self.failed_health_checks = 0
+        self.timeouts = 0
+
+    # ===== LIFECYCLE =====
+
+    def open(self) -> bool:
+        """
+        Tạo sẵn min_size connection và start idle reaper thread
+
+        Returns:
+            False nếu không tạo được connection (pool vẫn dùng được, sẽ thử lại khi acquire)
+        """
+        self._closed = False
+        if not (self._reaper and self._reaper.is_alive()):
+            self._stop_event.clear()
+            self._reaper = threading.Thread(target=self._reap_idle, name="db-pool-reaper", daemon=True)
+            self._reaper.start()
+
+        try:
+            connections = [self.acquire() for _ in range(self.min_size - self._size)]
+            for conn in connections:
+                self.release(conn)
+            logger.info(f"✅ Database pool ready ({self._size} connections, max {self.max_size})")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️  Database pool warm-up failed, will retry on demand: {e}")
+            return False
+
+    def close(self):
+        """Đóng mọi connection idle; connection đang dùng bị đóng khi được trả về"""
+        self._stop_event.set()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+
+        for conn, _ in idle:
+            self._close_quietly(conn)
+        logger.info("Database pool closed")
+
+    # ===== CHECKOUT / RETURN =====
+
+    def acquire(self, timeout: Optional[float] = None):
+        """
+        Lấy 1 connection (idle đã health-check, hoặc tạo mới nếu chưa đủ max_size)
+
+        Args:
+            timeout: Thời gian tối đa chờ (mặc định acquire_timeout)
+
+        Returns:
+            pyodbc connection; phải trả lại bằng release()
+
+        Raises:
+            TimeoutError: Pool đầy quá timeout
+        """
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("Connection pool is closed")
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        # Giữ chỗ rồi connect ngoài lock (login có thể mất vài trăm ms)
+                        self._size += 1
+                        conn = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise TimeoutError(f"No database connection available within {self.acquire_timeout}s")
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = pyodbc.connect(self.connection_string)
+                except Exception:
+                    self._discard(None)
+                    raise
+                self.created += 1
+                return conn
+
+            if time.monotonic() - returned_at < self.health_check_after_s or self._is_alive(conn):
+                return conn
+
+            # Connection chết (server restart, network...) → bỏ và thử cái khác
+            self.failed_health_checks += 1
+            logger.warning("⚠️  Dropping dead pooled database connection")
+            self._discard(conn)
+
+    def release(self, conn, healthy: bool = True):
+        """
+        Trả connection về pool
+
+        Args:
+            conn: Connection lấy từ acquire()
+            healthy: False nếu vừa gặp lỗi → lần checkout sau luôn health-check
+        """
+        try:
+            conn.rollback()  # Không để transaction dở dang cho caller sau
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic() if healthy else float("-inf")))
+                self._cond.notify()
+                return
+        self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        Context manager: with pool.connection() as conn: ...
+
+        The connection goes back to the pool on exit, flagged for a health
+        check if the block raised.
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, healthy=False)
+            raise
+        self.release(conn)
+
+    # ===== INTERNALS =====
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        """Bỏ 1 connection (hoặc 1 chỗ đã giữ) khỏi pool"""
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+        if conn is not None:
+            self._close_quietly(conn)
+
+    def _reap_idle(self):
+        """Background thread: đóng connection idle quá max_idle_s, giữ (và bù) min_size"""
+        interval = max(1.0, min(self.max_idle_s / 2, 60.0))
+
+        while not self._stop_event.wait(interval):
+            expired = []
+            with self._cond:
+                cutoff = time.monotonic() - self.max_idle_s
+                # Trái = idle lâu nhất
+                while self._idle and self._size > self.min_size and self._idle[0][1] < cutoff:
+                    expired.append(self._idle.popleft()[0])
+                    self._size -= 1
+
+            for conn in expired:
+                self._close_quietly(conn)
+            if expired:
+                self.evicted += len(expired)
+                logger.info(f"Closed {len(expired)} idle database connection(s)")
+
+            # Bù lại min_size sau khi connection chết bị bỏ
+            while True:
+                with self._cond:
+                    if self._closed or self._size >= self.min_size:
+                        break
+                    self._size += 1
+                try:
+                    conn = pyodbc.connect(self.connection_string)
+                except Exception as e:
+                    self._discard(None)
+                    logger.warning(f"⚠️  Could not reopen pooled database connection: {e}")
+                    break
+                self.created += 1
+                self.release(conn)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            size, idle = self._size, len(self._idle)
+
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "created": self.created,
+            "evicted": self.evicted,
+            "failed_health_checks": self.failed_health_checks,
+            "timeouts": self.timeouts
+        }
+
 
 class DatabaseConnector:
-    def __init__(self, connection_string: str):
+    def __init__(self, connection_string: str, pool: Optional[ConnectionPool] = None):
         """
         Initialize database connection
         
         Args:
             connection_string: SQL Server connection string từ web.config
             Format: "Driver={SQL Server};Server=WINDOWS-PC\SQLEXPRESS;Database=OnlineJewelryStore;UID=sa;PWD=1;TrustServerCertificate=yes;"
+            pool: ConnectionPool dùng chung (optional). connect()/disconnect()
+                  then borrow/return a pooled connection instead of logging in,
+                  and query methods called without connect() borrow one per call.
         """
         self.connection_string = connection_string
+        self.pool = pool
         self.conn = None
         
     def connect(self):
-        """Establish database connection"""
+        """Establish database connection (hoặc mượn 1 connection từ pool)"""
         try:
+            if self.pool:
+                self.conn = self.pool.acquire()
+                return True
+            
             self.conn = pyodbc.connect(self.connection_string)
             logger.info("✅ Database connected successfully")
             return True
@@ -29,78 +437,181 @@ class DatabaseConnector:
             return False
     
     def disconnect(self):
-        """Close database connection"""
-        if self.conn:
+        """Close database connection (hoặc trả về pool)"""
+        if not self.conn:
+            return
+        
+        if self.pool:
+            self.pool.release(self.conn)
+        else:
             self.conn.close()
             logger.info("Database connection closed")
+        self.conn = None
+    
+    def __enter__(self) -> "DatabaseConnector":
+        if not self.connect():
+            raise ConnectionError("Failed to connect to database")
+        return self
+    
+    def __exit__(self, *exc):
+        self.disconnect()
+    
+    @contextmanager
+    def _connection(self):
+        """Connection cho 1 lần query: self.conn nếu đã connect(), không thì mượn từ pool"""
+        if self.conn is not None or not self.pool:
+            yield self.conn
+        else:
+            with self.pool.connection() as conn:
+                yield conn
     
     def get_all_products(self) -> List[Dict]:
         """
         Lấy tất cả sản phẩm với thông tin đầy đủ cho RAG indexing
         
+        Uses ALL_PRODUCTS_QUERY (pre-aggregated CTEs, see benchmark_db.py).
+        For full rebuilds prefer iter_products(), which never holds the
+        whole result set.
+        
         Returns:
             List of product dictionaries
         """
-        query = """
-        SELECT 
-            p.ProductID,
-            p.ProductName,
-            p.Description,
-            p.BasePrice,
-            p.CategoryID,
-            p.IsActive,
-            c.CategoryName,
-            c.ParentCategoryID,
-            
-            -- Lấy thông tin variants
-            STRING_AGG(CAST(pv.MetalType AS NVARCHAR(MAX)), ', ') as AvailableMetals,
-            MIN(pv.AdditionalPrice) as MinAdditionalPrice,
-            MAX(pv.AdditionalPrice) as MaxAdditionalPrice,
-            SUM(pv.StockQuantity) as TotalStock,
+        try:
+            products = list(self.iter_products())
+            logger.info(f"✅ Retrieved {len(products)} products from database")
+            return products
             
-            -- Lấy URL ảnh chính
-            (SELECT TOP 1 URL FROM ProductMedia 
-             WHERE ProductID = p.ProductID AND IsMain = 1) as MainImageURL,
+        except Exception as e:
+            logger.error(f"❌ Error querying products: {e}")
+            return []
+    
+    def iter_products(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """
+        Stream tất cả sản phẩm theo từng batch fetchmany
+        
+        Errors are raised to the caller (unlike get_all_products), so a
+        failed stream is never mistaken for a short catalog.
+        
+        Args:
+            batch_size: Số dòng mỗi lần fetchmany
             
-            -- Đếm số reviews và rating trung bình
-            COUNT(DISTINCT r.ReviewID) as ReviewCount,
-            AVG(CAST(r.Rating AS FLOAT)) as AvgRating
+        Yields:
+            Product dictionaries (giống get_all_products)
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(ALL_PRODUCTS_QUERY)
+                columns = [column[0] for column in cursor.description]
+                
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    
+                    for row in rows:
+                        yield _product_from_row(columns, row)
+            finally:
+                cursor.close()
+    
+    def get_products_by_ids(self, product_ids: Iterable[int], batch_size: int = 1000) -> List[Dict]:
+        """
+        Lấy các sản phẩm theo ID, cùng shape với get_all_products
+        
+        Inactive or deleted products are simply absent from the result.
+        Errors are raised to the caller, so a failed lookup is never
+        mistaken for deleted products.
+        
+        Args:
+            product_ids: ProductIDs cần lấy
+            batch_size: Số ID mỗi query
             
-        FROM Products p
-        INNER JOIN Categories c ON p.CategoryID = c.CategoryID
-        LEFT JOIN ProductVariants pv ON p.ProductID = pv.ProductID
-        LEFT JOIN Reviews r ON p.ProductID = r.ProductID
+        Returns:
+            List of product dictionaries (sorted theo ProductID trong mỗi batch)
+        """
+        product_ids = sorted({int(pid) for pid in product_ids})
+        products = []
         
-        WHERE p.IsActive = 1
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for start in range(0, len(product_ids), batch_size):
+                    cursor.execute(PRODUCTS_BY_IDS_QUERY, (json.dumps(product_ids[start:start + batch_size]),))
+                    columns = [column[0] for column in cursor.description]
+                    products.extend(_product_from_row(columns, row) for row in cursor.fetchall())
+            finally:
+                cursor.close()
         
-        GROUP BY 
-            p.ProductID, p.ProductName, p.Description, 
-            p.BasePrice, p.CategoryID, p.IsActive,
-            c.CategoryName, c.ParentCategoryID
+        return products
+    
+    def get_live_stats(self) -> List[tuple]:
+        """
+        Giá / tồn kho / rating hiện tại của mọi sản phẩm active
+        
+        Errors are raised to the caller, so a failed refresh never wipes
+        the live values.
         
-        ORDER BY p.ProductID
+        Returns:
+            Rows theo thứ tự LIVE_STATS_COLUMNS, sorted theo ProductID
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(LIVE_STATS_QUERY)
+                return [tuple(row) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+    
+    # ===== CHANGE TRACKING =====
+    
+    def get_change_tracking_version(self) -> Optional[int]:
         """
+        CHANGE_TRACKING_CURRENT_VERSION() của database
         
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute(query)
-            
-            columns = [column[0] for column in cursor.description]
-            products = []
-            
-            for row in cursor.fetchall():
-                product = dict(zip(columns, row))
-                # Tính giá thực tế
-                product['MinPrice'] = product['BasePrice'] + (product['MinAdditionalPrice'] or 0)
-                product['MaxPrice'] = product['BasePrice'] + (product['MaxAdditionalPrice'] or 0)
-                products.append(product)
-            
-            logger.info(f"✅ Retrieved {len(products)} products from database")
-            return products
+        Returns:
+            Version hiện tại, None nếu change tracking chưa bật
+        """
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                row = cursor.execute("SELECT CHANGE_TRACKING_CURRENT_VERSION()").fetchone()
+                return row[0] if row else None
+            finally:
+                cursor.close()
+    
+    def get_changed_product_ids(self, since_version: int) -> Optional[Tuple[Set[int], bool]]:
+        """
+        ProductIDs bị ảnh hưởng bởi các thay đổi sau since_version
+        
+        Args:
+            since_version: Version đã xử lý lần trước
             
-        except Exception as e:
-            logger.error(f"❌ Error querying products: {e}")
-            return []
+        Returns:
+            (product_ids, unresolved) - unresolved = True khi có dòng con
+            (variant/media/review) bị xóa mà không còn biết ProductID.
+            None nếu since_version đã bị change tracking cleanup xóa
+            (cần full sync).
+        """
+        min_valid_query = "SELECT MAX(v) FROM (VALUES {}) AS t(v)".format(
+            ", ".join(f"(CHANGE_TRACKING_MIN_VALID_VERSION(OBJECT_ID('dbo.{table}')))" for table, _ in CHANGE_TRACKED_TABLES)
+        )
+        
+        # Mọi bảng phải còn giữ thay đổi từ since_version
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                min_valid = cursor.execute(min_valid_query).fetchone()[0]
+                if min_valid is None or since_version < min_valid:
+                    return None
+                
+                cursor.execute(CHANGED_PRODUCTS_QUERY, (since_version,) * len(CHANGE_TRACKED_TABLES))
+                product_ids = {row[0] for row in cursor.fetchall()}
+            finally:
+                cursor.close()
+        
+        unresolved = None in product_ids
+        product_ids.discard(None)
+        return product_ids, unresolved
     
     def get_product_by_id(self, product_id: int) -> Optional[Dict]:
         """Lấy chi tiết 1 sản phẩm theo ID"""
@@ -117,14 +628,15 @@ class DatabaseConnector:
         """
         
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query, (product_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                columns = [column[0] for column in cursor.description]
-                return dict(zip(columns, row))
-            return None
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, (product_id,))
+                row = cursor.fetchone()
+                
+                if row:
+                    columns = [column[0] for column in cursor.description]
+                    return dict(zip(columns, row))
+                return None
             
         except Exception as e:
             logger.error(f"❌ Error querying product {product_id}: {e}")
@@ -193,16 +705,17 @@ class DatabaseConnector:
             query += " AND SUM(pv.StockQuantity) > 0"
         
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query, params)
-            
-            columns = [column[0] for column in cursor.description]
-            products = []
-            
-            for row in cursor.fetchall():
-                product = dict(zip(columns, row))
-                product['FinalPrice'] = product['BasePrice'] + (product['MinAdditionalPrice'] or 0)
-                products.append(product)
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query, params)
+                
+                columns = [column[0] for column in cursor.description]
+                products = []
+                
+                for row in cursor.fetchall():
+                    product = dict(zip(columns, row))
+                    product['FinalPrice'] = product['BasePrice'] + (product['MinAdditionalPrice'] or 0)
+                    products.append(product)
             
             logger.info(f"✅ Found {len(products)} products matching filters")
             return products
@@ -223,11 +736,12 @@ class DatabaseConnector:
         """
         
         try:
-            cursor = self.conn.cursor()
-            cursor.execute(query)
-            
-            columns = [column[0] for column in cursor.description]
-            categories = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(query)
+                
+                columns = [column[0] for column in cursor.description]
+                categories = [dict(zip(columns, row)) for row in cursor.fetchall()]
             
             logger.info(f"✅ Retrieved {len(categories)} categories")
             return categories
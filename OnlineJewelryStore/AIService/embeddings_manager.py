@@ -1,45 +1,666 @@
-from sentence_transformers import SentenceTransformer
-import faiss
+import copy
+import importlib
+import itertools
+import json
 import numpy as np
 import pickle
 import os
-from typing import List, Dict, Tuple
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+from typing import List, Dict, Tuple, Optional, Iterable
 import logging
 
+from batch_encoder import BatchingEncoder
+from bm25_index import BM25Index
+from cache import LRUCache
+from catalog_store import CatalogHashes, CatalogOverlay, CatalogStore, write_catalog
+from encoders import create_encoder
+from file_lock import FileLock
+from metrics import STAGE_SECONDS
+from parallel_encoder import ParallelEncoder
+from tracing import current_span, span, traced
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class _LazyModule:
+    """
+    Module proxy that imports on first attribute access
+    
+    Keeps `import embeddings_manager` (and the --reload dev server) from
+    paying for faiss at import time; the real import happens in a startup
+    worker thread. The lock makes concurrent first use from the model and
+    index loader threads safe.
+    """
+    
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+    
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+faiss = _LazyModule("faiss")
+
+
+def _has_id_map(index) -> bool:
+    """True nếu index là IndexIDMap/IndexIDMap2 (id ngoài → vị trí trong base index)"""
+    return isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+def _lookup_positions(keys: np.ndarray, order: Optional[np.ndarray], product_ids: np.ndarray) -> np.ndarray:
+    """Vị trí của product_ids trong keys (order = argsort(keys), None = keys đã sort), -1 nếu không có"""
+    product_ids = np.asarray(product_ids, dtype='int64')
+    if not len(keys):
+        return np.full(len(product_ids), -1, dtype='int64')
+    
+    sorted_keys = keys if order is None else keys[order]
+    idx = np.minimum(np.searchsorted(sorted_keys, product_ids), len(sorted_keys) - 1)
+    found = idx if order is None else order[idx]
+    return np.where(sorted_keys[idx] == product_ids, found, -1).astype('int64')
+
+
+def _filter_price(product: Dict) -> float:
+    """Giá dùng cho price filter: MinPrice, fallback BasePrice, NULL → 0"""
+    return float(product.get('MinPrice', product.get('BasePrice', 0)) or 0)
+
+
+GENERATION_FILES = (".index", ".catalog", ".bm25")
+
+
+def read_manifest(filepath: str) -> Optional[Dict]:
+    """
+    Files của generation hiện tại, theo `{filepath}.manifest`
+    
+    Args:
+        filepath: Base path của index (without extension)
+    
+    Returns:
+        {"generation": int, ".index": path, ".catalog": path, ".bm25": path | None},
+        None nếu chưa có manifest (index bản gốc: .index + .pkl)
+    """
+    try:
+        with open(f"{filepath}.manifest", encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    
+    directory = os.path.dirname(filepath)
+    files = {"generation": manifest["generation"]}
+    for ext in GENERATION_FILES:
+        name = manifest["files"].get(ext)
+        files[ext] = os.path.join(directory, name) if name else None
+    return files
+
+
+def _generations_on_disk(filepath: str) -> Dict[int, List[str]]:
+    """generation → các file `{filepath}.<gen>.index/.catalog/.bm25` (kể cả .tmp còn sót)"""
+    directory = os.path.dirname(filepath) or '.'
+    pattern = re.compile(
+        rf"^{re.escape(os.path.basename(filepath))}\.(\d+)({'|'.join(map(re.escape, GENERATION_FILES))})(\.\d+\.tmp)?$"
+    )
+    generations = {}
+    for name in os.listdir(directory):
+        match = pattern.match(name)
+        if match:
+            generations.setdefault(int(match.group(1)), []).append(os.path.join(directory, name))
+    return generations
+
+
+class IndexSnapshot:
+    def __init__(
+        self,
+        index,
+        product_data: Dict,
+        content_hashes: Dict,
+        version: int,
+        mmap_path: Optional[str] = None,
+        lexical: Optional[BM25Index] = None,
+        text_format: int = 0
+    ):
+        """
+        Immutable view: FAISS index + product data + filter lookups
+        
+        Searches read a single snapshot reference, so rebuilds and updates
+        publish a complete new snapshot with one assignment and readers
+        never see a new index paired with old product data.
+        
+        Change-feed updates do not rebuild this: with_delta() returns a
+        copy that shares the index and lookups and carries an IndexDelta.
+        
+        Args:
+            index: IndexIDMap2 (flat/HNSW) hoặc IVF với id = ProductID, hoặc None
+            product_data: ProductID → product dict (dict, CatalogStore hoặc CatalogOverlay)
+            content_hashes: ProductID → hash của create_product_text
+            version: Index version (dùng trong response cache key)
+            mmap_path: File mà inverted lists đang được mmap (None = index trong RAM)
+            lexical: BM25 index trên cùng product text
+            text_format: Phiên bản create_product_text của các vector trong index
+        """
+        self.index = index
+        self.product_data = product_data
+        self.content_hashes = content_hashes
+        self.version = version
+        self.mmap_path = mmap_path
+        self.lexical = lexical
+        self.text_format = text_format
+        self.delta = None  # IndexDelta: thay đổi chưa gộp vào index chính
+        
+        # Filter lookups theo vị trí trong base index:
+        # position → ProductID, category → positions, giá đã sort
+        self.native_ids = False  # True: index trả về ProductID trực tiếp (IVF)
+        self.id_map = np.empty(0, dtype='int64')
+        self.category_positions = {}
+        self.price_order = np.empty(0, dtype='int64')
+        self.sorted_prices = np.empty(0, dtype='float64')
+        self._id_order = np.empty(0, dtype='int64')  # argsort(id_map) cho positions_of
+        # (LiveStatsTable, price_order, sorted_prices) mới nhất; with_delta dùng chung
+        self._live_price_lookup = [None]
+        
+        if index is not None:
+            self._build_filter_lookups()
+    
+    def with_delta(self, delta: "IndexDelta", product_data: Dict, content_hashes: Dict, version: int) -> "IndexSnapshot":
+        """Snapshot mới dùng chung index + lookups với snapshot này, cộng thêm delta"""
+        snapshot = copy.copy(self)
+        snapshot.product_data = product_data
+        snapshot.content_hashes = content_hashes
+        snapshot.version = version
+        snapshot.delta = delta
+        return snapshot
+    
+    def _build_filter_lookups(self):
+        """
+        Precompute category → position sets và price-sorted array
+        
+        Positions refer to the base index under IndexIDMap2, so filtered
+        searches can pass them straight to an ID selector. IVF indexes store
+        ProductIDs themselves; their positions are the sorted ProductIDs and
+        the selector gets id_map[positions]. Lets search() turn
+        category/price filters into a candidate set in O(log n) instead of
+        scanning product_data per query.
+        """
+        if _has_id_map(self.index):
+            self.id_map = faiss.vector_to_array(faiss.downcast_index(self.index).id_map).astype('int64')
+        else:
+            self.native_ids = True
+            self.id_map = self._sorted_product_ids(self.product_data)
+        self._id_order = np.argsort(self.id_map, kind='stable')
+        
+        catalog = self.product_data
+        if isinstance(catalog, CatalogOverlay):
+            catalog = catalog.base
+        if isinstance(catalog, CatalogStore):
+            prices, category_ids, names = self._catalog_columns(catalog)
+        else:
+            catalog = None
+            prices = np.empty(len(self.id_map), dtype='float64')
+            category_ids = np.empty(len(self.id_map), dtype='int64')
+            names = {}
+        
+        # Record không có trong catalog (dict, hoặc đã sửa trong overlay)
+        # → CategoryID tạm âm theo tên
+        codes = {}
+        if catalog is None:
+            patched = zip(range(len(self.id_map)), self.id_map.tolist())
+        else:
+            patched = self._overlay_positions()
+        for pos, product_id in patched:
+            product = self.product_data[product_id]
+            name = (product.get('CategoryName') or '').lower()
+            category_ids[pos] = codes.setdefault(name, -1 - len(codes))
+            prices[pos] = _filter_price(product)
+        names.update({code: name for name, code in codes.items()})
+        
+        self.price_order = np.argsort(prices, kind='stable').astype('int64')
+        self.sorted_prices = prices[self.price_order]
+        
+        order = np.argsort(category_ids, kind='stable')
+        sorted_ids = category_ids[order]
+        starts = np.flatnonzero(np.r_[True, sorted_ids[1:] != sorted_ids[:-1]]) if len(order) else np.empty(0, dtype='int64')
+        positions_by_name = {}
+        for start, group in zip(starts, np.split(order, starts[1:])):
+            positions_by_name.setdefault(names[int(sorted_ids[start])], []).append(group)
+        
+        self.category_positions = {
+            name: np.sort(np.concatenate(chunks)).astype('int64')
+            for name, chunks in positions_by_name.items()
+        }
+    
+    @staticmethod
+    def _sorted_product_ids(product_data: Dict) -> np.ndarray:
+        """ProductIDs đã sort (không duyệt từng record khi có catalog)"""
+        if isinstance(product_data, CatalogStore):
+            return np.asarray(product_data.product_ids, dtype='int64')
+        if isinstance(product_data, CatalogOverlay) and isinstance(product_data.base, CatalogStore):
+            ids = np.asarray(product_data.base.product_ids, dtype='int64')
+            ids = ids[~np.isin(ids, np.fromiter(product_data.removed, dtype='int64'))]
+            return np.union1d(ids, np.fromiter(product_data.updates, dtype='int64'))
+        return np.sort(np.fromiter(product_data, dtype='int64', count=len(product_data)))
+    
+    def _catalog_columns(self, catalog: CatalogStore) -> Tuple[np.ndarray, np.ndarray, Dict[int, str]]:
+        """Giá + CategoryID theo vị trí, đọc từ cột catalog (chưa tính record trong overlay)"""
+        rows = np.minimum(catalog.rows_for(self.id_map), max(catalog.rows - 1, 0))
+        prices = catalog.min_prices()[rows]
+        category_ids = catalog.column('CategoryID')[rows].astype('int64')
+        names = {cid: name.lower() for cid, name in catalog.category_names().items()}
+        return prices, category_ids, names
+    
+    def _overlay_positions(self) -> Iterable[Tuple[int, int]]:
+        """(position, ProductID) của các record overlay đè lên catalog"""
+        if not isinstance(self.product_data, CatalogOverlay):
+            return []
+        ids = np.fromiter(self.product_data.updates, dtype='int64')
+        positions = self.positions_of(ids)
+        return [(int(pos), int(pid)) for pos, pid in zip(positions, ids) if pos >= 0]
+    
+    def positions_of(self, product_ids: np.ndarray) -> np.ndarray:
+        """ProductIDs → vị trí trong index chính, -1 nếu không có"""
+        return _lookup_positions(self.id_map, self._id_order, product_ids)
+    
+    def _price_lookup(self, live_prices=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (price_order, sorted_prices) của index chính
+        
+        With a LiveStatsTable, its current MinPrice replaces the price from
+        the snapshot for every product it covers. Computed once per table
+        and shared by the delta snapshots of this main index, so a filtered
+        query stays a binary search.
+        """
+        if live_prices is None or not len(live_prices):
+            return self.price_order, self.sorted_prices
+        
+        cached = self._live_price_lookup[0]
+        if cached is not None and cached[0] is live_prices:
+            return cached[1], cached[2]
+        
+        prices = np.empty(len(self.sorted_prices), dtype='float64')
+        prices[self.price_order] = self.sorted_prices
+        rows = _lookup_positions(live_prices.product_ids, None, self.id_map)
+        covered = rows >= 0
+        prices[covered] = live_prices.min_prices()[rows[covered]]
+        
+        price_order = np.argsort(prices, kind='stable').astype('int64')
+        self._live_price_lookup[0] = (live_prices, price_order, prices[price_order])
+        return price_order, prices[price_order]
+    
+    def candidate_positions(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        live_prices=None
+    ) -> Optional[np.ndarray]:
+        """
+        Resolve filters into the sorted base-index positions that satisfy them
+        
+        With a delta, positions whose record changed since the lookups were
+        built are re-checked against the delta's own values.
+        
+        Args:
+            category: Tên category (case-insensitive)
+            min_price: Giá tối thiểu (theo MinPrice)
+            max_price: Giá tối đa (theo MinPrice)
+            live_prices: LiveStatsTable - lọc theo giá hiện tại thay vì giá trong snapshot
+            
+        Returns:
+            Sorted int64 array of positions, hoặc None nếu không có filter nào
+        """
+        candidates = None
+        
+        if category:
+            candidates = self.category_positions.get(
+                category.lower(), np.empty(0, dtype='int64')
+            )
+        
+        if min_price or max_price:
+            price_order, sorted_prices = self._price_lookup(live_prices)
+            lo = np.searchsorted(sorted_prices, min_price, side='left') if min_price else 0
+            hi = np.searchsorted(sorted_prices, max_price, side='right') if max_price else len(sorted_prices)
+            in_range = np.sort(price_order[lo:hi])
+            candidates = in_range if candidates is None else np.intersect1d(candidates, in_range, assume_unique=True)
+        
+        if candidates is not None and self.delta is not None:
+            candidates = self.delta.main_candidates(candidates, category, min_price, max_price, live_prices)
+        return candidates
+
+
+class IndexDelta:
+    def __init__(
+        self,
+        main: IndexSnapshot,
+        product_data: Dict,
+        ids: np.ndarray,
+        dead_ids: np.ndarray,
+        index=None,
+        lexical: Optional[BM25Index] = None
+    ):
+        """
+        Changes applied on top of a snapshot's main index since it was built
+        
+        Holds only the touched products, so publishing a change-feed batch
+        costs O(delta) instead of O(catalog): new/re-embedded vectors go to
+        a small flat index (and BM25 index), main-index vectors that became
+        stale are masked out at search time, and filter values of changed
+        records override the main lookups. Compaction folds it back.
+        
+        Args:
+            main: Snapshot có index chính
+            product_data: Product data hiện tại (CatalogOverlay)
+            ids: ProductIDs có record thay đổi kể từ index chính
+            dead_ids: ProductIDs có vector trong index chính đã cũ (xóa / text đổi)
+            index: IndexIDMap2(IndexFlatIP) với vector mới, None = không có
+            lexical: BM25 của các sản phẩm trong index (idf theo index chính)
+        """
+        self.ids = np.asarray(ids, dtype='int64')
+        self.dead_ids = np.asarray(dead_ids, dtype='int64')
+        self.index = index
+        self.lexical = lexical
+        self.size = len(np.union1d(self.ids, self.dead_ids))
+        
+        # position trong index delta → ProductID
+        self.vector_ids = (
+            faiss.vector_to_array(index.id_map).astype('int64') if index is not None
+            else np.empty(0, dtype='int64')
+        )
+        
+        # Vector trong index chính: đã cũ / còn dùng được cho record đã đổi
+        self.dead_positions = np.sort(main.positions_of(self.dead_ids))
+        main_positions = main.positions_of(self.ids)
+        main_positions[np.isin(self.ids, self.dead_ids)] = -1
+        self.main_positions = main_positions
+        self.stale_positions = np.union1d(self.dead_positions, main_positions[main_positions >= 0])
+        
+        self.delta_positions = _lookup_positions(self.vector_ids, np.argsort(self.vector_ids), self.ids)
+        
+        # Giá trị filter của record mới
+        records = [product_data[int(pid)] for pid in self.ids]
+        self.prices = np.array([_filter_price(p) for p in records], dtype='float64')
+        self.categories = np.array([(p.get('CategoryName') or '').lower() for p in records], dtype=object)
+    
+    def _matches(self, category: Optional[str], min_price: Optional[float], max_price: Optional[float], live_prices=None) -> np.ndarray:
+        """Mask trên self.ids, cùng điều kiện như IndexSnapshot.candidate_positions"""
+        mask = np.ones(len(self.ids), dtype='bool')
+        if category:
+            mask &= self.categories == category.lower()
+        
+        prices = self.prices
+        if (min_price or max_price) and live_prices is not None and len(live_prices):
+            rows = _lookup_positions(live_prices.product_ids, None, self.ids)
+            prices = np.where(rows >= 0, live_prices.min_prices()[np.maximum(rows, 0)], prices)
+        if min_price:
+            mask &= prices >= min_price
+        if max_price:
+            mask &= prices <= max_price
+        return mask
+    
+    def main_candidates(
+        self,
+        candidates: np.ndarray,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        live_prices=None
+    ) -> np.ndarray:
+        """Candidates của index chính: bỏ vị trí đã cũ, thêm record đã đổi nay khớp filter"""
+        keep = np.setdiff1d(candidates, self.stale_positions, assume_unique=True)
+        match = self._matches(category, min_price, max_price, live_prices) & (self.main_positions >= 0)
+        return np.union1d(keep, self.main_positions[match])
+    
+    def candidate_positions(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        live_prices=None
+    ) -> Optional[np.ndarray]:
+        """Vị trí trong index delta khớp filter (None = không có filter)"""
+        if not (category or min_price or max_price):
+            return None
+        match = self._matches(category, min_price, max_price, live_prices) & (self.delta_positions >= 0)
+        return np.sort(self.delta_positions[match])
+
+
 class EmbeddingsManager:
-    def __init__(self, model_name: str = 'sentence-transformers/all-MiniLM-L6-v2'):
+    INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_pq', 'hnsw')
+    # Phiên bản create_product_text: tăng khi đổi format → index đã lưu phải encode lại
+    # (1 = có giá / tồn kho trong text, 2 = chỉ thuộc tính mô tả)
+    TEXT_FORMAT = 2
+    SPEEDUP_SAMPLE_SIZE = 256  # Số text encode lại trong process để tính speedup
+    
+    def __init__(
+        self,
+        model_name: str = 'sentence-transformers/all-MiniLM-L6-v2',
+        query_cache_size: int = 1024,
+        index_type: str = 'flat',
+        nlist: int = 100,
+        nprobe: int = 10,
+        pq_m: int = 48,
+        hnsw_m: int = 32,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        micro_batching: bool = True,
+        batch_max_size: int = 32,
+        batch_max_wait_ms: float = 5.0,
+        mmap_index: bool = False,
+        encoder_backend: str = "torch",
+        onnx_model_dir: Optional[str] = None,
+        allow_unverified_onnx: bool = False,
+        encode_chunk_size: int = 1024,
+        encode_workers: int = 1,
+        delta_max_size: int = 2000
+    ):
         """
         Initialize embedding model
         
         Args:
             model_name: Sentence transformer model name
                        'all-MiniLM-L6-v2' - nhẹ, nhanh (384 dimensions)
+            query_cache_size: Số query vector tối đa giữ trong LRU cache (0 = tắt)
+            index_type: Loại FAISS index khi build:
+                       'flat'     - brute force, chính xác 100%
+                       'ivf_flat' - chia nlist cluster, chỉ quét nprobe cluster
+                       'ivf_pq'   - IVF + product quantization (nén vector, ít RAM)
+                       'hnsw'     - graph-based, nhanh nhất, không cần train
+            nlist: Số cluster cho IVF (tự giảm nếu catalog nhỏ)
+            nprobe: Số cluster quét mỗi query (IVF)
+            pq_m: Số sub-quantizer cho PQ (phải chia hết dimension)
+            hnsw_m: Số neighbor mỗi node (HNSW)
+            ef_construction: Độ rộng tìm kiếm khi build graph (HNSW)
+            ef_search: Độ rộng tìm kiếm khi query (HNSW)
+            micro_batching: Gom query đồng thời thành 1 batch encode
+            batch_max_size: Số query tối đa mỗi batch
+            batch_max_wait_ms: Thời gian tối đa chờ gom batch (ms)
+            mmap_index: Load index read-only qua mmap (chia sẻ page giữa các worker)
+            encoder_backend: 'torch' | 'onnx' | 'onnx_int8' (xem encoders.py)
+            onnx_model_dir: Thư mục model ONNX (mặc định models/<model>-onnx)
+            allow_unverified_onnx: Dùng model ONNX chưa verify / verify không đạt
+                                   (mặc định: load torch thay thế)
+            encode_chunk_size: Số sản phẩm encode + add vào index mỗi lượt khi build
+            encode_workers: Số process encode song song khi build (1 = trong process hiện tại)
+            delta_max_size: Số sản phẩm thay đổi giữ trong index delta trước khi
+                           gộp vào index chính (0 = gộp sau mỗi lần update)
         """
+        if index_type not in self.INDEX_TYPES:
+            raise ValueError(f"Unknown index_type '{index_type}', expected one of {self.INDEX_TYPES}")
+        
         self.model_name = model_name
         self.model = None
-        self.index = None
-        self.product_data = []
+        self.encoder_backend = encoder_backend
+        self.onnx_model_dir = onnx_model_dir
+        self.allow_unverified_onnx = allow_unverified_onnx
+        self.encode_chunk_size = encode_chunk_size
+        self.encode_workers = encode_workers
+        self.delta_max_size = delta_max_size
+        self.last_build_stats = {}  # Timing của lần build_index gần nhất
         self.dimension = 384  # Dimension của all-MiniLM-L6-v2
+        self.query_cache = LRUCache(max_entries=query_cache_size)
+        
+        # Index + product data hiện tại, thay bằng 1 phép gán duy nhất
+        self._snapshot = IndexSnapshot(None, {}, {}, version=0)
+        self._write_lock = threading.RLock()  # Chỉ 1 build/update tại một thời điểm
+        self._file_locks = {}  # filepath → FileLock (giữa các worker process)
+        
+        # ANN index configuration
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        
+        # Micro-batching cho query encode (start trong load_model)
+        self.micro_batching = micro_batching
+        self.batcher = BatchingEncoder(
+            encode_fn=self._encode_normalized,
+            max_batch_size=batch_max_size,
+            max_wait_ms=batch_max_wait_ms
+        )
+        
+        self.mmap_index = mmap_index
+        self._loaded_files = None  # (path, generation) của manifest đã load / lưu gần nhất
+    
+    # ===== SNAPSHOT ACCESS =====
+    
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        return self._snapshot
+    
+    @property
+    def index(self):
+        """Index hiện tại, search trả về ProductID (IndexIDMap2 hoặc IVF add_with_ids)"""
+        return self._snapshot.index
+    
+    @property
+    def product_data(self) -> Dict:
+        """ProductID → product dict (CatalogStore khi load từ file .catalog)"""
+        return self._snapshot.product_data
+    
+    @property
+    def content_hashes(self) -> Dict:
+        """ProductID → hash của create_product_text"""
+        return self._snapshot.content_hashes
+    
+    @property
+    def text_format_stale(self) -> bool:
+        """True nếu index hiện tại được embed với create_product_text cũ (cần rebuild)"""
+        snapshot = self._snapshot
+        return snapshot.index is not None and snapshot.text_format != self.TEXT_FORMAT
+    
+    @property
+    def index_version(self) -> int:
+        """Tăng mỗi khi index được build/load/update"""
+        return self._snapshot.version
+    
+    def _publish(
+        self,
+        index,
+        product_data: Dict,
+        content_hashes: Dict,
+        mmap_path: Optional[str] = None,
+        lexical: Optional[BM25Index] = None,
+        text_format: Optional[int] = None
+    ):
+        """
+        Atomically replace the live snapshot
+        
+        The new index must be fully built before this call; searches that
+        already hold the old snapshot finish on it undisturbed. The BM25
+        index is rebuilt from product_data unless one is passed in.
+        text_format defaults to TEXT_FORMAT, i.e. freshly encoded vectors.
+        """
+        self._apply_search_params(index)
+        if lexical is None:
+            lexical = self._build_lexical(product_data)
+        
+        self._snapshot = IndexSnapshot(
+            index, product_data, content_hashes,
+            version=self._snapshot.version + 1,
+            mmap_path=mmap_path,
+            lexical=lexical,
+            text_format=self.TEXT_FORMAT if text_format is None else text_format
+        )
+    
+    def _build_lexical(self, product_data: Dict, texts: Optional[List[str]] = None) -> BM25Index:
+        """BM25 index từ create_product_text của mọi sản phẩm"""
+        if texts is None:
+            texts = [self.create_product_text(p) for p in product_data.values()]
+        return BM25Index().build(product_data.keys(), texts)
         
     def load_model(self):
-        """Load sentence transformer model"""
+        """Load embedding model với backend đã cấu hình (torch / ONNX)"""
         try:
-            logger.info(f"Loading model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
+            logger.info(f"Loading model: {self.model_name} ({self.encoder_backend})")
+            # Import nặng (torch / onnxruntime) chỉ khi thật sự load model
+            self.model = create_encoder(
+                self.encoder_backend, self.model_name, self.onnx_model_dir,
+                allow_unverified=self.allow_unverified_onnx
+            )
+            # ONNX không đạt verify → torch; build song song dùng cùng backend
+            self.encoder_backend = getattr(self.model, "variant", "torch")
+            self.query_cache.clear()  # Vector cũ không còn hợp lệ với model mới
             logger.info("✅ Model loaded successfully")
+            
+            if self.micro_batching:
+                self.batcher.start()
             return True
         except Exception as e:
             logger.error(f"❌ Failed to load model: {e}")
             return False
     
+    def warm_up(self) -> bool:
+        """
+        Run a throwaway encode + search so the first real query is fast
+        
+        Pays one-time allocation/kernel-selection costs up front, without
+        touching the query cache or batcher stats.
+        """
+        if not self.model:
+            return False
+        
+        try:
+            start = time.perf_counter()
+            vectors = self._encode_normalized(["nhẫn kim cương", "gold necklace for a wedding gift"])
+            
+            snapshot = self._snapshot
+            if snapshot.index is not None:
+                snapshot.index.search(vectors, 1)
+            
+            logger.info(f"✅ Warm-up done in {(time.perf_counter() - start) * 1000:.0f}ms")
+            return True
+        except Exception as e:
+            logger.error(f"❌ Warm-up failed: {e}")
+            return False
+    
+    def close(self):
+        """Stop background workers (called on FastAPI shutdown)"""
+        self.batcher.stop()
+    
+    def _encode_normalized(self, texts: List[str]) -> np.ndarray:
+        """Encode list text → L2-normalized float32 matrix"""
+        embeddings = self.model.encode(texts, convert_to_numpy=True).astype('float32')
+        faiss.normalize_L2(embeddings)
+        return embeddings
+    
     def create_product_text(self, product: Dict) -> str:
         """
         Tạo text representation của sản phẩm cho embedding
         
+        Only stable descriptive attributes are embedded. Price, stock and
+        rating change all the time; they live in LiveStats and are joined
+        in at answer time, so they never force a re-encode.
+        
         Args:
             product: Product dictionary from database
             
@@ -60,39 +681,128 @@ class EmbeddingsManager:
         if product.get('Description'):
             parts.append(f"Description: {product['Description']}")
         
-        # Giá
-        min_price = product.get('MinPrice', product.get('BasePrice', 0))
-        max_price = product.get('MaxPrice', product.get('BasePrice', 0))
-        
-        if min_price == max_price:
-            parts.append(f"Price: {min_price:,.0f} VND")
-        else:
-            parts.append(f"Price range: {min_price:,.0f} - {max_price:,.0f} VND")
-        
         # Metals available
         if product.get('AvailableMetals'):
             parts.append(f"Materials: {product['AvailableMetals']}")
         
-        # Stock status
-        total_stock = product.get('TotalStock', 0)
-        if total_stock > 0:
-            parts.append("In stock")
+        return " | ".join(parts)
+    
+    def content_hash(self, product: Dict) -> str:
+        """Hash của text được embed - đổi hash = cần embed lại"""
+        return hashlib.sha1(self.create_product_text(product).encode('utf-8')).hexdigest()
+    
+    def candidate_positions(
+        self,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        live_prices=None
+    ) -> Optional[np.ndarray]:
+        """Resolve filters on the current snapshot (xem IndexSnapshot.candidate_positions)"""
+        return self._snapshot.candidate_positions(category, min_price, max_price, live_prices)
+    
+    def create_index(self, embeddings: np.ndarray) -> "faiss.Index":
+        """
+        Index factory: tạo (và train nếu cần) index theo self.index_type
+        
+        All types use inner product, i.e. cosine similarity on normalized
+        vectors. The embeddings are only used for training, not added.
+        
+        Args:
+            embeddings: Normalized float32 matrix (n, dimension)
+            
+        Returns:
+            Empty, trained FAISS index
+        """
+        n = len(embeddings)
+        index_type = self.index_type
+        
+        # PQ cần ít nhất 256 điểm để train codebook 8-bit
+        if index_type == 'ivf_pq' and n < 256:
+            logger.warning(f"⚠️  {n} vectors is too few to train IVF-PQ, falling back to flat")
+            index_type = 'flat'
+        
+        if index_type == 'flat':
+            return faiss.IndexFlatIP(self.dimension)
+        
+        if index_type == 'hnsw':
+            index = faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = self.ef_construction
+            index.hnsw.efSearch = self.ef_search
+            return index
+        
+        # IVF: faiss khuyến nghị >= 39 điểm train mỗi cluster
+        nlist = max(1, min(self.nlist, n // 39))
+        if nlist != self.nlist:
+            logger.info(f"Using nlist={nlist} (requested {self.nlist}) for {n} vectors")
+        
+        quantizer = faiss.IndexFlatIP(self.dimension)
+        if index_type == 'ivf_flat':
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
         else:
-            parts.append("Out of stock")
+            index = faiss.IndexIVFPQ(quantizer, self.dimension, nlist, self.pq_m, 8, faiss.METRIC_INNER_PRODUCT)
         
-        # Reviews
-        if product.get('ReviewCount', 0) > 0:
-            avg_rating = product.get('AvgRating', 0)
-            parts.append(f"Rating: {avg_rating:.1f}/5 ({product['ReviewCount']} reviews)")
+        logger.info(f"Training {index_type} index (nlist={nlist})...")
+        index.train(embeddings)
+        index.nprobe = min(self.nprobe, nlist)
+        return index
+    
+    @staticmethod
+    def _base_index(index) -> "faiss.Index":
+        """Index thật bên dưới IndexIDMap2 (đã downcast)"""
+        index = faiss.downcast_index(index)
+        if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+            index = faiss.downcast_index(index.index)
+        return index
+    
+    def _apply_search_params(self, index):
+        """Set nprobe / efSearch trên index (sau build hoặc load)"""
+        try:
+            faiss.extract_index_ivf(index).nprobe = self.nprobe
+        except RuntimeError:
+            pass  # Không phải IVF index
         
-        return " | ".join(parts)
+        base = self._base_index(index)
+        if isinstance(base, faiss.IndexHNSW):
+            base.hnsw.efSearch = self.ef_search
+    
+    def _search_params(self, index, selector, exhaustive: bool = False):
+        """
+        SearchParameters mang ID selector, đúng loại cho index
+        
+        Args:
+            index: Index sẽ được search
+            selector: faiss.IDSelector
+            exhaustive: Quét toàn bộ cluster/graph rộng nhất (dùng khi filter
+                        quá hẹp khiến lần search đầu không đủ kết quả)
+        """
+        try:
+            ivf = faiss.extract_index_ivf(index)
+            nprobe = ivf.nlist if exhaustive else self.nprobe
+            return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+        except RuntimeError:
+            pass
+        
+        if isinstance(self._base_index(index), faiss.IndexHNSW):
+            ef_search = max(self.ef_search, index.ntotal) if exhaustive else self.ef_search
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+        
+        return faiss.SearchParameters(sel=selector)
     
-    def build_index(self, products: List[Dict]) -> bool:
+    @traced()
+    def build_index(self, products: Iterable[Dict], encode_workers: Optional[int] = None) -> bool:
         """
         Build FAISS index from product data
         
+        Products may be a list or a generator (e.g. DatabaseConnector.
+        iter_products): they are consumed in chunks of encode_chunk_size, so
+        texts and embedding matrices never exist for the whole catalog.
+        With more than one encode worker each chunk is split across a
+        process pool (ParallelEncoder); timings land in last_build_stats.
+        
         Args:
-            products: List of product dictionaries
+            products: List/iterable of product dictionaries
+            encode_workers: Override self.encode_workers cho lần build này
             
         Returns:
             Success status
@@ -101,129 +811,899 @@ class EmbeddingsManager:
             logger.error("Model not loaded. Call load_model() first.")
             return False
         
-        if not products:
+        if isinstance(products, list) and not products:
             logger.error("No products provided")
             return False
         
+        workers = encode_workers or self.encode_workers
+        
         try:
-            logger.info(f"Building index for {len(products)} products...")
+            with self._write_lock:
+                if workers > 1:
+                    with ParallelEncoder(
+                        self.encoder_backend, self.model_name, self.onnx_model_dir, workers=workers,
+                        allow_unverified_onnx=self.allow_unverified_onnx
+                    ) as encoder:
+                        self._build_and_publish(products, encoder)
+                else:
+                    self._build_and_publish(products, self.model)
+            
+            current_span().set_attribute("build_stats", self.last_build_stats)
+            logger.info(f"✅ Index built successfully with {self.index.ntotal} vectors")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Failed to build index: {e}")
+            return False
+    
+    def _training_size(self) -> int:
+        """Số vector cần gom trước khi tạo index (IVF phải train trước khi add)"""
+        if self.index_type == 'ivf_flat':
+            return self.nlist * 39
+        if self.index_type == 'ivf_pq':
+            return max(self.nlist * 39, 256)
+        return 0
+    
+    def _build_and_publish(self, products: Iterable[Dict], encoder=None):
+        """
+        Build a fresh index + data snapshot off to the side, then swap it in
+        
+        Streaming pipeline: each chunk of products is turned into texts,
+        encoded and added to the index before the next chunk is read. IVF
+        types buffer only the first chunks they need for training.
+        Searches keep using the previous snapshot until the final assignment.
+        
+        Args:
+            products: List/iterable of product dictionaries
+            encoder: ParallelEncoder (mặc định self.model)
+        """
+        encoder = encoder or self.model
+        logger.info(f"Building index ({self.index_type}) in chunks of {self.encode_chunk_size} products...")
+        build_start = time.perf_counter()
+        encode_s = 0.0
+        sample_texts = []  # Mẫu text để đo throughput 1 process (so sánh speedup)
+        
+        index = None
+        pending = []  # (embeddings, ids) chờ train IVF
+        training_size = self._training_size()
+        
+        product_data, content_hashes = {}, {}
+        lexical = BM25Index()
+        
+        iterator = iter(products)
+        while True:
+            chunk = list(itertools.islice(iterator, self.encode_chunk_size))
+            if not chunk:
+                break
             
             # Tạo text cho mỗi product
-            texts = [self.create_product_text(p) for p in products]
-            
-            # Generate embeddings
-            logger.info("Generating embeddings...")
-            embeddings = self.model.encode(
-                texts, 
-                show_progress_bar=True,
-                convert_to_numpy=True
-            )
+            texts = [self.create_product_text(p) for p in chunk]
+            ids = np.array([p['ProductID'] for p in chunk], dtype='int64')
             
-            # Normalize embeddings (để dùng inner product = cosine similarity)
+            # Generate + normalize embeddings (inner product = cosine similarity)
+            encode_start = time.perf_counter()
+            embeddings = encoder.encode(texts, convert_to_numpy=True).astype('float32')
+            encode_s += time.perf_counter() - encode_start
             faiss.normalize_L2(embeddings)
             
-            # Build FAISS index
-            logger.info("Building FAISS index...")
-            self.index = faiss.IndexFlatIP(self.dimension)  # Inner Product = Cosine sim với normalized vectors
-            self.index.add(embeddings)
+            if not sample_texts:
+                sample_texts = texts[:self.SPEEDUP_SAMPLE_SIZE]
             
-            # Store product data
-            self.product_data = products
+            for product, text in zip(chunk, texts):
+                pid = product['ProductID']
+                product_data[pid] = product
+                content_hashes[pid] = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                lexical.add_document(pid, text)
             
-            logger.info(f"✅ Index built successfully with {self.index.ntotal} vectors")
-            return True
+            # Add vào FAISS, id = ProductID để update/delete từng sản phẩm
+            if index is not None:
+                index.add_with_ids(embeddings, ids)
+            else:
+                pending.append((embeddings, ids))
+                if sum(len(e) for e, _ in pending) >= training_size:
+                    index = self._index_from_pending(pending)
+                    pending = []
             
-        except Exception as e:
-            logger.error(f"❌ Failed to build index: {e}")
+            logger.info(f"Embedded {len(product_data)} products...")
+        
+        if not product_data:
+            raise ValueError("No products provided")
+        
+        if index is None:
+            # Catalog nhỏ hơn training_size → train trên toàn bộ
+            index = self._index_from_pending(pending)
+        
+        # Publish index + product data + BM25 cùng lúc
+        with span("publish", products=len(product_data)):
+            self._publish(
+                index,
+                product_data=product_data,
+                content_hashes=content_hashes,
+                lexical=lexical.finalize()
+            )
+        
+        self.last_build_stats = self._build_stats(
+            encoder, len(product_data), encode_s, time.perf_counter() - build_start, sample_texts
+        )
+    
+    def _build_stats(self, encoder, products: int, encode_s: float, total_s: float, sample_texts: List[str]) -> Dict:
+        """
+        Timing của 1 lần build; với ParallelEncoder thì so throughput encode
+        với model trong process hiện tại trên 1 mẫu text (speedup per worker)
+        """
+        stats = {
+            "products": products,
+            "workers": 1,
+            "encode_s": round(encode_s, 2),
+            "total_s": round(total_s, 2),
+            "texts_per_s": round(products / encode_s, 1) if encode_s else None
+        }
+        
+        if isinstance(encoder, ParallelEncoder) and stats["texts_per_s"] and sample_texts:
+            self.model.encode(sample_texts[:8], convert_to_numpy=True)  # warm-up, không tính giờ
+            start = time.perf_counter()
+            self.model.encode(sample_texts, convert_to_numpy=True)
+            baseline = len(sample_texts) / max(time.perf_counter() - start, 1e-9)
+            speedup = stats["texts_per_s"] / baseline
+            
+            stats.update(
+                workers=encoder.workers,
+                threads_per_worker=encoder.threads_per_worker,
+                pool_startup_s=round(encoder.startup_s, 2),
+                baseline_texts_per_s=round(baseline, 1),
+                speedup=round(speedup, 2),
+                speedup_per_worker=round(speedup / encoder.workers, 2)
+            )
+            logger.info(
+                f"⏱️  Encoded {products} texts in {encode_s:.1f}s on {encoder.workers} workers "
+                f"({stats['texts_per_s']:.0f} texts/s vs {baseline:.0f} texts/s single-process: "
+                f"{speedup:.2f}x, {speedup / encoder.workers:.2f}x per worker)"
+            )
+        else:
+            logger.info(f"⏱️  Encoded {products} texts in {encode_s:.1f}s ({stats['texts_per_s'] or 0:.0f} texts/s)")
+        
+        return stats
+    
+    def _index_from_pending(self, pending: List[Tuple[np.ndarray, np.ndarray]]):
+        """
+        Tạo (train) index từ các chunk đã buffer rồi add chúng vào
+        
+        IVF lists store the ProductIDs passed to add_with_ids, so IVF is used
+        unwrapped: IndexIDMap2 assumes remove_ids compacts the base index like
+        flat does, but IVF keeps its internal ids and the id_map drifts out of
+        step. Flat/HNSW only assign sequential ids and need the wrapper.
+        """
+        embeddings = np.concatenate([e for e, _ in pending])
+        ids = np.concatenate([i for _, i in pending])
+        
+        index = self.create_index(embeddings)
+        if not self._is_ivf(index):
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, ids)
+        return index
+    
+    @staticmethod
+    def _is_ivf(index) -> bool:
+        try:
+            faiss.extract_index_ivf(index)
+            return True
+        except RuntimeError:
+            return False
+    
+    @staticmethod
+    def _is_mmapped(index) -> bool:
+        """True nếu inverted lists của IVF index đang được mmap từ file"""
+        base = faiss.downcast_index(EmbeddingsManager._base_index(index))
+        if not hasattr(base, 'invlists'):
             return False
+        return isinstance(faiss.downcast_InvertedLists(base.invlists), faiss.OnDiskInvertedLists)
+    
+    def _writable_copy(self, snapshot: IndexSnapshot):
+        """
+        In-memory copy of the snapshot's index that is safe to mutate
+        
+        Mmap'd inverted lists are read-only and cannot be cloned, so the
+        index file is re-read into RAM instead. Generation files are never
+        rewritten, so the file still holds exactly the snapshot's vectors.
+        """
+        if not snapshot.mmap_path:
+            return faiss.clone_index(snapshot.index)
+        return faiss.read_index(snapshot.mmap_path)
+    
+    def upsert_products(self, products: List[Dict]) -> Dict[str, int]:
+        """
+        Insert or update products, re-embedding only those whose text changed
+        
+        A product is re-encoded only when the hash of create_product_text()
+        differs from the indexed one; other fields (e.g. image URL) are
+        refreshed without touching the vectors.
+        
+        Args:
+            products: Product dictionaries (same shape as get_all_products)
+            
+        Returns:
+            Counters {"added", "updated", "unchanged"}
+        """
+        return self.apply_changes(upserts=products, removed_ids=[])
     
+    def remove_products(self, product_ids: List[int]) -> int:
+        """
+        Remove products (deleted / deactivated) from the index
+        
+        Returns:
+            Số sản phẩm thực sự bị xóa
+        """
+        return self.apply_changes(upserts=[], removed_ids=product_ids)['removed']
+    
+    @traced()
+    def sync_products(self, products: List[Dict]) -> Dict[str, int]:
+        """
+        Sync index với danh sách sản phẩm active hiện tại từ database
+        
+        Products missing from the list are removed, changed ones are
+        re-embedded, unchanged ones are skipped.
+        
+        Args:
+            products: Full list of active products
+            
+        Returns:
+            Counters {"added", "updated", "unchanged", "removed"}
+        """
+        with self._write_lock:
+            incoming = {p['ProductID'] for p in products}
+            removed_ids = [pid for pid in self.product_data if pid not in incoming]
+            return self.apply_changes(upserts=products, removed_ids=removed_ids)
+    
+    @traced()
+    def apply_changes(self, upserts: List[Dict], removed_ids: List[int]) -> Dict[str, int]:
+        """
+        Apply upserts and removals, then publish a new snapshot
+        
+        Only the changed products are touched: they go to the snapshot's
+        IndexDelta and a CatalogOverlay over the current product data. Once
+        the delta holds more than delta_max_size products it is compacted
+        into a new main index.
+        
+        Args:
+            upserts: Products to insert/update
+            removed_ids: ProductIDs to delete
+            
+        Returns:
+            Counters {"added", "updated", "unchanged", "removed"}
+        """
+        with self._write_lock:
+            return self._apply_changes(upserts, removed_ids)
+    
+    def _apply_changes(self, upserts: List[Dict], removed_ids: List[int]) -> Dict[str, int]:
+        counts = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0}
+        snapshot = self._snapshot
+        
+        if not self.model:
+            raise RuntimeError("Model not loaded. Call load_model() first.")
+        
+        if snapshot.index is None:
+            # Chưa có index → build lần đầu: bản cuối của mỗi ProductID,
+            # bỏ sản phẩm bị xóa trong cùng batch (như nhánh delta bên dưới)
+            removed = set(removed_ids)
+            products = {p['ProductID']: p for p in upserts if p['ProductID'] not in removed}
+            if products:
+                self._build_and_publish(list(products.values()))
+                counts["added"] = len(products)
+            return counts
+        
+        # Overlay chỉ chứa record thay đổi; catalog mmap bên dưới giữ nguyên
+        product_data = CatalogOverlay.of(snapshot.product_data)
+        content_hashes = CatalogOverlay.of(snapshot.content_hashes)
+        
+        # 1. Tìm sản phẩm có text thay đổi
+        records, hashes, texts = {}, {}, {}
+        for product in upserts:
+            pid = product['ProductID']
+            text = self.create_product_text(product)
+            digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            
+            if pid not in product_data:
+                counts["added"] += 1
+            elif content_hashes.get(pid) != digest:
+                counts["updated"] += 1
+            else:
+                counts["unchanged"] += 1
+                if product_data[pid] != product:
+                    records[pid] = product  # Field không embed (ảnh...) vẫn cập nhật
+                continue
+            
+            records[pid] = product
+            hashes[pid] = digest
+            texts[pid] = text
+        
+        removed = [pid for pid in set(removed_ids) if pid in product_data or pid in records]
+        for pid in removed:
+            records.pop(pid, None)
+            hashes.pop(pid, None)
+            texts.pop(pid, None)
+        counts["removed"] = len(removed)
+        
+        if not records and not removed:
+            return counts
+        
+        product_data = product_data.apply(records, removed)
+        content_hashes = content_hashes.apply(hashes, removed)
+        if not len(product_data):
+            raise RuntimeError("Refusing to remove every product from the index")
+        
+        # 2. Chỉ encode sản phẩm có text mới
+        embeddings = np.empty((0, self.dimension), dtype='float32')
+        if texts:
+            logger.info(f"Embedding {len(texts)} changed products...")
+            embeddings = self.model.encode(list(texts.values()), convert_to_numpy=True).astype('float32')
+            faiss.normalize_L2(embeddings)
+        
+        # 3. Delta mới = delta cũ + thay đổi lần này (index chính không đổi)
+        delta = self._next_delta(
+            snapshot, product_data,
+            changed_ids=np.fromiter(texts, dtype='int64', count=len(texts)),
+            embeddings=embeddings,
+            touched_ids=np.array(list(records) + removed, dtype='int64'),
+            removed_ids=np.array(removed, dtype='int64')
+        )
+        
+        if delta.size > self.delta_max_size:
+            self._compact(snapshot, delta, product_data, content_hashes)
+        else:
+            self._snapshot = snapshot.with_delta(delta, product_data, content_hashes, snapshot.version + 1)
+        
+        logger.info(f"✅ Index updated: {counts} → {len(product_data)} products ({delta.size} pending in delta)")
+        return counts
+    
+    def _next_delta(
+        self,
+        snapshot: IndexSnapshot,
+        product_data: Dict,
+        changed_ids: np.ndarray,
+        embeddings: np.ndarray,
+        touched_ids: np.ndarray,
+        removed_ids: np.ndarray
+    ) -> IndexDelta:
+        """
+        Build the snapshot's next IndexDelta: O(delta), not O(catalog)
+        
+        Args:
+            snapshot: Snapshot hiện tại (index chính + delta cũ)
+            product_data: Product data sau thay đổi
+            changed_ids: ProductIDs vừa encode lại (thứ tự của embeddings)
+            embeddings: Vector mới, normalized
+            touched_ids: ProductIDs có record thay đổi hoặc bị xóa lần này
+            removed_ids: ProductIDs bị xóa lần này
+        """
+        old = snapshot.delta
+        old_ids = old.ids if old is not None else np.empty(0, dtype='int64')
+        old_dead = old.dead_ids if old is not None else np.empty(0, dtype='int64')
+        
+        # Vector cũ trong index chính của sản phẩm vừa encode lại / bị xóa
+        replaced = np.union1d(changed_ids, removed_ids)
+        dead_ids = np.union1d(old_dead, replaced[snapshot.positions_of(replaced) >= 0])
+        ids = np.union1d(np.setdiff1d(old_ids, removed_ids), np.setdiff1d(touched_ids, removed_ids))
+        
+        # Vector của delta: giữ vector cũ chưa bị thay, thêm vector mới
+        vectors, vector_ids = self._delta_vectors(old)
+        keep = ~np.isin(vector_ids, replaced)
+        vectors = np.concatenate([vectors[keep], embeddings])
+        vector_ids = np.concatenate([vector_ids[keep], changed_ids])
+        
+        index, lexical = None, None
+        if len(vector_ids):
+            index = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+            index.add_with_ids(vectors, vector_ids)
+            
+            # BM25 delta chấm điểm theo idf của index chính → merge kết quả được
+            lexical = BM25Index()
+            for pid in vector_ids.tolist():
+                lexical.add_document(pid, self.create_product_text(product_data[pid]))
+            lexical = lexical.finalize(corpus=snapshot.lexical)
+        
+        return IndexDelta(snapshot, product_data, ids, dead_ids, index=index, lexical=lexical)
+    
+    def _delta_vectors(self, delta: Optional[IndexDelta]) -> Tuple[np.ndarray, np.ndarray]:
+        """(vectors, ProductIDs) đang nằm trong index delta"""
+        if delta is None or delta.index is None:
+            return np.empty((0, self.dimension), dtype='float32'), np.empty(0, dtype='int64')
+        return delta.index.index.reconstruct_n(0, delta.index.ntotal), delta.vector_ids
+    
+    def compact(self) -> bool:
+        """
+        Gộp index delta vào index chính (save_index gọi trước khi ghi file)
+        
+        Returns:
+            True nếu có delta để gộp
+        """
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot.delta is None:
+                return False
+            self._compact(snapshot, snapshot.delta, snapshot.product_data, snapshot.content_hashes)
+            return True
+    
+    @traced()
+    def _compact(self, snapshot: IndexSnapshot, delta: IndexDelta, product_data: Dict, content_hashes: Dict):
+        """
+        Publish a new main index = main - stale vectors + delta vectors
+        
+        Reuses stored vectors, so nothing is re-encoded. BM25 postings are
+        merged, not re-tokenized.
+        A mmap'd catalog stays the overlay's base; in-memory data is folded
+        into a plain dict.
+        """
+        product_data, content_hashes = self._folded(product_data), self._folded(content_hashes)
+        vectors, vector_ids = self._delta_vectors(delta)
+        base = self._base_index(snapshot.index)
+        
+        if isinstance(base, faiss.IndexHNSW):
+            # HNSW không xóa được → build graph mới từ vector đã lưu
+            keep = np.setdiff1d(np.arange(base.ntotal), delta.dead_positions, assume_unique=True)
+            main_vectors = base.reconstruct_n(0, base.ntotal)[keep]
+            index = self._index_from_pending([(main_vectors, snapshot.id_map[keep]), (vectors, vector_ids)])
+        else:
+            index = self._writable_copy(snapshot)
+            if len(delta.dead_ids):
+                index.remove_ids(faiss.IDSelectorBatch(delta.dead_ids))
+            index.add_with_ids(vectors, vector_ids)
+        
+        lexical = None
+        if snapshot.lexical is not None:
+            lexical = snapshot.lexical.merged(delta.dead_ids, delta.lexical)
+        
+        self._publish(index, product_data, content_hashes, lexical=lexical, text_format=snapshot.text_format)
+        logger.info(f"✅ Delta of {delta.size} products compacted → {index.ntotal} vectors")
+    
+    @staticmethod
+    def _folded(data: Dict) -> Dict:
+        """Overlay trên catalog mmap giữ nguyên (page dùng chung); overlay trên dict → dict"""
+        if isinstance(data, CatalogOverlay) and not isinstance(data.base, (CatalogStore, CatalogHashes)):
+            return dict(data)
+        return data
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        Chuẩn hóa query làm cache key: Unicode NFC, lowercase, gộp whitespace
+        
+        "  Nhẫn  Cưới " và "nhẫn cưới" (kể cả dạng NFD) cho cùng một key.
+        """
+        query = unicodedata.normalize('NFC', query)
+        return " ".join(query.casefold().split())
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """
+        Encode a search query into a normalized vector, using the LRU cache
+        
+        Repeated queries skip the transformer forward pass entirely.
+        
+        Args:
+            query: User search query
+            
+        Returns:
+            Read-only float32 array of shape (1, dimension)
+        """
+        key = self.normalize_query(query)
+        
+        cached = self.query_cache.get(key)
+        current_span().set_attribute("query_cache_hit", cached is not None)
+        if cached is not None:
+            return cached
+        
+        with span("encode", micro_batching=self.micro_batching), STAGE_SECONDS.time(stage="encode"):
+            if self.micro_batching:
+                # Chờ batch chung với các request đồng thời
+                embedding = self.batcher.encode(key)[np.newaxis, :]
+            else:
+                embedding = self._encode_normalized([key])
+        embedding.flags.writeable = False  # Shared giữa các request, không cho sửa
+        
+        self.query_cache.put(key, embedding)
+        return embedding
+    
+    @traced()
     def search(
         self, 
         query: str, 
         top_k: int = 5,
-        min_score: float = 0.3
+        min_score: float = 0.3,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        live_prices=None
     ) -> List[Tuple[Dict, float]]:
         """
         Search similar products using query
         
+        Filters are applied inside FAISS through an ID selector, so a single
+        search pass returns top_k matches whenever enough exist.
+        
         Args:
             query: User search query
             top_k: Number of results to return
             min_score: Minimum similarity score (0-1)
+            category: Lọc theo tên category (optional)
+            min_price: Giá tối thiểu (optional)
+            max_price: Giá tối đa (optional)
+            live_prices: LiveStatsTable - lọc giá theo giá hiện tại (optional)
             
         Returns:
             List of (product_dict, similarity_score) tuples
         """
-        if not self.index:
+        # Đọc snapshot 1 lần: index, product data và lookups luôn khớp nhau
+        snapshot = self._snapshot
+        
+        if not snapshot.index:
             logger.error("Index not built. Call build_index() first.")
             return []
         
         try:
-            # Generate query embedding
-            query_embedding = self.model.encode([query], convert_to_numpy=True)
-            faiss.normalize_L2(query_embedding)
+            # Generate query embedding (cached)
+            query_embedding = self.encode_query(query)
             
-            # Search
-            scores, indices = self.index.search(query_embedding, top_k)
+            # Pre-filter: chỉ search trong candidate set
+            delta = snapshot.delta
+            with span("filter") as filter_span, STAGE_SECONDS.time(stage="filter"):
+                candidates = snapshot.candidate_positions(category, min_price, max_price, live_prices)
+                delta_candidates = delta.candidate_positions(category, min_price, max_price, live_prices) if delta else None
+                filter_span.set_attribute("candidates", None if candidates is None else len(candidates))
+            
+            if candidates is not None and len(candidates) == 0 and (delta is None or len(delta_candidates) == 0):
+                logger.info("No products match the filters")
+                return []
+            
+            with span("faiss_search", top_k=top_k), STAGE_SECONDS.time(stage="faiss_search"):
+                hits = self._search_main(snapshot, query_embedding, top_k, candidates)
+                if delta is not None and delta.index is not None:
+                    # Sản phẩm mới / text đã đổi nằm trong index delta
+                    hits = sorted(
+                        hits + self._search_delta(delta, query_embedding, top_k, delta_candidates),
+                        key=lambda hit: hit[1], reverse=True
+                    )[:top_k]
             
             # Filter by min_score và return kết quả
-            results = []
-            for score, idx in zip(scores[0], indices[0]):
-                if score >= min_score:
-                    results.append((self.product_data[idx], float(score)))
+            results = [
+                (snapshot.product_data[product_id], score)
+                for product_id, score in hits if score >= min_score
+            ]
             
+            current_span().set_attribute("results", len(results))
             logger.info(f"Found {len(results)} products matching query (score >= {min_score})")
             return results
             
         except Exception as e:
             logger.error(f"❌ Search failed: {e}")
+            current_span().record_error(e)
+            return []
+    
+    def _search_main(
+        self,
+        snapshot: IndexSnapshot,
+        query_embedding: np.ndarray,
+        k: int,
+        candidates: Optional[np.ndarray]
+    ) -> List[Tuple[int, float]]:
+        """
+        Search index chính trong candidates → [(ProductID, score)]
+        
+        Without filters, vectors made stale by the delta are masked out
+        with an IDSelectorNot instead (candidates already exclude them).
+        """
+        dead = snapshot.delta.dead_positions if snapshot.delta is not None else None
+        
+        if candidates is not None and not len(candidates):
             return []
+        if candidates is None and (dead is None or not len(dead)):
+            # Search (IDMap trả về ProductID)
+            scores, product_ids = snapshot.index.search(query_embedding, k)
+        else:
+            if candidates is None:
+                positions = dead
+            else:
+                positions = candidates
+                k = min(k, len(candidates))
+            
+            if snapshot.native_ids:
+                # IVF lưu ProductID → selector theo ProductID
+                index, selected = snapshot.index, faiss.IDSelectorBatch(snapshot.id_map[positions])
+            else:
+                # IndexIDMap2 không nhận SearchParameters → search base index
+                # theo vị trí rồi map vị trí → ProductID
+                index, selected = snapshot.index.index, faiss.IDSelectorBatch(positions)
+            selector = selected if candidates is not None else faiss.IDSelectorNot(selected)
+            
+            scores, labels = self._filtered_search(index, selector, query_embedding, k)
+            product_ids = labels if snapshot.native_ids else np.where(labels >= 0, snapshot.id_map[labels], -1)
+        
+        return [
+            (int(product_id), float(score))
+            for score, product_id in zip(scores[0], product_ids[0]) if product_id >= 0
+        ]
     
+    def _search_delta(
+        self,
+        delta: IndexDelta,
+        query_embedding: np.ndarray,
+        k: int,
+        candidates: Optional[np.ndarray]
+    ) -> List[Tuple[int, float]]:
+        """Search index delta (flat, nhỏ) → [(ProductID, score)]"""
+        if candidates is None:
+            scores, labels = delta.index.index.search(query_embedding, min(k, delta.index.ntotal))
+        elif len(candidates):
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(candidates))
+            scores, labels = delta.index.index.search(query_embedding, min(k, len(candidates)), params=params)
+        else:
+            return []
+        
+        return [
+            (int(delta.vector_ids[label]), float(score))
+            for score, label in zip(scores[0], labels[0]) if label >= 0
+        ]
+    
+    def _filtered_search(self, index, selector, query_embedding: np.ndarray, k: int):
+        """Search với ID selector; nếu thiếu kết quả thì quét lại toàn bộ"""
+        scores, labels = index.search(query_embedding, k, params=self._search_params(index, selector))
+        
+        # ANN index (IVF/HNSW) + filter hẹp: candidates có thể nằm ngoài
+        # vùng đã quét → search lại toàn bộ để vẫn đủ k kết quả
+        if (labels[0] < 0).any():
+            params = self._search_params(index, selector, exhaustive=True)
+            scores, labels = index.search(query_embedding, k, params=params)
+        return scores, labels
+    
+    @traced()
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int = 5,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        live_prices=None
+    ) -> List[Tuple[Dict, float]]:
+        """
+        BM25 keyword search với cùng filters như search()
+        
+        Args:
+            query: User search query
+            top_k: Number of results to return
+            category: Lọc theo tên category (optional)
+            min_price: Giá tối thiểu (optional)
+            max_price: Giá tối đa (optional)
+            live_prices: LiveStatsTable - lọc giá theo giá hiện tại (optional)
+            
+        Returns:
+            List of (product_dict, bm25_score) tuples
+        """
+        snapshot = self._snapshot
+        
+        if snapshot.lexical is None:
+            return []
+        
+        candidates = snapshot.candidate_positions(category, min_price, max_price, live_prices)
+        allowed_ids = None if candidates is None else snapshot.id_map[candidates]
+        
+        delta = snapshot.delta
+        if delta is None:
+            hits = snapshot.lexical.search(query, top_k=top_k, allowed_ids=allowed_ids)
+        else:
+            # Doc cũ của sản phẩm đã đổi bị bỏ, bản mới nằm trong BM25 delta
+            hits = snapshot.lexical.search(query, top_k=top_k, allowed_ids=allowed_ids, excluded_ids=delta.dead_ids)
+            if delta.lexical is not None:
+                delta_candidates = delta.candidate_positions(category, min_price, max_price, live_prices)
+                delta_allowed = None if delta_candidates is None else delta.vector_ids[delta_candidates]
+                hits = sorted(
+                    hits + delta.lexical.search(query, top_k=top_k, allowed_ids=delta_allowed),
+                    key=lambda hit: hit[1], reverse=True
+                )[:top_k]
+        return [(snapshot.product_data[pid], score) for pid, score in hits]
+    
+    @traced()
     def save_index(self, filepath: str = "faiss_index"):
         """
-        Save FAISS index and product data to disk
+        Save FAISS index and product catalog to disk
+        
+        Each save writes a new generation of files
+        (`{filepath}.<gen>.index/.catalog/.bm25`) and switches
+        `{filepath}.manifest` to it last. Files other processes have mmap'd
+        are never replaced in place (Windows cannot replace a mapped file),
+        and a reader always sees a complete generation. A pending delta is
+        compacted first, and the written catalog then replaces the in-memory
+        overlay of change-feed updates. The whole save holds the
+        `{filepath}.lock` file lock, so saves of different worker processes
+        never pick the same generation.
         
         Args:
             filepath: Base path for saving files (without extension)
         """
-        if not self.index:
+        self.compact()
+        snapshot = self._snapshot
+        
+        if not snapshot.index:
             logger.error("No index to save")
             return False
         
         try:
-            # Save FAISS index
-            faiss.write_index(self.index, f"{filepath}.index")
-            
-            # Save product data
-            with open(f"{filepath}.pkl", 'wb') as f:
-                pickle.dump(self.product_data, f)
-            
-            logger.info(f"✅ Index saved to {filepath}.index and {filepath}.pkl")
-            return True
-            
+            with self.file_lock(filepath):
+                return self._save_snapshot(snapshot, filepath)
         except Exception as e:
             logger.error(f"❌ Failed to save index: {e}")
             return False
     
+    def _save_snapshot(self, snapshot: IndexSnapshot, filepath: str) -> bool:
+        # Ghi OnDiskInvertedLists ra file sẽ hỏng → ghi bản copy trong RAM
+        index = self._writable_copy(snapshot) if snapshot.mmap_path else snapshot.index
+        
+        previous = read_manifest(filepath)
+        generation = max([previous["generation"] if previous else 0, *_generations_on_disk(filepath)]) + 1
+        files = {ext: f"{filepath}.{generation}{ext}" for ext in GENERATION_FILES}
+        
+        faiss.write_index(index, files[".index"])
+        
+        # Save product catalog + content hashes (cho incremental update)
+        write_catalog(
+            files[".catalog"],
+            snapshot.product_data.values(),
+            snapshot.content_hashes,
+            meta={"text_format": snapshot.text_format}
+        )
+        
+        # BM25 index → không phải tokenize lại toàn bộ catalog khi load
+        if snapshot.lexical is not None:
+            snapshot.lexical.save(files[".bm25"])
+        else:
+            files[".bm25"] = None
+        
+        # Manifest đổi sau cùng → process khác chỉ thấy generation đã ghi đủ
+        self._write_manifest(filepath, generation, files)
+        self._loaded_files = (filepath, generation)  # Không reload lại chính file vừa lưu
+        
+        if isinstance(snapshot.product_data, CatalogOverlay):
+            self._adopt_catalog(snapshot, files[".catalog"])
+        
+        self._remove_old_generations(filepath, keep={generation, previous["generation"] if previous else 0})
+        
+        logger.info(f"✅ Index saved to {filepath}.manifest (generation {generation})")
+        return True
+    
+    def file_lock(self, filepath: str = "faiss_index") -> FileLock:
+        """
+        Cross-process lock của index tại filepath (`{filepath}.lock`)
+        
+        save_index tự lấy lock; rebuild giữ lock từ lúc build tới lúc lưu để
+        2 worker không rebuild / ghi đè nhau.
+        """
+        return self._file_locks.setdefault(filepath, FileLock(f"{filepath}.lock"))
+    
+    @staticmethod
+    def _write_manifest(filepath: str, generation: int, files: Dict):
+        manifest = {
+            "generation": generation,
+            "files": {ext: os.path.basename(path) if path else None for ext, path in files.items()}
+        }
+        tmp_path = f"{filepath}.manifest.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, f"{filepath}.manifest")
+    
+    def _remove_old_generations(self, filepath: str, keep: set):
+        """
+        Xóa file của các generation cũ mà không snapshot nào còn dùng
+        
+        Giữ generation mới, generation trước (process khác có thể vừa đọc
+        manifest cũ) và các file snapshot hiện tại đang mmap. Snapshot cũ
+        của process khác: trên POSIX xóa file đang mmap vẫn an toàn; trên
+        Windows os.remove lỗi → bỏ qua, lần save sau xóa tiếp.
+        """
+        snapshot = self._snapshot
+        in_use = {snapshot.mmap_path}
+        catalog = snapshot.product_data.base if isinstance(snapshot.product_data, CatalogOverlay) else snapshot.product_data
+        if isinstance(catalog, CatalogStore):
+            in_use.add(catalog.filepath)
+        
+        newest = max(keep)
+        for generation, paths in _generations_on_disk(filepath).items():
+            # Generation lớn hơn: process khác đang ghi
+            if generation in keep or generation > newest:
+                continue
+            for path in paths:
+                if path in in_use:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.debug(f"Could not remove {path} yet: {e}")
+    
+    def _adopt_catalog(self, snapshot: IndexSnapshot, catalog_path: str):
+        """Thay overlay bằng catalog vừa ghi (mmap) nếu chưa có update mới"""
+        with self._write_lock:
+            if self._snapshot is not snapshot:
+                return
+            catalog = CatalogStore(catalog_path)
+            self._publish(
+                snapshot.index, product_data=catalog,
+                content_hashes=catalog.content_hashes(),
+                mmap_path=snapshot.mmap_path, lexical=snapshot.lexical,
+                text_format=snapshot.text_format
+            )
+    
     def load_index(self, filepath: str = "faiss_index"):
         """
         Load FAISS index and product data from disk
         
+        Loads the generation named in `{filepath}.manifest` (memory-mapped
+        catalog); without a manifest, converts the original
+        `{filepath}.index` + `{filepath}.pkl` pair. With mmap_index the
+        FAISS file is opened read-only via IO_FLAG_MMAP: IVF inverted lists
+        stay in the page cache and are shared by every worker process
+        (faiss < 1.8 still reads flat/HNSW vectors into memory).
+        
         Args:
             filepath: Base path for loading files (without extension)
         """
         try:
+            manifest = read_manifest(filepath)
+            index_path = manifest[".index"] if manifest else f"{filepath}.index"
+            
             # Load FAISS index
-            if not os.path.exists(f"{filepath}.index"):
-                logger.error(f"Index file not found: {filepath}.index")
+            if not os.path.exists(index_path):
+                logger.error(f"Index file not found: {index_path}")
                 return False
             
-            self.index = faiss.read_index(f"{filepath}.index")
+            if self.mmap_index:
+                index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            else:
+                index = faiss.read_index(index_path)
+            mmap_path = index_path if self._is_mmapped(index) else None
+            
+            if manifest:
+                # Columnar catalog: mmap, record chỉ được tạo khi cần
+                catalog = CatalogStore(manifest[".catalog"])
+                lexical = self._load_lexical(manifest[".bm25"], catalog)
+                
+                with self._write_lock:
+                    self._publish(
+                        index, product_data=catalog,
+                        content_hashes=catalog.content_hashes(),
+                        mmap_path=mmap_path, lexical=lexical,
+                        text_format=catalog.meta["text_format"]
+                    )
+                    self._loaded_files = (filepath, manifest and manifest["generation"])
+                
+                self._warn_if_stale(filepath)
+                logger.info(f"✅ Index loaded from {filepath} (generation {manifest['generation']})")
+                logger.info(f"   - {self.index.ntotal} vectors{' (memory-mapped)' if mmap_path else ''}")
+                logger.info(f"   - {len(catalog)} products (memory-mapped catalog)")
+                return True
             
-            # Load product data
+            # Load product data (pickle format cũ: list products, index theo vị trí)
             with open(f"{filepath}.pkl", 'rb') as f:
-                self.product_data = pickle.load(f)
+                products = pickle.load(f)
             
+            # Chuyển index cũ (IndexFlatIP, id = vị trí) sang id = ProductID
+            logger.info("Converting positional index to ProductID-keyed index...")
+            if mmap_path:
+                index, mmap_path = faiss.read_index(index_path), None
+            vectors = index.reconstruct_n(0, index.ntotal)
+            index.reset()
+            index = faiss.IndexIDMap2(index)
+            index.add_with_ids(vectors, np.array([p['ProductID'] for p in products], dtype='int64'))
+            
+            # Pickle không có content hash (text format 1) → sync encode lại
+            # mọi sản phẩm theo text mới
+            with self._write_lock:
+                self._publish(
+                    index,
+                    product_data={p['ProductID']: p for p in products},
+                    content_hashes={},
+                    mmap_path=mmap_path,
+                    text_format=1
+                )
+                self._loaded_files = (filepath, manifest and manifest["generation"])
+            
+            self._warn_if_stale(filepath)
             logger.info(f"✅ Index loaded from {filepath}")
             logger.info(f"   - {self.index.ntotal} vectors")
             logger.info(f"   - {len(self.product_data)} products")
@@ -233,6 +1713,49 @@ class EmbeddingsManager:
             logger.error(f"❌ Failed to load index: {e}")
             return False
 
+    
+    def _warn_if_stale(self, filepath: str):
+        if self.text_format_stale:
+            logger.warning(
+                f"⚠️  {filepath} was embedded with product text format {self._snapshot.text_format} "
+                f"(current: {self.TEXT_FORMAT}); rebuild the index to re-encode every product"
+            )
+    
+    @staticmethod
+    def _load_lexical(bm25_path: Optional[str], catalog: CatalogStore) -> Optional[BM25Index]:
+        """Load BM25 đã lưu nếu khớp catalog (None → _publish build lại)"""
+        if bm25_path is None:
+            return None
+        
+        lexical = BM25Index.load(bm25_path)
+        if not np.array_equal(lexical.doc_ids, catalog.product_ids):
+            logger.warning("⚠️  BM25 index does not match the catalog, rebuilding it")
+            return None
+        return lexical
+    
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the index if the manifest points to a newer generation
+        
+        Lets every worker of a multi-process deployment pick up a rebuild
+        saved by whichever worker ran it. Only the manifest is compared, so
+        generation files being written by another worker never trigger a
+        reload of a half-written state.
+        
+        Returns:
+            True nếu đã reload
+        """
+        if not self._loaded_files:
+            return False
+        
+        filepath, generation = self._loaded_files
+        manifest = read_manifest(filepath)
+        if manifest is None or manifest["generation"] == generation:
+            return False
+        
+        logger.info(f"🔄 Index generation {manifest['generation']} saved by another worker, reloading {filepath}...")
+        return self.load_index(filepath)
+
 
 # ===== USAGE EXAMPLE =====
 if __name__ == "__main__":
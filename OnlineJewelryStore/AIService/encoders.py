@@ -0,0 +1,378 @@
+"""
+Encoder backends cho EmbeddingsManager
+- torch:     SentenceTransformer (PyTorch) như cũ
+- onnx:      ONNX Runtime, model export từ SentenceTransformer
+- onnx_int8: ONNX Runtime + dynamic int8 quantization (nhanh + nhẹ nhất trên CPU)
+
+Mọi backend có cùng interface encode(texts) → np.ndarray như SentenceTransformer.
+Model ONNX chưa verify / verify không đạt → create_encoder dùng torch thay thế
+(trừ khi allow_unverified=True).
+
+Export + verify:
+    python encoders.py                                   # all-MiniLM-L6-v2 → models/all-MiniLM-L6-v2-onnx
+    python encoders.py --model all-MiniLM-L6-v2 --output models/minilm-onnx --tolerance 0.99
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'onnx_int8')
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "encoder_config.json"
+
+# Câu mẫu để so sánh embedding giữa các backend (VN + EN, query + product text)
+VERIFY_TEXTS = [
+    "nhẫn kim cương",
+    "nhẫn cưới vàng 18K giá rẻ",
+    "dây chuyền bạc cho nữ",
+    "bông tai ngọc trai",
+    "Rose Gold engagement ring",
+    "gold necklace for a wedding gift",
+    "silver bracelet under 5 million",
+    "Product: Classic Solitaire Ring. Category: Engagement Rings. Materials: Platinum, 18K Gold",
+    "Product: Pearl Drop Earrings. Category: Earrings. Price: 2,500,000 VND. In stock",
+    "quà tặng sinh nhật cho bạn gái khoảng 3 triệu"
+]
+
+
+class UnverifiedModelError(ValueError):
+    """Model ONNX chưa verify hoặc lệch quá tolerance so với model PyTorch"""
+
+
+class OnnxEncoder:
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = False,
+        num_threads: Optional[int] = None,
+        allow_unverified: bool = False
+    ):
+        """
+        SentenceTransformer-compatible encoder chạy trên ONNX Runtime
+
+        Args:
+            model_dir: Thư mục tạo bởi export_onnx()
+            quantized: Dùng model int8 thay vì fp32
+            num_threads: Số thread ONNX Runtime (None = mặc định)
+            allow_unverified: Chỉ cảnh báo (không raise) nếu model chưa verify
+                              hoặc verify không đạt
+
+        Raises:
+            UnverifiedModelError: Model chưa verify / verify không đạt
+        """
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE), encoding='utf-8') as f:
+            self.config = json.load(f)
+
+        variant = "onnx_int8" if quantized else "onnx"
+        check = self.config.get("verification", {}).get(variant)
+        problem = None
+        if check is None:
+            problem = f"{variant} model in {model_dir} was never verified against the reference model"
+        elif not check["passed"]:
+            problem = (
+                f"{variant} model failed verification "
+                f"(min cosine {check['min_cosine']:.4f} < {check['tolerance']})"
+            )
+        if problem:
+            if not allow_unverified:
+                raise UnverifiedModelError(f"{problem}. Run: python encoders.py --model {self.config['model_name']}")
+            logger.warning(f"⚠️  {problem}, using it anyway (allow_unverified)")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        model_path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_token_id", 0))
+
+        self.variant = variant
+        logger.info(f"✅ ONNX encoder loaded: {model_path}")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(
+        self,
+        sentences: List[str],
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        convert_to_numpy: bool = True
+    ) -> np.ndarray:
+        """
+        Encode texts → mean-pooled embeddings (chưa normalize, giống SentenceTransformer)
+
+        Args:
+            sentences: List of texts
+            batch_size: Số text mỗi lần chạy session
+            show_progress_bar: Hiện progress bar (tqdm)
+
+        Returns:
+            float32 matrix (n, dimension)
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+
+        # Sort theo độ dài → ít padding trong mỗi batch, sau đó trả về đúng thứ tự
+        order = np.argsort([-len(s) for s in sentences], kind='stable')
+        output = np.empty((len(sentences), self.config["dimension"]), dtype='float32')
+
+        batches = range(0, len(sentences), batch_size)
+        if show_progress_bar:
+            from tqdm import tqdm
+            batches = tqdm(batches, desc="Batches")
+
+        for start in batches:
+            rows = order[start:start + batch_size]
+            encodings = self.tokenizer.encode_batch([sentences[i] for i in rows])
+
+            input_ids = np.array([e.ids for e in encodings], dtype='int64')
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype='int64')
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+            hidden = self.session.run(None, feeds)[0]
+
+            # Mean pooling theo attention mask (như all-MiniLM-L6-v2)
+            mask = attention_mask[:, :, np.newaxis].astype('float32')
+            output[rows] = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+        return output
+
+
+def create_encoder(
+    backend: str,
+    model_name: str,
+    onnx_model_dir: Optional[str] = None,
+    num_threads: Optional[int] = None,
+    allow_unverified: bool = False
+):
+    """
+    Tạo encoder theo backend
+
+    Model ONNX chưa verify hoặc verify không đạt → dùng SentenceTransformer
+    (torch) thay thế, vì vector lệch sẽ không khớp index đã build.
+
+    Args:
+        backend: 'torch' | 'onnx' | 'onnx_int8'
+        model_name: SentenceTransformer model (backend torch)
+        onnx_model_dir: Thư mục export_onnx() (backend onnx*)
+        num_threads: Số thread ONNX Runtime
+        allow_unverified: Vẫn dùng model ONNX chưa verify / verify không đạt
+
+    Returns:
+        Object có method encode(texts, ...) như SentenceTransformer
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == 'torch':
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    onnx_model_dir = onnx_model_dir or default_onnx_dir(model_name)
+    if not os.path.exists(os.path.join(onnx_model_dir, CONFIG_FILE)):
+        raise FileNotFoundError(
+            f"ONNX model not found in {onnx_model_dir}. Run: python encoders.py --model {model_name}"
+        )
+    try:
+        return OnnxEncoder(
+            onnx_model_dir, quantized=(backend == 'onnx_int8'),
+            num_threads=num_threads, allow_unverified=allow_unverified
+        )
+    except UnverifiedModelError as e:
+        logger.error(f"❌ {e}. Falling back to the torch encoder")
+        return create_encoder('torch', model_name)
+
+
+def default_onnx_dir(model_name: str) -> str:
+    return os.path.join("models", f"{model_name.split('/')[-1]}-onnx")
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / np.clip(np.linalg.norm(x, axis=1, keepdims=True), 1e-12, None)
+
+
+def verify_encoder(reference, candidate, texts: List[str] = VERIFY_TEXTS, tolerance: float = 0.99) -> Dict:
+    """
+    So sánh embeddings của candidate với reference model
+
+    Args:
+        reference: Encoder chuẩn (SentenceTransformer)
+        candidate: Encoder cần kiểm tra
+        texts: Câu mẫu
+        tolerance: Cosine similarity tối thiểu cho mọi câu
+
+    Returns:
+        {"min_cosine", "mean_cosine", "tolerance", "passed", "latency_ms"}
+    """
+    expected = _normalize(np.asarray(reference.encode(texts, convert_to_numpy=True), dtype='float32'))
+    actual = _normalize(np.asarray(candidate.encode(texts, convert_to_numpy=True), dtype='float32'))
+    cosines = (expected * actual).sum(axis=1)
+
+    return {
+        "min_cosine": round(float(cosines.min()), 6),
+        "mean_cosine": round(float(cosines.mean()), 6),
+        "tolerance": tolerance,
+        "passed": bool(cosines.min() >= tolerance),
+        "latency_ms": round(_query_latency_ms(candidate, texts), 3)
+    }
+
+
+def _query_latency_ms(encoder, texts: List[str], rounds: int = 5) -> float:
+    """Thời gian encode trung bình cho 1 query (như 1 request /chat)"""
+    encoder.encode(texts[:1])  # warm-up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            encoder.encode([text])
+    return (time.perf_counter() - start) * 1000 / (rounds * len(texts))
+
+
+def export_onnx(
+    model_name: str = "all-MiniLM-L6-v2",
+    output_dir: Optional[str] = None,
+    quantize: bool = True,
+    tolerance: float = 0.99,
+    opset: int = 14
+) -> Dict:
+    """
+    Export SentenceTransformer → ONNX (+ int8 dynamic quantization) và verify
+
+    Args:
+        model_name: SentenceTransformer model
+        output_dir: Thư mục output (mặc định models/<model>-onnx)
+        quantize: Tạo thêm model int8
+        tolerance: Cosine tối thiểu so với model PyTorch
+        opset: ONNX opset version
+
+    Returns:
+        Encoder config (gồm kết quả verification)
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    output_dir = output_dir or default_onnx_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+
+    reference = SentenceTransformer(model_name)
+    transformer = reference[0]
+    hf_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+
+    pooling = reference[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"{model_name} does not use mean pooling, which OnnxEncoder implements")
+
+    # 1. Export transformer (pooling làm bằng numpy trong OnnxEncoder)
+    logger.info(f"Exporting {model_name} to ONNX...")
+    dummy = tokenizer(["nhẫn kim cương"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in dummy]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+
+    with torch.no_grad():
+        torch.onnx.export(
+            hf_model,
+            tuple(dummy[name] for name in input_names),
+            os.path.join(output_dir, ONNX_FILE),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+            do_constant_folding=True
+        )
+    tokenizer.save_pretrained(output_dir)  # Ghi tokenizer.json (fast tokenizer)
+
+    # 2. Dynamic int8 quantization (weights int8, activations quantize lúc chạy)
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        logger.info("Quantizing to int8...")
+        quantize_dynamic(
+            os.path.join(output_dir, ONNX_FILE),
+            os.path.join(output_dir, ONNX_INT8_FILE),
+            weight_type=QuantType.QInt8
+        )
+
+    config = {
+        "model_name": model_name,
+        "dimension": reference.get_sentence_embedding_dimension(),
+        "max_seq_length": reference.max_seq_length,
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "verification": {}
+    }
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    # 3. Verify từng variant so với PyTorch
+    config["verification"]["torch"] = {"latency_ms": round(_query_latency_ms(reference, VERIFY_TEXTS), 3)}
+    for variant in (("onnx", "onnx_int8") if quantize else ("onnx",)):
+        candidate = OnnxEncoder(output_dir, quantized=(variant == "onnx_int8"), allow_unverified=True)
+        config["verification"][variant] = verify_encoder(reference, candidate, tolerance=tolerance)
+
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX (fp32 + int8) and verify it")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="SentenceTransformer model")
+    parser.add_argument("--output", help="Thư mục output (mặc định models/<model>-onnx)")
+    parser.add_argument("--no-quantize", action="store_true", help="Không tạo model int8")
+    parser.add_argument("--tolerance", type=float, default=0.99, help="Cosine tối thiểu so với PyTorch")
+    args = parser.parse_args()
+
+    print("\n" + "="*60)
+    print("📦 EXPORT EMBEDDING MODEL TO ONNX")
+    print("="*60 + "\n")
+
+    config = export_onnx(args.model, args.output, quantize=not args.no_quantize, tolerance=args.tolerance)
+
+    print("\n" + "-"*60)
+    print(f"{'backend':<12} {'min cos':>10} {'mean cos':>10} {'ms/query':>10} {'status':>10}")
+    print("-"*60)
+    passed = True
+    for variant, check in config["verification"].items():
+        if variant == "torch":
+            print(f"{variant:<12} {'-':>10} {'-':>10} {check['latency_ms']:>10.2f} {'reference':>10}")
+            continue
+        passed = passed and check["passed"]
+        print(
+            f"{variant:<12} {check['min_cosine']:>10.4f} {check['mean_cosine']:>10.4f} "
+            f"{check['latency_ms']:>10.2f} {'✅ pass' if check['passed'] else '❌ FAIL':>10}"
+        )
+    print("-"*60 + "\n")
+
+    return passed
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n⚠️  Export interrupted by user")
+        sys.exit(1)
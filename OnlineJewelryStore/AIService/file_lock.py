@@ -0,0 +1,76 @@
+"""
+File Lock - lock giữa các worker process (fcntl trên POSIX, msvcrt trên Windows)
+Mỗi uvicorn worker có executor riêng; lock file đảm bảo chỉ 1 process
+rebuild / ghi index tại một thời điểm.
+"""
+
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    def __init__(self, path: str):
+        """
+        Exclusive, reentrant lock trên `path` (file được tạo nếu chưa có)
+
+        Reentrant trong process: rebuild giữ lock rồi gọi save_index cũng
+        lấy lock đó. Thread khác của cùng process chờ như process khác.
+
+        Args:
+            path: Đường dẫn lock file
+        """
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._file = open(self.path, 'a+b')
+                self._lock_file()
+            except BaseException:
+                if self._file:
+                    self._file.close()
+                    self._file = None
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            try:
+                self._unlock_file()
+            finally:
+                self._file.close()
+                self._file = None
+        self._thread_lock.release()
+
+    def _lock_file(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        # msvcrt.LK_LOCK chỉ thử lại trong ~10s rồi raise → chờ tiếp
+        self._file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.1)
+
+    def _unlock_file(self):
+        if fcntl:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
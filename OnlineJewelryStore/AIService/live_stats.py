@@ -0,0 +1,184 @@
+"""
+Live Stats - side-table cho field hay thay đổi (giá, tồn kho, rating)
+Các field này không nằm trong text embed; chúng được refresh định kỳ từ DB
+vào NumPy arrays (sorted theo ProductID) và join vào kết quả search lúc trả lời.
+
+Refresh chỉ thay 1 reference → search đang chạy luôn thấy 1 bảng nhất quán.
+"""
+
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import logging
+
+from db_connector import LIVE_STATS_COLUMNS, DatabaseConnector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Field được ghi đè lên product dict (tên như get_all_products)
+LIVE_FIELDS = ("BasePrice", "MinPrice", "MaxPrice", "TotalStock", "ReviewCount", "AvgRating")
+INT_FIELDS = ("TotalStock", "ReviewCount")
+
+
+class LiveStatsTable:
+    """Immutable ProductID → live fields (1 float64 array mỗi field, NaN = NULL)"""
+
+    def __init__(self, product_ids: np.ndarray, columns: Dict[str, np.ndarray]):
+        self.product_ids = product_ids
+        self.columns = columns
+        self.generation = 0  # Tăng mỗi lần refresh có thay đổi (dùng trong response cache key)
+        self._min_prices = None
+
+    @classmethod
+    def empty(cls) -> "LiveStatsTable":
+        return cls(
+            np.empty(0, dtype='int64'),
+            {name: np.empty(0, dtype='float64') for name in LIVE_FIELDS}
+        )
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "LiveStatsTable":
+        """Rows theo LIVE_STATS_COLUMNS (DatabaseConnector.get_live_stats)"""
+        rows = sorted(rows, key=lambda row: row[0])
+        raw = {
+            name: np.array([math.nan if row[i] is None else float(row[i]) for row in rows], dtype='float64')
+            for i, name in enumerate(LIVE_STATS_COLUMNS)
+        }
+
+        # Giá thực tế như get_all_products: BasePrice + AdditionalPrice (NULL = 0)
+        columns = {
+            "BasePrice": raw["BasePrice"],
+            "MinPrice": raw["BasePrice"] + np.nan_to_num(raw["MinAdditionalPrice"]),
+            "MaxPrice": raw["BasePrice"] + np.nan_to_num(raw["MaxAdditionalPrice"]),
+            "TotalStock": raw["TotalStock"],
+            "ReviewCount": raw["ReviewCount"],
+            "AvgRating": raw["AvgRating"]
+        }
+        return cls(raw["ProductID"].astype('int64'), columns)
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    def min_prices(self) -> np.ndarray:
+        """MinPrice từng row (NULL → 0) như filter giá của index, tính 1 lần mỗi bảng"""
+        if self._min_prices is None:
+            self._min_prices = np.nan_to_num(self.columns["MinPrice"], nan=0.0)
+        return self._min_prices
+
+    def row_of(self, product_id: int) -> int:
+        """ProductID → row, -1 nếu không có"""
+        row = int(np.searchsorted(self.product_ids, product_id))
+        if row < len(self.product_ids) and self.product_ids[row] == product_id:
+            return row
+        return -1
+
+    def count_changes(self, other: "LiveStatsTable") -> int:
+        """Số sản phẩm có field khác (hoặc chỉ có ở 1 trong 2 bảng) so với bảng other"""
+        common, mine, theirs = np.intersect1d(
+            self.product_ids, other.product_ids, assume_unique=True, return_indices=True
+        )
+
+        changed = np.zeros(len(common), dtype='bool')
+        for name in LIVE_FIELDS:
+            a, b = self.columns[name][mine], other.columns[name][theirs]
+            changed |= ~((a == b) | (np.isnan(a) & np.isnan(b)))
+
+        added_or_removed = len(self.product_ids) + len(other.product_ids) - 2 * len(common)
+        return int(np.count_nonzero(changed)) + added_or_removed
+
+
+class LiveStats:
+    def __init__(self):
+        """
+        Giá / tồn kho / rating hiện tại, join vào product dict lúc trả lời
+
+        Products missing from the table (e.g. not refreshed yet) keep the
+        values from the index snapshot.
+        """
+        self._table = LiveStatsTable.empty()
+
+        # Stats
+        self.refreshes = 0
+        self.last_refresh_at = None
+        self.last_refresh_ms = None
+        self.last_changed = 0
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    @property
+    def table(self) -> LiveStatsTable:
+        """Bảng hiện tại; giữ 1 reference để filter và join dùng cùng 1 bảng"""
+        return self._table
+
+    def load(self, rows: List[tuple]) -> int:
+        """
+        Thay bảng bằng rows mới
+
+        Returns:
+            Số sản phẩm có giá/tồn kho/rating thay đổi
+        """
+        table = LiveStatsTable.from_rows(rows)
+        changed = table.count_changes(self._table)
+        table.generation = self._table.generation + (1 if changed else 0)
+        self._table = table
+        return changed
+
+    def refresh(self, db: DatabaseConnector) -> int:
+        """
+        Đọc lại live fields từ database (blocking)
+
+        Returns:
+            Số sản phẩm thay đổi kể từ lần refresh trước
+        """
+        start = time.perf_counter()
+        changed = self.load(db.get_live_stats())
+
+        self.refreshes += 1
+        self.last_changed = changed
+        self.last_refresh_at = datetime.now().isoformat()
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        if changed:
+            logger.info(f"✅ Live stats refreshed: {changed} products changed ({self.last_refresh_ms}ms)")
+        return changed
+
+    def get(self, product_id: int, table: Optional[LiveStatsTable] = None) -> Optional[Dict]:
+        """Live fields của 1 sản phẩm, None nếu không có trong bảng (mặc định bảng hiện tại)"""
+        if table is None:
+            table = self._table
+        row = table.row_of(product_id)
+        if row < 0:
+            return None
+
+        live = {}
+        for name in LIVE_FIELDS:
+            value = table.columns[name][row]
+            if np.isnan(value):
+                live[name] = None
+            else:
+                live[name] = int(value) if name in INT_FIELDS else float(value)
+        return live
+
+    def join(self, product: Dict, table: Optional[LiveStatsTable] = None) -> Dict:
+        """Copy của product với live fields ghi đè (product gốc trong snapshot không đổi)"""
+        live = self.get(product['ProductID'], table)
+        return {**product, **live} if live else product
+
+    def join_results(
+        self, results: List[Tuple[Dict, float]], table: Optional[LiveStatsTable] = None
+    ) -> List[Tuple[Dict, float]]:
+        return [(self.join(product, table), score) for product, score in results]
+
+    def stats(self) -> Dict:
+        return {
+            "products": len(self._table),
+            "refreshes": self.refreshes,
+            "last_refresh_at": self.last_refresh_at,
+            "last_refresh_ms": self.last_refresh_ms,
+            "last_changed": self.last_changed
+        }
@@ -0,0 +1,329 @@
+"""
+Load Test - closed-loop load generator cho /chat và /chat/stream
+Mỗi bước chạy N client đồng thời (mỗi client gửi request tiếp theo ngay khi
+nhận xong response) trong --duration giây, đo throughput, p50/p95/p99 latency
+(và TTFT với stream), rồi tăng concurrency. Điểm bão hòa = bước đầu tiên mà
+throughput tăng < --saturation-gain so với mức tốt nhất trước đó.
+
+Mặc định mỗi request gửi kèm 1 tin conversation_history ngẫu nhiên để bỏ qua
+semantic response cache (đo pipeline thật); --allow-cache để đo cả cache.
+
+Chạy với Ollama thật hoặc ollama_stub.py (tốc độ token chỉnh được):
+    python ollama_stub.py --ttft 0.5 --tokens-per-second 20 --parallel 4
+    uvicorn main:app --port 8000
+    python load_test.py --concurrency 1,2,4,8,16 --duration 30
+    python load_test.py --endpoint stream --output results/load.json
+    python load_test.py --compare results/load.json             # so với lần chạy trước
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import requests
+
+from benchmark_report import latency_summary, load_results, print_comparison, run_metadata, save_results
+
+ENDPOINTS = {"chat": "/chat", "stream": "/chat/stream"}
+
+QUERIES = [
+    {"message": "Tôi muốn mua nhẫn cưới vàng khoảng 15 triệu", "min_price": 10_000_000, "max_price": 20_000_000},
+    {"message": "Dây chuyền bạc cho nữ dưới 3 triệu", "max_price": 3_000_000},
+    {"message": "Bông tai kim cương làm quà sinh nhật"},
+    {"message": "Lắc tay vàng trắng đơn giản", "category": "Bracelets"},
+    {"message": "Nhẫn đính hôn kim cương cao cấp", "min_price": 30_000_000},
+    {"message": "Mặt dây chuyền ngọc trai"},
+    {"message": "Gợi ý trang sức bạc cho nam"},
+    {"message": "Bộ trang sức cưới trọn bộ giá tốt"}
+]
+
+
+class StepResult:
+    """Kết quả của mọi client trong 1 bước concurrency (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies_ms: List[float] = []
+        self.ttft_ms: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def success(self, latency_ms: float, ttft_ms: Optional[float]):
+        with self._lock:
+            self.latencies_ms.append(latency_ms)
+            if ttft_ms is not None:
+                self.ttft_ms.append(ttft_ms)
+
+    def error(self, reason: str):
+        with self._lock:
+            self.errors[reason] = self.errors.get(reason, 0) + 1
+
+
+def build_payload(rng: random.Random, allow_cache: bool) -> Dict:
+    payload = dict(rng.choice(QUERIES))
+    if not allow_cache:
+        # RAGService không dùng response cache khi có history
+        payload["conversation_history"] = [
+            {"role": "user", "content": f"Xin chào, mã khách {uuid.uuid4().hex[:8]}"}
+        ]
+    return payload
+
+
+def send_chat(session: requests.Session, url: str, payload: Dict, timeout: float) -> Optional[float]:
+    """POST /chat; raise nếu lỗi. Returns: None (không có TTFT)"""
+    response = session.post(url, json=payload, timeout=timeout, headers={"X-Request-ID": uuid.uuid4().hex})
+    response.raise_for_status()
+    if not response.json().get("success"):
+        raise RuntimeError("success=false")
+    return None
+
+
+def send_stream(session: requests.Session, url: str, payload: Dict, timeout: float) -> Optional[float]:
+    """
+    POST /chat/stream, đọc hết NDJSON; raise nếu lỗi
+
+    Returns:
+        TTFT (ms) - thời gian đến event "token" đầu tiên
+    """
+    start = time.perf_counter()
+    ttft_ms = None
+    with session.post(url, json=payload, timeout=timeout, stream=True,
+                      headers={"X-Request-ID": uuid.uuid4().hex}) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["type"] == "token" and ttft_ms is None:
+                ttft_ms = (time.perf_counter() - start) * 1000
+            elif event["type"] == "error":
+                raise RuntimeError(event.get("message", "stream error"))
+            elif event["type"] == "done":
+                return ttft_ms
+    raise RuntimeError("stream ended without done event")
+
+
+def client_loop(send, url: str, args, result: StepResult, measure_from: float, stop_at: float, seed: int):
+    """1 client closed-loop: gửi request kế tiếp ngay khi nhận xong response"""
+    rng = random.Random(seed)
+    session = requests.Session()
+    try:
+        while time.perf_counter() < stop_at:
+            payload = build_payload(rng, args.allow_cache)
+            start = time.perf_counter()
+            try:
+                ttft_ms = send(session, url, payload, args.timeout)
+                ok, reason = True, None
+            except requests.HTTPError as e:
+                ok, reason = False, f"HTTP {e.response.status_code}"
+            except requests.Timeout:
+                ok, reason = False, "timeout"
+            except Exception as e:
+                ok, reason = False, type(e).__name__
+            end = time.perf_counter()
+
+            # Chỉ tính request bắt đầu sau warmup và kết thúc trong cửa sổ đo
+            if start < measure_from or end > stop_at:
+                continue
+            if ok:
+                result.success((end - start) * 1000, ttft_ms)
+            else:
+                result.error(reason)
+    finally:
+        session.close()
+
+
+def run_step(concurrency: int, args) -> Dict:
+    """
+    Chạy 1 bước: concurrency client trong warmup + duration giây
+
+    Returns:
+        Dict với throughput_rps, latency/ttft percentiles, errors
+    """
+    send = send_stream if args.endpoint == "stream" else send_chat
+    url = args.url.rstrip("/") + ENDPOINTS[args.endpoint]
+    result = StepResult()
+
+    measure_from = time.perf_counter() + args.warmup
+    stop_at = measure_from + args.duration
+    threads = [
+        threading.Thread(
+            target=client_loop,
+            args=(send, url, args, result, measure_from, stop_at, args.seed * 1000 + i),
+            daemon=True
+        )
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        # Request đang chạy lúc hết giờ không được tính, chờ tối đa 1 timeout
+        t.join(timeout=max(0.0, stop_at - time.perf_counter()) + args.timeout)
+
+    completed = len(result.latencies_ms)
+    n_errors = sum(result.errors.values())
+    step = {
+        "concurrency": concurrency,
+        "completed": completed,
+        "errors": n_errors,
+        "error_rate": round(n_errors / (completed + n_errors), 4) if completed + n_errors else 0.0,
+        "error_reasons": result.errors,
+        "throughput_rps": round(completed / args.duration, 4),
+        **latency_summary(result.latencies_ms)
+    }
+    if args.endpoint == "stream":
+        step["ttft"] = latency_summary(result.ttft_ms)
+    return step
+
+
+def find_saturation(steps: List[Dict], min_gain: float) -> Optional[Dict]:
+    """
+    Bước đầu tiên mà throughput không tăng quá min_gain so với mức tốt nhất trước đó
+
+    Returns:
+        {"concurrency", "throughput_rps", "at_step"}: concurrency tốt nhất trước
+        khi bão hòa; None nếu throughput vẫn tăng đến bước cuối
+    """
+    best = None
+    for step in steps:
+        if best is not None and step["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            return {
+                "concurrency": best["concurrency"],
+                "throughput_rps": best["throughput_rps"],
+                "at_step": step["concurrency"]
+            }
+        if best is None or step["throughput_rps"] > best["throughput_rps"]:
+            best = step
+    return None
+
+
+def fmt_ms(value: Optional[float]) -> str:
+    return f"{value:.0f}" if value is not None else "-"
+
+
+def report(results: Dict):
+    stream = results["endpoint"] == "stream"
+    width = 96 if stream else 82
+
+    print("\n" + "-"*width)
+    header = f"{'conc':>5} {'done':>7} {'err':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    if stream:
+        header += f" {'ttft p50':>9} {'ttft p95':>9}"
+    print(header)
+    print("-"*width)
+    for step in results["steps"]:
+        line = (
+            f"{step['concurrency']:>5} {step['completed']:>7} {step['errors']:>6} {step['throughput_rps']:>8.2f} "
+            f"{fmt_ms(step['p50_ms']):>9} {fmt_ms(step['p95_ms']):>9} {fmt_ms(step['p99_ms']):>9} {fmt_ms(step['max_ms']):>9}"
+        )
+        if stream:
+            line += f" {fmt_ms(step['ttft']['p50_ms']):>9} {fmt_ms(step['ttft']['p95_ms']):>9}"
+        print(line)
+    print("-"*width)
+
+    saturation = results["saturation"]
+    if saturation:
+        print(
+            f"🔴 Saturation: throughput flattens at concurrency {saturation['concurrency']} "
+            f"({saturation['throughput_rps']:.2f} req/s; concurrency {saturation['at_step']} "
+            f"adds < {results['params']['saturation_gain']:.0%})"
+        )
+    else:
+        print("🟢 No saturation: throughput still grows at the highest concurrency tested")
+
+    for step in results["steps"]:
+        if step["errors"]:
+            print(f"⚠️  concurrency {step['concurrency']}: {step['error_reasons']}")
+    print()
+
+
+def comparison_rows(results: Dict) -> Dict[str, Dict]:
+    """label → metrics, label = endpoint + concurrency"""
+    rows = {}
+    for step in results["steps"]:
+        row = {k: step[k] for k in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")}
+        if "ttft" in step:
+            row["ttft_p95_ms"] = step["ttft"]["p95_ms"]
+        rows[f"{results['endpoint']} c={step['concurrency']}"] = row
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Closed-loop load test for the AIService chat endpoints")
+    parser.add_argument("--url", default="http://localhost:8000", help="AI service base URL")
+    parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="chat")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="Các mức concurrency, tăng dần")
+    parser.add_argument("--duration", type=float, default=30.0, help="Thời gian đo mỗi bước (s)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Bỏ qua N giây đầu mỗi bước")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Timeout mỗi request (s)")
+    parser.add_argument("--saturation-gain", type=float, default=0.10,
+                        help="Throughput tăng ít hơn tỉ lệ này → bão hòa")
+    parser.add_argument("--allow-cache", action="store_true", help="Cho phép semantic response cache trả lời")
+    parser.add_argument("--stop-on-saturation", action="store_true", help="Dừng ở bước bão hòa đầu tiên")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Lưu kết quả ra file JSON")
+    parser.add_argument("--compare", help="File JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    print("\n" + "="*60)
+    print("🔥 AI SERVICE LOAD TEST")
+    print("="*60 + "\n")
+
+    try:
+        ready = requests.get(args.url.rstrip("/") + "/ready", timeout=5)
+    except requests.RequestException as e:
+        print(f"❌ AI service not reachable at {args.url}: {e}")
+        return False
+    if ready.status_code != 200:
+        print(f"❌ AI service not ready ({ready.status_code}): {ready.text[:200]}")
+        return False
+
+    print(f"🎯 {args.url}{ENDPOINTS[args.endpoint]} | concurrency {levels} | "
+          f"{args.warmup:g}s warmup + {args.duration:g}s per step | "
+          f"response cache {'allowed' if args.allow_cache else 'bypassed'}\n")
+
+    results = {
+        **run_metadata(args),
+        "endpoint": args.endpoint,
+        "steps": [],
+        "saturation": None
+    }
+    for concurrency in levels:
+        step = run_step(concurrency, args)
+        results["steps"].append(step)
+        print(f"   c={concurrency:<4} {step['throughput_rps']:.2f} req/s, p95 {fmt_ms(step['p95_ms'])}ms, "
+              f"{step['errors']} errors")
+
+        results["saturation"] = find_saturation(results["steps"], args.saturation_gain)
+        if results["saturation"] and args.stop_on_saturation:
+            break
+
+    report(results)
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print_comparison(
+            comparison_rows(results), args.compare, comparison_rows(baseline),
+            metrics=["throughput_rps", "p50_ms", "p95_ms", "p99_ms", "ttft_p95_ms"],
+            baseline_commit=baseline.get("commit")
+        )
+
+    if args.output:
+        save_results(args.output, results)
+
+    return all(step["completed"] for step in results["steps"])
+
+
+if __name__ == "__main__":
+    try:
+        success = main()
+        sys.exit(0 if success else 1)
+    except KeyboardInterrupt:
+        print("\n⚠️  Load test interrupted by user")
+        sys.exit(1)
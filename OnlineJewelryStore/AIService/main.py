@@ -1,14 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict
+import asyncio
+import contextvars
+import json
 import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Import RAG components
 from embeddings_manager import EmbeddingsManager
 from rag_service import RAGService
-from db_connector import DatabaseConnector
+from async_db import AsyncDatabaseConnector
+from change_feed import ChangeFeedConsumer, ChangeTrackingDisabled
+from live_stats import LiveStats
+from db_connector import ConnectionPool, DatabaseConnector
+from metrics import CHAT_IN_FLIGHT, CONTENT_TYPE, REGISTRY, cache_families
+from tracing import REQUEST_ID_HEADER, ConsoleExporter, JsonlExporter, sanitize_request_id, span, tracer
 
 # Setup logging
 logging.basicConfig(
@@ -55,6 +70,18 @@ class ChatResponse(BaseModel):
     timestamp: str
 
 
+class ReadinessResponse(BaseModel):
+    """Readiness probe response"""
+    model_config = {"protected_namespaces": ()}  # Cho phép field "model_loaded"
+    
+    ready: bool
+    model_loaded: bool
+    index_loaded: bool
+    warmed_up: bool
+    startup_duration_s: Optional[float] = None
+    error: Optional[str] = None
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
@@ -63,6 +90,24 @@ class HealthResponse(BaseModel):
     index_loaded: bool
     total_products: int
     ollama_url: str
+    query_cache: Optional[Dict] = None
+    response_cache: Optional[Dict] = None
+    embedding_batcher: Optional[Dict] = None
+    database_pool: Optional[Dict] = None
+    change_feed: Optional[Dict] = None
+    live_stats: Optional[Dict] = None
+
+
+class IndexUpdateResponse(BaseModel):
+    """Incremental index update response"""
+    success: bool
+    message: str
+    added: int
+    updated: int
+    unchanged: int
+    removed: int
+    total_products: int
+    timestamp: str
 
 
 class RebuildResponse(BaseModel):
@@ -71,6 +116,23 @@ class RebuildResponse(BaseModel):
     message: str
     products_indexed: int
     timestamp: str
+    job_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+class RebuildJobResponse(BaseModel):
+    """Background rebuild job status"""
+    job_id: str
+    status: str  # queued | running | completed | failed
+    message: str
+    products_indexed: int
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    duration_s: Optional[float] = None
+    encode_stats: Optional[Dict] = None  # Timing encode (workers, texts/s, speedup)
+    request_id: Optional[str] = None  # Trace id của job (xem tracing.py)
+    error: Optional[str] = None
 
 
 # ===== FASTAPI APP =====
@@ -99,8 +161,72 @@ class AppState:
     rag_service: Optional[RAGService] = None
     initialized: bool = False
     connection_string: str = "Driver={SQL Server};Server=DESKTOP-195HJGO\\SQLEXPRESS;Database=OnlineJewelryStore;UID=sa;PWD=1;TrustServerCertificate=yes;"
+    db_pool: Optional[ConnectionPool] = None
+    db_pool_min_size: int = 1
+    db_pool_max_size: int = 5  # Giới hạn số connection tới SQL Server của mỗi worker
+    db_pool_idle_timeout: float = 300.0  # Đóng connection idle quá N giây (giữ lại min_size)
+    async_db: Optional[AsyncDatabaseConnector] = None  # Query DB từ handler async (thread pool riêng)
     ollama_url: str = "http://localhost:11434"
     model_name: str = "llama3.2:3b"
+    encoder_backend: str = "torch"  # torch | onnx | onnx_int8 (export: python encoders.py)
+    onnx_model_dir: Optional[str] = None  # Mặc định models/all-MiniLM-L6-v2-onnx
+    onnx_allow_unverified: bool = False  # True: dùng model ONNX verify không đạt (mặc định: fallback torch)
+    query_cache_size: int = 1024  # Số query embedding giữ trong LRU cache
+    index_type: str = "flat"  # flat | ivf_flat | ivf_pq | hnsw (xem benchmark_index.py); workers > 1: flat/hnsw → ivf_flat
+    index_nprobe: int = 10
+    index_ef_search: int = 64
+    encode_chunk_size: int = 1024  # Rebuild: số sản phẩm encode + add mỗi lượt
+    db_fetch_size: int = 1000  # Rebuild: số dòng mỗi lần fetchmany
+    encode_workers: int = 1  # Rebuild: số process encode song song (1 = trong process server)
+    index_mmap: bool = True  # Load index read-only qua mmap, các worker dùng chung page cache (chỉ IVF)
+    # > 1: chạy nhiều uvicorn worker process (không reload). faiss 1.7 chỉ mmap được
+    # inverted lists của IVF, flat/HNSW bị copy vào RAM từng worker → khi đó dùng ivf_flat + mmap
+    workers: int = 1
+    index_reload_interval: float = 10.0  # Worker kiểm tra file index mới mỗi N giây
+    embedding_micro_batching: bool = True  # Gom query encode của các chat đồng thời
+    embedding_batch_size: int = 32
+    embedding_batch_wait_ms: float = 5.0
+    index_delta_max_size: int = 2000  # Change feed: số sản phẩm đổi giữ ở index delta trước khi gộp
+    rag_workers: int = 4  # Số chat xử lý song song ngoài event loop
+    ollama_pool_size: int = 10
+    ollama_connect_timeout: float = 5.0
+    ollama_read_timeout: float = 120.0
+    ollama_max_retries: int = 2
+    response_cache_size: int = 512  # Semantic cache cho câu trả lời hoàn chỉnh
+    response_cache_ttl: float = 3600
+    response_cache_threshold: float = 0.95
+    hybrid_search: bool = True  # Vector + BM25, gộp bằng reciprocal rank fusion
+    
+    # Rebuild/update chạy nền trên 1 thread riêng, tuần tự
+    index_executor: Optional[ThreadPoolExecutor] = None
+    rebuild_jobs: "OrderedDict[str, Dict]" = OrderedDict()
+    max_rebuild_jobs: int = 20  # Số job giữ lại để tra cứu status
+    rebuild_jobs_dir: str = "data/rebuild_jobs"  # Status ghi ra file → worker nào cũng trả lời được poll
+    index_watcher: Optional[asyncio.Task] = None
+    
+    # Change tracking → apply sản phẩm thay đổi vào index (xem change_feed.py)
+    change_feed_enabled: bool = True  # Tự tắt nếu database chưa bật change tracking
+    change_feed_interval: float = 5.0  # Poll mỗi N giây
+    change_feed_save_interval: float = 60.0  # Lưu index tối đa 1 lần / N giây (chỉ khi workers = 1)
+    change_feed: Optional[ChangeFeedConsumer] = None
+    change_feed_task: Optional[asyncio.Task] = None
+    index_dirty: bool = False  # Index đã đổi từ lần save gần nhất
+    
+    # Giá / tồn kho / rating không embed, refresh từ DB rồi join lúc trả lời
+    live_stats: Optional[LiveStats] = None
+    live_stats_interval: float = 30.0  # Refresh mỗi N giây
+    live_stats_task: Optional[asyncio.Task] = None
+    
+    # Tracing theo request (X-Request-ID), xem tracing.py
+    trace_console: bool = False  # Log cây span + critical path của mỗi request
+    trace_file: Optional[str] = None  # vd. "logs/traces.jsonl": 1 dòng JSON / request, ghi nền + rotate
+    trace_min_duration_ms: float = 0.0  # Chỉ export request chậm hơn N ms
+    
+    # Model + index load nền lúc startup, /ready trả 200 khi xong
+    loader_task: Optional[asyncio.Task] = None
+    warmed_up: bool = False
+    startup_duration_s: Optional[float] = None
+    startup_error: Optional[str] = None
 
 state = AppState()
 
@@ -109,39 +235,253 @@ state = AppState()
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize services on startup"""
+    """
+    Initialize services on startup
+    
+    Only cheap objects are created here; the model and the FAISS index are
+    loaded concurrently in the background so the server starts accepting
+    connections immediately. /ready reports when they are warm.
+    """
     logger.info("🚀 Starting AI Jewelry Advisor Service...")
     
+    state.index_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-job")
+    
+    exporters = []
+    if state.trace_console:
+        exporters.append(ConsoleExporter(min_duration_ms=state.trace_min_duration_ms))
+    if state.trace_file:
+        # Mỗi worker process ghi + rotate file riêng
+        trace_file = state.trace_file
+        if state.workers > 1:
+            root, ext = os.path.splitext(trace_file)
+            trace_file = f"{root}.{os.getpid()}{ext}"
+        exporters.append(JsonlExporter(trace_file, min_duration_ms=state.trace_min_duration_ms))
+    tracer.configure(exporters)
+    
+    # 1 pool cho cả vòng đời app; connection được tạo sẵn trong _load_resources
+    state.db_pool = ConnectionPool(
+        state.connection_string,
+        min_size=state.db_pool_min_size,
+        max_size=state.db_pool_max_size,
+        max_idle_s=state.db_pool_idle_timeout
+    )
+    state.async_db = AsyncDatabaseConnector(state.db_pool)
+    state.live_stats = LiveStats()
+    
+    index_type, index_mmap = state.index_type, state.index_mmap
+    if state.workers > 1 and not (index_type.startswith("ivf") and index_mmap):
+        # Flat/HNSW (hoặc không mmap) → mỗi worker giữ 1 bản vector riêng trong RAM
+        if not index_type.startswith("ivf"):
+            index_type = "ivf_flat"
+        index_mmap = True
+        logger.warning(
+            f"⚠️  {state.workers} workers cannot share a {state.index_type} index in memory, "
+            f"using {index_type} with mmap"
+        )
+    
     try:
-        # Load embeddings manager
-        logger.info("Loading embeddings manager...")
-        state.embeddings_manager = EmbeddingsManager()
-        state.embeddings_manager.load_model()
-        
-        # Load FAISS index
-        logger.info("Loading FAISS index...")
-        if not state.embeddings_manager.load_index("data/faiss_index"):
-            logger.error("❌ Failed to load FAISS index")
-            logger.warning("⚠️  Service started but index not loaded. Call /index-rebuild to build index.")
-        else:
-            logger.info(f"✅ Index loaded: {state.embeddings_manager.index.ntotal} products")
+        state.embeddings_manager = EmbeddingsManager(
+            query_cache_size=state.query_cache_size,
+            index_type=index_type,
+            nprobe=state.index_nprobe,
+            ef_search=state.index_ef_search,
+            micro_batching=state.embedding_micro_batching,
+            batch_max_size=state.embedding_batch_size,
+            batch_max_wait_ms=state.embedding_batch_wait_ms,
+            mmap_index=index_mmap,
+            encoder_backend=state.encoder_backend,
+            onnx_model_dir=state.onnx_model_dir,
+            allow_unverified_onnx=state.onnx_allow_unverified,
+            encode_chunk_size=state.encode_chunk_size,
+            encode_workers=state.encode_workers,
+            delta_max_size=state.index_delta_max_size
+        )
         
         # Initialize RAG service
-        logger.info("Initializing RAG service...")
         state.rag_service = RAGService(
             embeddings_manager=state.embeddings_manager,
             ollama_url=state.ollama_url,
-            model_name=state.model_name
+            model_name=state.model_name,
+            max_workers=state.rag_workers,
+            pool_size=state.ollama_pool_size,
+            connect_timeout=state.ollama_connect_timeout,
+            read_timeout=state.ollama_read_timeout,
+            max_retries=state.ollama_max_retries,
+            response_cache_size=state.response_cache_size,
+            response_cache_ttl=state.response_cache_ttl,
+            response_cache_threshold=state.response_cache_threshold,
+            hybrid_search=state.hybrid_search,
+            live_stats=state.live_stats
         )
         
-        state.initialized = True
-        logger.info("✅ AI Jewelry Advisor Service started successfully!")
+        state.loader_task = asyncio.create_task(_load_resources())
+        state.live_stats_task = asyncio.create_task(_refresh_live_stats())
         
     except Exception as e:
+        state.startup_error = str(e)
         logger.error(f"❌ Startup failed: {e}")
         logger.warning("⚠️  Service started with errors. Some endpoints may not work.")
 
 
+async def _load_resources():
+    """Load model and index in parallel, then warm up"""
+    loop = asyncio.get_running_loop()
+    em = state.embeddings_manager
+    start = time.perf_counter()
+    
+    try:
+        logger.info("Loading model and FAISS index...")
+        model_loaded, index_loaded, _ = await asyncio.gather(
+            loop.run_in_executor(None, em.load_model),
+            loop.run_in_executor(state.index_executor, em.load_index, "data/faiss_index"),
+            # DB không bắt buộc để chat; pool thử connect lại khi cần
+            loop.run_in_executor(None, state.db_pool.open)
+        )
+        
+        if not index_loaded:
+            logger.error("❌ Failed to load FAISS index")
+            logger.warning("⚠️  Service started but index not loaded. Call /index-rebuild to build index.")
+        else:
+            logger.info(f"✅ Index loaded: {em.index.ntotal} products")
+            if state.workers > 1 and not em.snapshot.mmap_path:
+                logger.warning(f"⚠️  Index is not memory-mapped (built as {type(em.index).__name__}), "
+                               f"each worker holds a copy; call /index-rebuild to build {em.index_type}")
+        
+        if not model_loaded:
+            state.startup_error = "Failed to load embedding model"
+            logger.error("❌ Service not ready: embedding model failed to load")
+            return
+        
+        if index_loaded and em.text_format_stale:
+            # Vector được embed với format text cũ → encode lại toàn bộ,
+            # index cũ vẫn phục vụ /chat cho tới khi rebuild swap vào
+            if state.workers == 1:
+                job = _start_rebuild_job()
+                logger.warning(f"⚠️  Index text format is outdated, rebuilding (job {job['job_id']})")
+            else:
+                logger.warning("⚠️  Index text format is outdated, call /index-rebuild on one worker")
+        
+        state.warmed_up = await loop.run_in_executor(None, em.warm_up)
+        
+        if state.workers > 1:
+            # Rebuild chỉ chạy trên 1 worker → các worker khác reload từ file đã lưu
+            state.index_watcher = asyncio.create_task(_watch_index_files())
+        
+        if state.change_feed_enabled:
+            state.change_feed = ChangeFeedConsumer(
+                DatabaseConnector(state.connection_string, pool=state.db_pool),
+                em,
+                on_change=_on_index_changed
+            )
+            state.change_feed_task = asyncio.create_task(_consume_change_feed())
+        
+        state.initialized = True
+        state.startup_duration_s = round(time.perf_counter() - start, 3)
+        logger.info(f"✅ AI Jewelry Advisor Service ready in {state.startup_duration_s}s!")
+        
+    except Exception as e:
+        state.startup_error = str(e)
+        logger.error(f"❌ Startup failed: {e}")
+
+
+async def _refresh_live_stats():
+    """Reload price/stock/rating side-table định kỳ (không re-encode gì)"""
+    loop = asyncio.get_running_loop()
+    db = DatabaseConnector(state.connection_string, pool=state.db_pool)
+    
+    while True:
+        try:
+            # Bảng mới có generation mới → response cache không trả câu trả lời giá cũ
+            await loop.run_in_executor(None, state.live_stats.refresh, db)
+        except Exception as e:
+            logger.error(f"❌ Live stats refresh failed: {e}")
+        
+        await asyncio.sleep(state.live_stats_interval)
+
+
+def _on_index_changed(counts: Dict[str, int]):
+    """Change feed callback (index version mới → response cache tự bỏ câu trả lời cũ)"""
+    state.index_dirty = True
+
+
+def _save_index_if_dirty():
+    if state.index_dirty:
+        state.index_dirty = False
+        if not state.embeddings_manager.save_index("data/faiss_index"):
+            state.index_dirty = True
+
+
+async def _consume_change_feed():
+    """
+    Poll change tracking and apply changed products to the live index
+    
+    Polls run on index_executor, so they never overlap a rebuild/update.
+    With several workers each one consumes the feed itself and only
+    /index-rebuild writes the index files.
+    """
+    loop = asyncio.get_running_loop()
+    delay = state.change_feed_interval
+    last_save = time.monotonic()
+    
+    while True:
+        try:
+            await loop.run_in_executor(state.index_executor, state.change_feed.poll)
+            delay = state.change_feed_interval
+        except ChangeTrackingDisabled as e:
+            logger.warning(f"⚠️  {e}. Change feed stopped (setup: see change_feed.py)")
+            return
+        except Exception as e:
+            delay = min(delay * 2, 300.0)  # Database lỗi → backoff
+            logger.error(f"❌ Change feed poll failed, retrying in {delay:.0f}s: {e}")
+        
+        if state.workers == 1 and state.index_dirty and time.monotonic() - last_save >= state.change_feed_save_interval:
+            try:
+                await loop.run_in_executor(state.index_executor, _save_index_if_dirty)
+            except Exception as e:
+                logger.error(f"❌ Failed to save index after change feed updates: {e}")
+            last_save = time.monotonic()
+        
+        await asyncio.sleep(delay)
+
+
+async def _watch_index_files():
+    """Reload the index when another worker process saves a new one"""
+    loop = asyncio.get_running_loop()
+    
+    while True:
+        await asyncio.sleep(state.index_reload_interval)
+        try:
+            # Chạy trên index_executor → không chồng lên update/rebuild của worker này
+            await loop.run_in_executor(state.index_executor, state.embeddings_manager.reload_if_changed)
+        except Exception as e:
+            logger.error(f"❌ Index reload check failed: {e}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release worker threads, batcher and pooled Ollama/database connections on shutdown"""
+    for task in (state.loader_task, state.index_watcher, state.change_feed_task, state.live_stats_task):
+        if task:
+            task.cancel()
+    
+    if state.rag_service:
+        state.rag_service.close()
+    
+    if state.index_executor:
+        state.index_executor.shutdown(wait=False, cancel_futures=True)
+    
+    if state.embeddings_manager:
+        state.embeddings_manager.close()
+    
+    if state.async_db:
+        state.async_db.close()
+    
+    if state.db_pool:
+        state.db_pool.close()
+    
+    tracer.close()
+
+
 # ===== API ENDPOINTS =====
 
 @app.get("/", tags=["Root"])
@@ -153,8 +493,13 @@ async def root():
         "status": "running",
         "endpoints": {
             "chat": "/chat",
+            "chat_stream": "/chat/stream",
             "health": "/health",
+            "live": "/live",
+            "ready": "/ready",
             "rebuild": "/index-rebuild",
+            "update": "/index-update",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }
@@ -171,13 +516,102 @@ async def health_check():
         service="AI Jewelry Advisor",
         timestamp=datetime.now().isoformat(),
         index_loaded=state.embeddings_manager is not None and state.embeddings_manager.index is not None,
-        total_products=state.embeddings_manager.index.ntotal if state.embeddings_manager and state.embeddings_manager.index else 0,
-        ollama_url=state.ollama_url
+        total_products=len(state.embeddings_manager.product_data) if state.embeddings_manager else 0,
+        ollama_url=state.ollama_url,
+        query_cache=state.embeddings_manager.query_cache.stats() if state.embeddings_manager else None,
+        response_cache=state.rag_service.response_cache.stats() if state.rag_service else None,
+        embedding_batcher=state.embeddings_manager.batcher.stats() if state.embeddings_manager else None,
+        database_pool=state.db_pool.stats() if state.db_pool else None,
+        change_feed=state.change_feed.stats() if state.change_feed else None,
+        live_stats=state.live_stats.stats() if state.live_stats is not None else None
+    )
+
+
+def _collect_metrics():
+    """Giá trị đọc từ state lúc scrape: cache, index, batcher, DB pool"""
+    em, rag = state.embeddings_manager, state.rag_service
+    
+    families = cache_families("rag_cache", {
+        "query_embedding": em.query_cache.stats if em else None,
+        "response": rag.response_cache.stats if rag else None
+    })
+    
+    snapshot = em.snapshot if em else None
+    families += [
+        ("rag_ready", "gauge", "1 when model and index are loaded", [("", {}, 1 if state.initialized else 0)]),
+        ("rag_index_vectors", "gauge", "Vectors in the main FAISS index", [("", {}, snapshot.index.ntotal if snapshot and snapshot.index else 0)]),
+        ("rag_index_delta_products", "gauge", "Changed products waiting in the delta index", [("", {}, snapshot.delta.size if snapshot and snapshot.delta else 0)]),
+        ("rag_index_version", "gauge", "Index generation, bumped on every swap", [("", {}, em.index_version if em else 0)]),
+        ("rag_workers", "gauge", "Chats processed in parallel outside the event loop", [("", {}, state.rag_workers)])
+    ]
+    
+    if em and em.batcher:
+        batcher = em.batcher.stats()
+        families += [
+            ("rag_embedding_batches", "counter", "Query encode batches", [("_total", {}, batcher["batches"])]),
+            ("rag_embedding_batched_queries", "counter", "Queries encoded through the batcher", [("_total", {}, batcher["queries"])]),
+            ("rag_embedding_batch_pending", "gauge", "Queries waiting for the next batch", [("", {}, batcher["pending"])])
+        ]
+    
+    if state.db_pool:
+        pool = state.db_pool.stats()
+        families += [
+            ("rag_db_pool_connections", "gauge", "Pooled SQL Server connections", [
+                ("", {"state": "idle"}, pool["idle"]),
+                ("", {"state": "in_use"}, pool["in_use"])
+            ]),
+            ("rag_db_pool_timeouts", "counter", "Acquire calls that timed out", [("_total", {}, pool["timeouts"])])
+        ]
+    
+    return families
+
+
+REGISTRY.register_collector(_collect_metrics)
+
+
+@app.get("/metrics", tags=["Health"])
+async def metrics():
+    """
+    Prometheus metrics (text format 0.0.4)
+    
+    Per-stage latency histograms, Llama tokens/s, chat outcomes,
+    in-flight requests, cache hit ratios and index size.
+    """
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/live", tags=["Health"])
+async def liveness():
+    """Liveness probe: process is up and the event loop responds"""
+    return {"status": "alive"}
+
+
+@app.get("/ready", response_model=ReadinessResponse, tags=["Health"])
+async def readiness():
+    """
+    Readiness probe for the load balancer
+    
+    Returns 200 only once the model is loaded and warmed up and an index
+    is available; 503 while startup is still in progress.
+    """
+    em = state.embeddings_manager
+    model_loaded = em is not None and em.model is not None
+    index_loaded = em is not None and em.index is not None
+    ready = state.initialized and model_loaded and index_loaded and state.warmed_up
+    
+    body = ReadinessResponse(
+        ready=ready,
+        model_loaded=model_loaded,
+        index_loaded=index_loaded,
+        warmed_up=state.warmed_up,
+        startup_duration_s=state.startup_duration_s,
+        error=state.startup_error
     )
+    return JSONResponse(status_code=200 if ready else 503, content=body.model_dump())
 
 
 @app.post("/chat", response_model=ChatResponse, tags=["Chat"])
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response, x_request_id: Optional[str] = Header(None)):
     """
     Main chat endpoint
     
@@ -185,6 +619,7 @@ async def chat(request: ChatRequest):
     
     Args:
         request: ChatRequest with message and optional filters
+        x_request_id: X-Request-ID header (trace id, echoed back; sinh mới nếu thiếu)
         
     Returns:
         ChatResponse with AI message and suggested products
@@ -201,21 +636,26 @@ async def chat(request: ChatRequest):
             detail="Product index not loaded. Please rebuild index using /index-rebuild endpoint."
         )
     
+    request_id = sanitize_request_id(x_request_id)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    
+    CHAT_IN_FLIGHT.inc(endpoint="/chat")
     try:
-        logger.info(f"Processing chat request: {request.message[:50]}...")
-        
-        # Call RAG service
-        result = state.rag_service.chat(
-            user_query=request.message,
-            category=request.category,
-            min_price=request.min_price,
-            max_price=request.max_price,
-            conversation_history=request.conversation_history,
-            top_k=3
-        )
+        logger.info(f"Processing chat request {request_id}: {request.message[:50]}...")
+        
+        # Call RAG service (chạy trên worker pool, không block event loop)
+        with tracer.start_trace("POST /chat", request_id=request_id, message_chars=len(request.message)):
+            result = await state.rag_service.achat(
+                user_query=request.message,
+                category=request.category,
+                min_price=request.min_price,
+                max_price=request.max_price,
+                conversation_history=request.conversation_history,
+                top_k=3
+            )
         
         if not result['success']:
-            raise HTTPException(status_code=500, detail=result['message'])
+            raise HTTPException(status_code=500, detail=result['message'], headers={REQUEST_ID_HEADER: request_id})
         
         # Convert to response model
         products = [
@@ -240,72 +680,414 @@ async def chat(request: ChatRequest):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"❌ Chat error: {e}")
+        logger.error(f"❌ Chat error ({request_id}): {e}")
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to process request: {str(e)}"
+            detail=f"Failed to process request: {str(e)}",
+            headers={REQUEST_ID_HEADER: request_id}
         )
+    finally:
+        CHAT_IN_FLIGHT.dec(endpoint="/chat")
 
 
-@app.post("/index-rebuild", response_model=RebuildResponse, tags=["Admin"])
-async def rebuild_index():
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream(request: ChatRequest, x_request_id: Optional[str] = Header(None)):
     """
-    Rebuild FAISS index from database
+    Streaming chat endpoint (NDJSON)
     
-    This endpoint should be called:
-    - After adding new products to database
-    - When product information is updated
-    - Periodically (e.g., daily) to ensure index is up-to-date
+    Sends product suggestions as soon as retrieval finishes, then relays
+    Llama tokens as Ollama generates them. Each line is one JSON event:
+    
+    - {"type": "products", "products": [...]}
+    - {"type": "token", "content": "..."}
+    - {"type": "done", "success": true, "timestamp": "..."}
+    - {"type": "error", "message": "..."}
+    
+    Args:
+        request: ChatRequest with message and optional filters
+        x_request_id: X-Request-ID header (trace id, echoed back; sinh mới nếu thiếu)
+    """
+    if not state.initialized or not state.rag_service:
+        raise HTTPException(
+            status_code=503,
+            detail="Service not initialized. Please try again later or contact administrator."
+        )
+    
+    if not state.embeddings_manager.index:
+        raise HTTPException(
+            status_code=503,
+            detail="Product index not loaded. Please rebuild index using /index-rebuild endpoint."
+        )
+    
+    request_id = sanitize_request_id(x_request_id)
+    logger.info(f"Processing streaming chat request {request_id}: {request.message[:50]}...")
+    
+    async def event_stream():
+        CHAT_IN_FLIGHT.inc(endpoint="/chat/stream")
+        try:
+            # Trace kéo dài đến token cuối, không chỉ đến lúc gửi header
+            with tracer.start_trace("POST /chat/stream", request_id=request_id, message_chars=len(request.message)):
+                async for event in state.rag_service.achat_stream(
+                    user_query=request.message,
+                    category=request.category,
+                    min_price=request.min_price,
+                    max_price=request.max_price,
+                    conversation_history=request.conversation_history,
+                    top_k=3
+                ):
+                    if event['type'] == 'products':
+                        event['products'] = [ProductInfo(**p).model_dump() for p in event['products']]
+                    elif event['type'] == 'done':
+                        event['timestamp'] = datetime.now().isoformat()
+                    
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+                
+        except Exception as e:
+            logger.error(f"❌ Chat stream error ({request_id}): {e}")
+            yield json.dumps({
+                "type": "error",
+                "message": f"Failed to process request: {str(e)}"
+            }, ensure_ascii=False) + "\n"
+        finally:
+            CHAT_IN_FLIGHT.dec(endpoint="/chat/stream")
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", REQUEST_ID_HEADER: request_id}
+    )
+
+
+async def _load_products_from_db() -> List[Dict]:
+    """Load all active products from database (không block event loop)"""
+    products = await state.async_db.get_all_products()
+    
+    if not products:
+        raise Exception("No products found in database (or database unavailable)")
+    
+    logger.info(f"Loaded {len(products)} products from database")
+    return products
+
+
+def _rebuild_index_sync(encode_workers: Optional[int] = None) -> int:
+    """
+    Blocking part of /index-rebuild: stream products, build and save index
+    
+    Products are streamed from the DB cursor straight into chunked
+    encoding, so memory during the rebuild is bounded by the chunk size.
+    The index file lock is held from build to save: a rebuild started on
+    another worker waits instead of encoding the catalog a second time
+    in parallel.
+    
+    Args:
+        encode_workers: Số process encode (None = state.encode_workers)
     
     Returns:
-        RebuildResponse with rebuild status
+        Number of indexed products
     """
-    if not state.embeddings_manager:
+    with state.embeddings_manager.file_lock("data/faiss_index"):
+        return _rebuild_and_save(encode_workers)
+
+
+def _rebuild_and_save(encode_workers: Optional[int]) -> int:
+    db = DatabaseConnector(state.connection_string, pool=state.db_pool)
+    with span("DatabaseConnector.connect") as connect_span:
+        connected = db.connect()
+        if not connected:
+            connect_span.record_error("connect failed")
+    if not connected:
+        raise Exception("Failed to connect to database")
+    
+    try:
+        # Rebuild index
+        products = db.iter_products(batch_size=state.db_fetch_size)
+        if not state.embeddings_manager.build_index(products, encode_workers=encode_workers):
+            raise Exception("Failed to build index")
+    finally:
+        db.disconnect()
+    
+    # Save index
+    if not state.embeddings_manager.save_index("data/faiss_index"):
+        raise Exception("Failed to save index")
+    
+    return len(state.embeddings_manager.product_data)
+
+
+def _update_index_sync(products: List[Dict]) -> Dict[str, int]:
+    """
+    Blocking part of /index-update: sync index with products, save if changed
+    
+    Args:
+        products: Toàn bộ sản phẩm active từ database
+    
+    Returns:
+        Counters {"added", "updated", "unchanged", "removed"}
+    """
+    em = state.embeddings_manager
+    with em.file_lock("data/faiss_index"):
+        # Worker khác có thể vừa lưu index mới → sync trên bản đó, không ghi đè
+        em.reload_if_changed()
+        counts = em.sync_products(products)
+        
+        if counts["added"] or counts["updated"] or counts["removed"]:
+            if not em.save_index("data/faiss_index"):
+                raise Exception("Failed to save index")
+    
+    return counts
+
+
+@app.post("/index-update", response_model=IndexUpdateResponse, tags=["Admin"])
+async def update_index(response: Response, x_request_id: Optional[str] = Header(None)):
+    """
+    Incrementally update FAISS index from database
+    
+    Only products whose embedded text changed are re-encoded, new products
+    are added and deactivated/deleted products are removed. Much cheaper
+    than /index-rebuild after editing a few products.
+    
+    Returns:
+        IndexUpdateResponse with per-change counters
+    """
+    if not state.embeddings_manager or not state.embeddings_manager.model:
         raise HTTPException(
             status_code=503,
             detail="Embeddings manager not initialized"
         )
     
+    request_id = sanitize_request_id(x_request_id)
+    response.headers[REQUEST_ID_HEADER] = request_id
+    
     try:
-        logger.info("🔨 Starting index rebuild...")
+        logger.info(f"🔄 Starting incremental index update ({request_id})...")
         
-        # Connect to database
-        db = DatabaseConnector(state.connection_string)
-        if not db.connect():
-            raise Exception("Failed to connect to database")
+        with tracer.start_trace("POST /index-update", request_id=request_id):
+            with span("DatabaseConnector.get_all_products"):
+                products = await _load_products_from_db()
+            
+            loop = asyncio.get_running_loop()
+            counts = await loop.run_in_executor(
+                state.index_executor, contextvars.copy_context().run, _update_index_sync, products
+            )
         
-        # Load products
-        products = db.get_all_products()
-        db.disconnect()
+        total = len(state.embeddings_manager.product_data)
+        logger.info(f"✅ Index updated: {counts}")
         
-        if not products:
-            raise Exception("No products found in database")
+        return IndexUpdateResponse(
+            success=True,
+            message=(
+                f"Index updated: {counts['added']} added, {counts['updated']} updated, "
+                f"{counts['removed']} removed, {counts['unchanged']} unchanged"
+            ),
+            total_products=total,
+            timestamp=datetime.now().isoformat(),
+            **counts
+        )
         
-        logger.info(f"Loaded {len(products)} products from database")
+    except Exception as e:
+        logger.error(f"❌ Index update failed: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to update index: {str(e)}"
+        )
+
+
+JOB_FIELDS = set(RebuildJobResponse.model_fields)
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(state.rebuild_jobs_dir, f"{job_id}.json")
+
+
+def _save_job(job: Dict):
+    """
+    Ghi status của job ra rebuild_jobs_dir (file tạm rồi rename)
+    
+    Poll /index-rebuild/{job_id} có thể tới worker khác worker chạy job;
+    chỉ giữ max_rebuild_jobs file mới nhất.
+    """
+    try:
+        os.makedirs(state.rebuild_jobs_dir, exist_ok=True)
+        tmp_path = f"{_job_path(job['job_id'])}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in job.items() if k in JOB_FIELDS}, f, ensure_ascii=False)
+        os.replace(tmp_path, _job_path(job["job_id"]))
         
-        # Rebuild index
-        if not state.embeddings_manager.build_index(products):
-            raise Exception("Failed to build index")
+        files = sorted(
+            (entry for entry in os.scandir(state.rebuild_jobs_dir) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime_ns
+        )
+        for entry in files[:-state.max_rebuild_jobs]:
+            os.remove(entry.path)
+    except OSError as e:
+        logger.warning(f"⚠️  Could not persist rebuild job {job['job_id']}: {e}")
+
+
+def _load_job(job_id: str) -> Optional[Dict]:
+    """Job của worker này, hoặc status do worker khác ghi ra file"""
+    job = state.rebuild_jobs.get(job_id)
+    if job:
+        return job
+    if not re.fullmatch(r"[0-9a-f]{1,32}", job_id):
+        return None
+    try:
+        with open(_job_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _run_rebuild_job(job: Dict):
+    """Background rebuild: build index mới rồi swap, không block /chat"""
+    with tracer.start_trace("index_rebuild", request_id=job["request_id"], job_id=job["job_id"]) as root:
+        job["status"] = "running"
+        job["started_at"] = datetime.now().isoformat()
+        start_time = time.time()
+        _save_job(job)
         
-        # Save index
-        if not state.embeddings_manager.save_index("data/faiss_index"):
-            raise Exception("Failed to save index")
+        try:
+            logger.info(f"🔨 Starting index rebuild (job {job['job_id']})...")
+            indexed = _rebuild_index_sync(job["encode_workers"])
         
-        logger.info(f"✅ Index rebuilt successfully: {len(products)} products")
+            job["status"] = "completed"
+            job["products_indexed"] = indexed
+            job["encode_stats"] = state.embeddings_manager.last_build_stats
+            job["message"] = f"Index rebuilt successfully with {indexed} products"
+            if job["encode_stats"].get("speedup"):
+                job["message"] += f" ({job['encode_stats']['speedup']}x encode speedup on {job['encode_stats']['workers']} workers)"
+            logger.info(f"✅ Index rebuilt successfully: {indexed} products")
         
-        return RebuildResponse(
-            success=True,
-            message=f"Index rebuilt successfully with {len(products)} products",
-            products_indexed=len(products),
-            timestamp=datetime.now().isoformat()
-        )
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            job["message"] = f"Failed to rebuild index: {str(e)}"
+            root.record_error(e)
+            logger.error(f"❌ Index rebuild failed: {e}")
         
-    except Exception as e:
-        logger.error(f"❌ Index rebuild failed: {e}")
+        finally:
+            job["finished_at"] = datetime.now().isoformat()
+            job["duration_s"] = round(time.time() - start_time, 2)
+            _save_job(job)
+
+
+def _start_rebuild_job(encode_workers: Optional[int] = None, request_id: Optional[str] = None) -> Dict:
+    """
+    Queue a rebuild job, hoặc trả về job đang chạy nếu đã có
+    
+    Args:
+        encode_workers: Số process encode cho job này (None = state.encode_workers)
+        request_id: Trace id của job (None = job_id)
+    
+    Returns:
+        Job dictionary (also stored in state.rebuild_jobs)
+    """
+    for job in state.rebuild_jobs.values():
+        if job["status"] in ("queued", "running"):
+            return job
+    
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        "job_id": job_id,
+        "request_id": request_id or job_id,
+        "status": "queued",
+        "message": "Index rebuild queued",
+        "products_indexed": 0,
+        "created_at": datetime.now().isoformat(),
+        "started_at": None,
+        "finished_at": None,
+        "duration_s": None,
+        "encode_workers": encode_workers,
+        "encode_stats": None,
+        "error": None
+    }
+    _save_job(job)
+    job["future"] = state.index_executor.submit(_run_rebuild_job, job)
+    
+    state.rebuild_jobs[job["job_id"]] = job
+    while len(state.rebuild_jobs) > state.max_rebuild_jobs:
+        state.rebuild_jobs.popitem(last=False)
+    
+    return job
+
+
+@app.post("/index-rebuild", response_model=RebuildResponse, tags=["Admin"])
+async def rebuild_index(
+    response: Response,
+    wait: bool = False,
+    encode_workers: Optional[int] = Query(None, ge=1),
+    x_request_id: Optional[str] = Header(None)
+):
+    """
+    Rebuild FAISS index from database
+    
+    This endpoint should be called:
+    - After adding new products to database
+    - When product information is updated
+    - Periodically (e.g., daily) to ensure index is up-to-date
+    
+    The rebuild runs as a background job (HTTP 202): a fresh index and
+    product snapshot are built aside and swapped in atomically, so /chat
+    keeps serving the old index meanwhile. Poll /index-rebuild/{job_id}
+    for status, or pass ?wait=true to block until it finishes.
+    ?encode_workers=N encodes on N processes; the job status then reports
+    the encode throughput and speedup. The job is traced (DB connect,
+    encode, publish, save) under X-Request-ID, or the job id if absent.
+    
+    Returns:
+        RebuildResponse with job id and status
+    """
+    if not state.embeddings_manager or not state.index_executor:
         raise HTTPException(
-            status_code=500,
-            detail=f"Failed to rebuild index: {str(e)}"
+            status_code=503,
+            detail="Embeddings manager not initialized"
         )
+    
+    job = _start_rebuild_job(encode_workers, sanitize_request_id(x_request_id) if x_request_id else None)
+    response.headers[REQUEST_ID_HEADER] = job["request_id"]
+    
+    if wait:
+        await asyncio.wrap_future(job["future"])
+        
+        if job["status"] == "failed":
+            raise HTTPException(status_code=500, detail=job["message"], headers={REQUEST_ID_HEADER: job["request_id"]})
+        
+        return RebuildResponse(
+            success=True,
+            message=job["message"],
+            products_indexed=job["products_indexed"],
+            timestamp=datetime.now().isoformat(),
+            job_id=job["job_id"],
+            status=job["status"]
+        )
+    
+    response.status_code = 202
+    current_total = len(state.embeddings_manager.product_data)
+    
+    return RebuildResponse(
+        success=True,
+        message=f"Index rebuild {job['status']} (job {job['job_id']}). Current index: {current_total} products",
+        products_indexed=current_total,
+        timestamp=datetime.now().isoformat(),
+        job_id=job["job_id"],
+        status=job["status"]
+    )
+
+
+@app.get("/index-rebuild/{job_id}", response_model=RebuildJobResponse, tags=["Admin"])
+async def rebuild_status(job_id: str):
+    """
+    Status of a background rebuild job
+    
+    Works on any worker process: jobs started by another worker are read
+    from the status file it keeps in rebuild_jobs_dir.
+    
+    Args:
+        job_id: Job id returned by /index-rebuild
+    """
+    job = _load_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Rebuild job {job_id} not found")
+    
+    return RebuildJobResponse(**{k: v for k, v in job.items() if k in JOB_FIELDS})
 
 
 # ===== ERROR HANDLERS =====
@@ -313,21 +1095,24 @@ async def rebuild_index():
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
     """Handle 404 errors"""
-    return {
+    detail = getattr(exc, "detail", None)
+    return JSONResponse(status_code=404, content={
         "error": "Not Found",
-        "message": f"Endpoint {request.url.path} not found",
-        "available_endpoints": ["/", "/health", "/chat", "/index-rebuild", "/docs"]
-    }
+        "detail": detail,
+        "message": detail if detail and detail != "Not Found" else f"Endpoint {request.url.path} not found",
+        "available_endpoints": ["/", "/health", "/chat", "/chat/stream", "/index-rebuild", "/index-update", "/metrics", "/docs"]
+    })
 
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
     """Handle 500 errors"""
     logger.error(f"Internal server error: {exc}")
-    return {
+    return JSONResponse(status_code=500, content={
         "error": "Internal Server Error",
+        "detail": getattr(exc, "detail", None),
         "message": "An unexpected error occurred. Please try again later."
-    }
+    })
 
 
 # ===== RUN SERVER =====
@@ -343,10 +1128,21 @@ if __name__ == "__main__":
     print(f"🔍 Health: http://localhost:8000/health")
     print("="*60 + "\n")
     
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    if state.workers > 1:
+        # Multi-process: mỗi worker mmap cùng file IVF index/catalog → dùng chung page cache.
+        print(f"👥 Workers: {state.workers}\n")
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=state.workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
\ No newline at end of file
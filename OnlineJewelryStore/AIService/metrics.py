@@ -0,0 +1,309 @@
+"""
+Metrics - latency/throughput metrics cho /metrics (Prometheus text format)
+Registry nhỏ, không cần prometheus_client: Counter, Gauge, Histogram có labels,
+thread-safe (chat chạy trên worker pool) và render ra text exposition 0.0.4.
+
+Giá trị lấy từ object khác lúc scrape (cache hit ratio, index size...) đăng ký
+qua Registry.register_collector thay vì cập nhật ở mọi chỗ.
+
+Với workers > 1 mỗi uvicorn worker có registry riêng; scrape lần lượt sẽ
+trúng worker bất kỳ, nên so sánh theo từng process (label instance ở Prometheus).
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets (s): từ encode query (~ms) đến Llama trên CPU (~phút)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+
+# (suffix, labels, value) - 1 dòng trong output
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(text: str, quote: bool = True) -> str:
+    text = str(text).replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quote else text
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels_of(self, key: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Giá trị chỉ tăng (requests, tokens...)"""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("Counter can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [("_total", self._labels_of(k), v) for k, v in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """Giá trị tăng/giảm (request đang xử lý...)"""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        """+1 trong lúc block chạy"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [("", self._labels_of(k), v) for k, v in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Phân bố giá trị theo bucket (cumulative), tính p50/p95 bằng histogram_quantile"""
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [counts per bucket..., sum, count]
+                series = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observe thời gian chạy (s) của block, kể cả khi block raise"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._values.get(self._key(labels))
+        return series[-1] if series else 0
+
+    def samples(self) -> List[Sample]:
+        samples = []
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                labels = self._labels_of(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, series):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                samples.append(("_bucket", {**labels, "le": "+Inf"}, series[-1]))
+                samples.append(("_sum", labels, series[-2]))
+                samples.append(("_count", labels, series[-1]))
+        return samples
+
+
+# Collector: gọi lúc scrape, trả về (name, type, help, samples)
+Family = Tuple[str, str, str, List[Sample]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector: Callable[[], Iterable[Family]]):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        families: List[Family] = [
+            (m.name, m.type_name, m.documentation, m.samples()) for m in metrics
+        ]
+        for collector in collectors:
+            families.extend(collector())
+
+        lines = []
+        for name, type_name, documentation, samples in families:
+            lines.append(f"# HELP {name} {_escape(documentation, quote=False)}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4"  # Starlette thêm charset=utf-8
+
+REGISTRY = Registry()
+
+# ===== METRICS DÙNG CHUNG =====
+
+# Stage: encode | faiss_search | filter | lexical_search | search | context | prompt | llm_ttft | llm_total
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each RAG pipeline stage",
+    ["stage"]
+)
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "rag_llm_tokens_per_second",
+    "Llama generation speed (Ollama eval_count / eval_duration)",
+    ["mode"],
+    buckets=TOKENS_PER_SECOND_BUCKETS
+)
+LLM_GENERATED_TOKENS = REGISTRY.counter(
+    "rag_llm_generated_tokens",
+    "Tokens generated by Llama (Ollama eval_count)",
+    ["mode"]
+)
+LLM_ERRORS = REGISTRY.counter(
+    "rag_llm_errors",
+    "Failed Ollama calls (HTTP error, timeout, stream error)",
+    ["mode"]
+)
+CHAT_REQUESTS = REGISTRY.counter(
+    "rag_chat_requests",
+    "Chat requests handled by the RAG service, by mode and outcome (success | cache_hit | error)",
+    ["mode", "outcome"]
+)
+CHAT_SECONDS = REGISTRY.histogram(
+    "rag_chat_duration_seconds",
+    "Chat latency inside the RAG service, without queueing (stream: until the last token)",
+    ["mode"]
+)
+CHAT_IN_FLIGHT = REGISTRY.gauge(
+    "rag_http_requests_in_flight",
+    "Chat HTTP requests in progress, including those waiting for a RAG worker",
+    ["endpoint"]
+)
+
+
+def cache_families(name: str, caches: Dict[str, Optional[Callable[[], Dict]]]) -> List[Family]:
+    """
+    Hit/miss/entries families từ stats() của các cache (LRUCache, SemanticResponseCache)
+
+    Args:
+        name: Prefix metric, vd. "rag_cache"
+        caches: cache label → hàm stats() (None = bỏ qua)
+    """
+    hits, misses, ratio, entries = [], [], [], []
+    for cache, stats_fn in caches.items():
+        if stats_fn is None:
+            continue
+        stats = stats_fn()
+        labels = {"cache": cache}
+        hits.append(("_total", labels, stats["hits"]))
+        misses.append(("_total", labels, stats["misses"]))
+        ratio.append(("", labels, stats["hit_ratio"]))
+        entries.append(("", labels, stats["entries"]))
+    return [
+        (f"{name}_hits", "counter", "Cache hits", hits),
+        (f"{name}_misses", "counter", "Cache misses", misses),
+        (f"{name}_hit_ratio", "gauge", "Cache hits / lookups since start", ratio),
+        (f"{name}_entries", "gauge", "Entries currently cached", entries)
+    ]
@@ -0,0 +1,229 @@
+"""
+Ollama Stub - server giả lập Ollama /api/generate cho load test
+Không cần GPU/model: thời gian chờ token đầu (prompt eval) và tốc độ sinh
+token chỉnh được, trả về eval_count / eval_duration như Ollama thật nên
+metrics tokens/s và TTFT của AI service vẫn có số liệu.
+
+--parallel giới hạn số request được sinh đồng thời (như OLLAMA_NUM_PARALLEL);
+request vượt quá sẽ xếp hàng → load test thấy được điểm bão hòa giống thật.
+
+Usage:
+    python ollama_stub.py                                   # port 11434 như Ollama
+    python ollama_stub.py --ttft 0.8 --tokens-per-second 12 --parallel 1
+    python ollama_stub.py --port 11500 --jitter 0.2
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Optional
+
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANSWER_WORDS = (
+    "Dạ, shop gợi ý cho bạn mẫu nhẫn vàng 18K đính kim cương, thiết kế tinh tế, "
+    "phù hợp làm quà tặng. Giá nằm trong ngân sách bạn đưa ra và hiện còn hàng. "
+    "Bạn có thể xem thêm các mẫu tương tự bên dưới nhé!"
+).split(" ")
+
+
+class StubConfig:
+    """Tham số giả lập, dùng chung cho mọi request"""
+
+    def __init__(
+        self,
+        ttft: float = 0.5,
+        tokens_per_second: float = 15.0,
+        max_tokens: int = 120,
+        parallel: int = 1,
+        jitter: float = 0.1,
+        load_duration: float = 0.0
+    ):
+        """
+        Args:
+            ttft: Thời gian đọc prompt trước token đầu (s)
+            tokens_per_second: Tốc độ sinh token của mỗi request
+            max_tokens: Số token tối đa khi request không gửi num_predict
+            parallel: Số request sinh đồng thời (còn lại xếp hàng)
+            jitter: Biến thiên ngẫu nhiên ±jitter (tỉ lệ) của ttft và tốc độ
+            load_duration: Thời gian "load model" báo về trong response (s)
+        """
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.max_tokens = max_tokens
+        self.parallel = parallel
+        self.jitter = jitter
+        self.load_duration = load_duration
+        self.slots = threading.Semaphore(parallel)
+
+        # Stats
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.active = 0
+        self.queued = 0
+
+    def vary(self, value: float) -> float:
+        return value * random.uniform(1 - self.jitter, 1 + self.jitter) if self.jitter else value
+
+
+class Generation:
+    """1 lần generate: xếp hàng lấy slot, chờ ttft, rồi sinh token theo tốc độ"""
+
+    def __init__(self, config: StubConfig, num_predict: Optional[int]):
+        self.config = config
+        self.tokens = min(num_predict or config.max_tokens, config.max_tokens)
+        self.ttft = config.vary(config.ttft)
+        self.token_interval = 1.0 / config.vary(config.tokens_per_second)
+        self.start = time.perf_counter()
+        self.eval_duration = 0.0
+
+    def run(self) -> Iterator[str]:
+        """Yield token; giữ 1 slot trong suốt thời gian sinh"""
+        config = self.config
+        with config._lock:
+            config.requests += 1
+            config.queued += 1
+
+        with config.slots:
+            with config._lock:
+                config.queued -= 1
+                config.active += 1
+            try:
+                time.sleep(self.ttft)
+                eval_start = time.perf_counter()
+                words = itertools.cycle(ANSWER_WORDS)
+                for i in range(self.tokens):
+                    # Ngủ tới mốc của token i, không cộng dồn sai số của sleep
+                    delay = eval_start + (i + 1) * self.token_interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    yield ("" if i == 0 else " ") + next(words)
+                self.eval_duration = time.perf_counter() - eval_start
+            finally:
+                with config._lock:
+                    config.active -= 1
+
+    def final_stats(self) -> Dict:
+        """Các field timing như Ollama (nanoseconds)"""
+        return {
+            "done": True,
+            "total_duration": int((time.perf_counter() - self.start) * 1e9),
+            "load_duration": int(self.config.load_duration * 1e9),
+            "prompt_eval_duration": int(self.ttft * 1e9),
+            "eval_count": self.tokens,
+            "eval_duration": int(self.eval_duration * 1e9)
+        }
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive cho connection pool của RAGService
+    config: StubConfig = None
+
+    def log_message(self, format, *args):
+        pass  # Tắt access log, load test sinh rất nhiều request
+
+    def _send_json(self, status: int, body: Dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, body: Dict):
+        data = (json.dumps(body, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": "stub"}]})
+        elif self.path == "/stats":
+            config = self.config
+            self._send_json(200, {"requests": config.requests, "active": config.active, "queued": config.queued})
+        else:
+            self._send_json(200, {"status": "Ollama stub is running"})
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": f"unknown endpoint {self.path}"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        model = payload.get("model", "stub")
+        generation = Generation(self.config, (payload.get("options") or {}).get("num_predict"))
+
+        if not payload.get("stream", True):
+            text = "".join(generation.run())
+            self._send_json(200, {"model": model, "response": text, **generation.final_stats()})
+            return
+
+        # Stream NDJSON bằng chunked encoding, 1 chunk / token
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in generation.run():
+                self._write_chunk({"model": model, "response": token, "done": False})
+            self._write_chunk({"model": model, "response": "", **generation.final_stats()})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client ngắt stream
+
+
+def make_server(config: StubConfig, host: str = "127.0.0.1", port: int = 11434) -> ThreadingHTTPServer:
+    """HTTP server (chưa chạy) dùng config; gọi serve_forever() hoặc chạy trong thread"""
+    handler = type("ConfiguredOllamaStubHandler", (OllamaStubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama /api/generate stub with tunable latency and token rate")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--ttft", type=float, default=0.5, help="Thời gian đến token đầu (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=15.0, help="Tốc độ sinh token mỗi request")
+    parser.add_argument("--max-tokens", type=int, default=120, help="Số token tối đa mỗi câu trả lời")
+    parser.add_argument("--parallel", type=int, default=1, help="Số request sinh đồng thời (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Biến thiên ngẫu nhiên ±tỉ lệ")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        max_tokens=args.max_tokens,
+        parallel=args.parallel,
+        jitter=args.jitter
+    )
+    server = make_server(config, args.host, args.port)
+
+    logger.info(
+        f"🦙 Ollama stub on http://{args.host}:{args.port} "
+        f"(ttft={args.ttft}s, {args.tokens_per_second} tok/s, max_tokens={args.max_tokens}, parallel={args.parallel})"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
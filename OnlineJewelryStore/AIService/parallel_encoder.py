@@ -0,0 +1,170 @@
+"""
+Parallel Encoder - encode product text trên nhiều process khi build index
+Mỗi worker process load 1 bản model riêng; mỗi lần encode, list text được chia
+thành các shard liên tiếp và ghép lại đúng thứ tự submit (không theo thứ tự
+hoàn thành), nên vector luôn khớp với thứ tự product.
+
+Chỉ dùng cho full rebuild: N bản model trong RAM chỉ đáng khi encode cả catalog.
+"""
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import logging
+
+from tracing import traced
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model của worker process (set trong _init_worker)
+_worker_model = None
+
+
+def _init_worker(
+    backend: str, model_name: str, onnx_model_dir: Optional[str], num_threads: int, allow_unverified: bool
+):
+    """Process initializer: giới hạn thread rồi load model 1 lần cho mỗi worker"""
+    global _worker_model
+
+    from encoders import create_encoder
+
+    if backend == 'torch':
+        import torch
+        torch.set_num_threads(num_threads)
+    _worker_model = create_encoder(
+        backend, model_name, onnx_model_dir, num_threads=num_threads, allow_unverified=allow_unverified
+    )
+
+
+def _encode_shard(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts, convert_to_numpy=True).astype('float32')
+
+
+def _worker_pid(delay: float) -> int:
+    # Giữ worker bận 1 chút để các ping khác rơi vào process khác
+    time.sleep(delay)
+    return os.getpid()
+
+
+class ParallelEncoder:
+    def __init__(
+        self,
+        backend: str,
+        model_name: str,
+        onnx_model_dir: Optional[str] = None,
+        workers: int = 2,
+        threads_per_worker: Optional[int] = None,
+        allow_unverified_onnx: bool = False
+    ):
+        """
+        Multi-process encoder có cùng interface encode() như SentenceTransformer
+
+        Args:
+            backend: 'torch' | 'onnx' | 'onnx_int8' (xem encoders.py)
+            model_name: SentenceTransformer model name
+            onnx_model_dir: Thư mục model ONNX (backend onnx*)
+            workers: Số worker process
+            threads_per_worker: Số thread tính toán mỗi worker
+                               (mặc định chia đều CPU cho các worker)
+            allow_unverified_onnx: Xem create_encoder(allow_unverified)
+        """
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+
+        self.backend = backend
+        self.model_name = model_name
+        self.onnx_model_dir = onnx_model_dir
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.allow_unverified_onnx = allow_unverified_onnx
+
+        self._executor = None
+        self.startup_s = 0.0
+        self.encoded = 0
+        self.encode_s = 0.0
+
+    @traced()
+    def start(self, timeout: float = 300.0):
+        """
+        Spawn worker processes và chờ chúng load xong model
+
+        Thời gian load model được tính riêng (startup_s), không lẫn vào
+        throughput encode.
+        """
+        start = time.perf_counter()
+
+        # spawn: an toàn với torch/OpenMP thread của process cha (và là mặc định trên Windows)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self.backend, self.model_name, self.onnx_model_dir,
+                self.threads_per_worker, self.allow_unverified_onnx
+            )
+        )
+
+        # Ping đến khi đủ số worker đã chạy initializer (hoặc hết timeout)
+        pids = set()
+        while len(pids) < self.workers and time.perf_counter() - start < timeout:
+            futures = [self._executor.submit(_worker_pid, 0.05) for _ in range(self.workers)]
+            pids.update(f.result(timeout=timeout) for f in futures)
+
+        self.startup_s = time.perf_counter() - start
+        logger.info(
+            f"✅ Parallel encoder ready: {len(pids)} workers × {self.threads_per_worker} threads "
+            f"({self.startup_s:.1f}s to load models)"
+        )
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self) -> "ParallelEncoder":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def encode(self, sentences: List[str], convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        """
+        Encode texts trên các worker
+
+        Args:
+            sentences: List of texts
+
+        Returns:
+            float32 matrix (n, dimension), hàng i ứng với sentences[i]
+        """
+        if self._executor is None:
+            raise RuntimeError("ParallelEncoder not started")
+
+        start = time.perf_counter()
+
+        # Shard liên tiếp, ghép theo thứ tự submit → thứ tự output xác định
+        bounds = np.linspace(0, len(sentences), self.workers + 1).astype(int)
+        futures = [
+            self._executor.submit(_encode_shard, sentences[lo:hi])
+            for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo
+        ]
+        embeddings = np.concatenate([f.result() for f in futures])
+
+        self.encode_s += time.perf_counter() - start
+        self.encoded += len(sentences)
+        return embeddings
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "startup_s": round(self.startup_s, 2),
+            "encoded": self.encoded,
+            "encode_s": round(self.encode_s, 2)
+        }
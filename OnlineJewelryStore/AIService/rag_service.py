@@ -3,12 +3,24 @@ RAG Service - Core Pipeline OPTIMIZED
 Kết hợp vector search với Llama LLM để tạo AI advisor
 """
 
+import asyncio
+import contextvars
+import functools
 import requests
 import json
+import random
 import time
-from typing import List, Dict, Optional, Tuple
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple, Iterator, AsyncIterator
 import logging
 
+import numpy as np
+
+from cache import SemanticResponseCache
+from tracing import current_span, span, traced
+from metrics import CHAT_REQUESTS, CHAT_SECONDS, LLM_ERRORS, LLM_GENERATED_TOKENS, LLM_TOKENS_PER_SECOND, STAGE_SECONDS
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -18,7 +30,20 @@ class RAGService:
         self, 
         embeddings_manager,
         ollama_url: str = "http://localhost:11434",
-        model_name: str = "llama3.2:3b"
+        model_name: str = "llama3.2:3b",
+        max_workers: int = 4,
+        pool_size: int = 10,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 120.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        response_cache_size: int = 512,
+        response_cache_ttl: float = 3600,
+        response_cache_threshold: float = 0.95,
+        hybrid_search: bool = True,
+        rrf_k: int = 60,
+        min_score: float = 0.3,
+        live_stats=None
     ):
         """
         Initialize RAG Service
@@ -27,12 +52,118 @@ class RAGService:
             embeddings_manager: EmbeddingsManager instance với loaded index
             ollama_url: Ollama API endpoint
             model_name: Llama model name
+            max_workers: Số thread tối đa chạy pipeline (encode + Ollama) ngoài event loop
+            pool_size: Số keep-alive connection tối đa tới Ollama
+            connect_timeout: Timeout (s) khi mở TCP connection
+            read_timeout: Timeout (s) chờ dữ liệu từ Ollama (generation có thể rất lâu)
+            max_retries: Số lần retry khi lỗi kết nối
+            retry_backoff: Base delay (s) cho exponential backoff với jitter
+            response_cache_size: Số câu trả lời tối đa trong semantic cache (0 = tắt)
+            response_cache_ttl: Thời gian sống (s) của câu trả lời cache
+            response_cache_threshold: Cosine similarity tối thiểu để dùng lại câu trả lời
+            hybrid_search: Kết hợp BM25 với vector search (reciprocal rank fusion)
+            rrf_k: Hằng số k của RRF (càng lớn, thứ hạng đầu càng ít áp đảo)
+            min_score: Cosine similarity tối thiểu của sản phẩm trả về (cả khi hybrid)
+            live_stats: LiveStats - giá/tồn kho/rating hiện tại join vào kết quả (optional)
         """
         self.em = embeddings_manager
+        self.live_stats = live_stats
+        self.hybrid_search = hybrid_search
+        self.rrf_k = rrf_k
+        self.min_score = min_score
         self.ollama_url = ollama_url
         self.model_name = model_name
         self.api_endpoint = f"{ollama_url}/api/generate"
+        
+        # Bounded pool: encode và requests.post đều blocking, chạy ở đây để
+        # event loop của FastAPI vẫn phục vụ /health trong lúc Llama đang generate
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="rag-worker"
+        )
+        
+        # Long-lived pooled HTTP client: reuse TCP connections tới Ollama
+        # thay vì mở connection mới cho mỗi chat
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=0  # Retry tự xử lý trong _post (có jitter)
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # Semantic cache trước call_llama: câu hỏi gần giống + cùng filter → dùng lại
+        self.response_cache = SemanticResponseCache(
+            max_entries=response_cache_size,
+            ttl_seconds=response_cache_ttl,
+            similarity_threshold=response_cache_threshold
+        )
+    
+    async def run_in_executor(self, func, *args, **kwargs):
+        """
+        Run a blocking function on the RAG thread pool
+        
+        The caller's context (current trace span) is copied into the
+        worker thread, so spans opened by func nest under the request.
+        
+        Args:
+            func: Blocking callable
+            *args, **kwargs: Arguments forwarded to func
+            
+        Returns:
+            Return value of func
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+        )
+    
+    def close(self):
+        """Release the worker pool and HTTP connections (called on FastAPI shutdown)"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        logger.info("RAG worker pool and Ollama connections closed")
+    
+    def _post(self, payload: Dict, stream: bool = False) -> requests.Response:
+        """
+        POST tới Ollama qua pooled session, retry khi lỗi kết nối
+        
+        Only connection errors are retried (the request never reached
+        Ollama); read timeouts are not, since generation already started.
+        
+        Args:
+            payload: JSON payload
+            stream: Stream the response body
+            
+        Returns:
+            requests.Response
+        """
+        attempt = 0
+        while True:
+            try:
+                return self.session.post(
+                    self.api_endpoint,
+                    json=payload,
+                    stream=stream,
+                    timeout=self.timeout
+                )
+            except requests.exceptions.ConnectionError as e:
+                if attempt >= self.max_retries:
+                    raise
+                
+                # Exponential backoff với full jitter
+                delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+                attempt += 1
+                logger.warning(f"⚠️  Ollama connection error ({e}), retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(delay)
     
+    @traced()
     def search_products(
         self,
         query: str,
@@ -44,6 +175,16 @@ class RAGService:
         """
         Search products với filters
         
+        With hybrid_search, vector hits are reranked by reciprocal rank
+        fusion with the BM25 ranking, so exact names/terms ("Rose Gold",
+        "18K") move up among the candidates. Only vector hits above
+        min_score are returned and scores stay their cosine similarity.
+        
+        The price filter uses the current prices from live_stats inside
+        both searches, so products whose price moved into the range are
+        found and a full top_k comes back. Results carry the same table's
+        price/stock/rating.
+        
         Args:
             query: User query
             category: Tên category (optional)
@@ -54,38 +195,66 @@ class RAGService:
         Returns:
             List of (product, score) tuples
         """
-        # Vector search - lấy nhiều để filter
-        results = self.em.search(query, top_k=min(top_k * 3, 15))
-        
-        # Apply filters
-        filtered_results = []
-        for product, score in results:
-            # Skip low score results
-            if score < 0.3:
-                continue
-                
-            # Filter by category
-            if category and product.get('CategoryName', '').lower() != category.lower():
-                continue
-            
-            # Filter by price
-            product_price = product.get('MinPrice', product.get('BasePrice', 0))
-            
-            if min_price and product_price < min_price:
-                continue
-            
-            if max_price and product_price > max_price:
-                continue
-            
-            filtered_results.append((product, score))
-            
-            # Break early if enough results
-            if len(filtered_results) >= top_k:
-                break
+        # Lấy rộng hơn top_k cho mỗi nhánh để fusion có đủ ứng viên
+        depth = top_k * 4 if self.hybrid_search else top_k
+        
+        # 1 bảng live cho cả filter lẫn join (refresh giữa chừng không lệch giá)
+        live_prices = self.live_stats.table if self.live_stats is not None else None
+        
+        # Vector search với filters áp dụng ngay trong FAISS (1 lần search)
+        results = self.em.search(
+            query,
+            top_k=depth,
+            min_score=self.min_score,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            live_prices=live_prices
+        )
+        
+        if self.hybrid_search:
+            with STAGE_SECONDS.time(stage="lexical_search"):
+                lexical = self.em.lexical_search(
+                    query,
+                    top_k=depth,
+                    category=category,
+                    min_price=min_price,
+                    max_price=max_price,
+                    live_prices=live_prices
+                )
+            results = self._reciprocal_rank_fusion(results, lexical, top_k)
         
-        logger.info(f"Found {len(filtered_results)}/{len(results)} matching products")
-        return filtered_results[:top_k]
+        if live_prices is not None:
+            with span("LiveStats.join"):
+                results = self.live_stats.join_results(results, live_prices)
+        
+        logger.info(f"Found {len(results)} matching products")
+        return results
     
+    def _reciprocal_rank_fusion(
+        self,
+        vector: List[Tuple[Dict, float]],
+        lexical: List[Tuple[Dict, float]],
+        top_k: int
+    ) -> List[Tuple[Dict, float]]:
+        """
+        Rerank vector hits by Σ 1 / (rrf_k + rank) over both rankings
+        
+        BM25 chỉ đổi thứ tự: sản phẩm chỉ khớp từ khóa (không qua min_score
+        của vector search) không được thêm vào.
+        
+        Returns:
+            Top-k (product, cosine score) theo thứ tự fused
+        """
+        fused = {}
+        for ranking in (vector, lexical):
+            for rank, (product, _) in enumerate(ranking, 1):
+                pid = product['ProductID']
+                fused[pid] = fused.get(pid, 0.0) + 1.0 / (self.rrf_k + rank)
+        
+        return sorted(vector, key=lambda hit: fused[hit[0]['ProductID']], reverse=True)[:top_k]
+    
+    @traced()
     def generate_context(self, products: List[Tuple[Dict, float]]) -> str:
         """
         Generate context từ search results - VERSION NGẮN GỌN
@@ -127,7 +296,7 @@ class RAGService:
                 product_info.append(f"   Chất liệu: {', '.join(metals_list)}")
             
             # Stock (inline)
-            stock = product.get('TotalStock', 0)
+            stock = product.get('TotalStock') or 0
             stock_text = "Còn hàng" if stock > 0 else "Hết hàng"
             product_info.append(f"   Tình trạng: {stock_text}")
             
@@ -136,6 +305,7 @@ class RAGService:
     
         return "\n".join(context_parts)
     
+    @traced()
     def create_prompt(
         self, 
         user_query: str, 
@@ -174,6 +344,31 @@ QUY TẮC:
     
         return "\n".join(prompt_parts)
     
+    def _build_payload(
+        self,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        stream: bool
+    ) -> Dict:
+        """Ollama /api/generate payload (dùng chung cho call_llama và call_llama_stream)"""
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "num_predict": max_tokens,
+                "temperature": temperature,
+                "top_p": 0.75,
+                "top_k": 15,
+                "num_ctx": 768,
+                "repeat_penalty": 1.15,
+                "num_gpu": 0,
+                "num_thread": 6
+            }
+        }
+    
+    @traced()
     def call_llama(
         self, 
         prompt: str, 
@@ -192,39 +387,30 @@ QUY TẮC:
             Generated response text hoặc None nếu lỗi
         """
         try:
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "num_predict": max_tokens,
-                    "temperature": temperature,
-                    "top_p": 0.75,
-                    "top_k": 15,
-                    "num_ctx": 768,
-                    "repeat_penalty": 1.15,
-                    "num_gpu": 0,
-                    "num_thread": 6
-                }
-            }
+            payload = self._build_payload(prompt, max_tokens, temperature, stream=False)
             
-            logger.info(f"🤖 Calling Ollama (max_tokens={max_tokens}, timeout=120s)")
+            logger.info(f"🤖 Calling Ollama (max_tokens={max_tokens}, timeout={self.timeout[1]:.0f}s)")
             start_time = time.time()
             
-            response = requests.post(
-                self.api_endpoint,
-                json=payload,
-                timeout=120  # ✅ TĂNG TỪ 45 → 120 giây
-            )
+            response = self._post(payload)
+            current_span().set_attribute("status_code", response.status_code)
             
             if response.status_code == 200:
                 result = response.json()
                 generated_text = result.get('response', '')
+                STAGE_SECONDS.observe(time.time() - start_time, stage="llm_total")
+                
+                # Không stream → không đo được token đầu phía client; dùng thời gian
+                # Ollama load model + đọc prompt (token đầu ra ngay sau đó)
+                ttft = (result.get('load_duration', 0) + result.get('prompt_eval_duration', 0)) / 1e9
+                STAGE_SECONDS.observe(ttft, stage="llm_ttft")
+                current_span().set_attribute("ttft_ms", round(ttft * 1000, 1))
                 
                 # Log performance metrics
                 total_duration = result.get('total_duration', 0) / 1e9
                 eval_count = result.get('eval_count', 0)
                 eval_duration = result.get('eval_duration', 0) / 1e9
+                self._record_generation(eval_count, eval_duration, mode="chat")
                 
                 if eval_duration > 0:
                     tokens_per_sec = eval_count / eval_duration
@@ -236,17 +422,147 @@ QUY TẮC:
             else:
                 logger.error(f"❌ Ollama error: {response.status_code}")
                 logger.error(response.text)
+                LLM_ERRORS.inc(mode="chat")
                 return None
                 
         except requests.exceptions.Timeout:
             elapsed = time.time() - start_time
             logger.error(f"❌ Ollama timeout after {elapsed:.1f}s")
             logger.error("💡 Tip: First call may take 60-90s to load model. Try again.")
+            LLM_ERRORS.inc(mode="chat")
+            current_span().record_error(f"timeout after {elapsed:.1f}s")
             return None
         except Exception as e:
             logger.error(f"❌ Error calling Ollama: {e}")
+            LLM_ERRORS.inc(mode="chat")
+            current_span().record_error(e)
             return None
     
+    def call_llama_stream(
+        self,
+        prompt: str,
+        max_tokens: int = 120,
+        temperature: float = 0.3
+    ) -> Iterator[str]:
+        """
+        Call Ollama với "stream": True và yield từng token ngay khi nhận được
+        
+        Args:
+            prompt: Full prompt string
+            max_tokens: Max response length
+            temperature: Creativity level (0-1)
+            
+        Yields:
+            Text fragments in generation order
+            
+        Raises:
+            RuntimeError: If Ollama returns a non-200 status or an error chunk
+        """
+        payload = self._build_payload(prompt, max_tokens, temperature, stream=True)
+        
+        logger.info(f"🤖 Streaming from Ollama (max_tokens={max_tokens}, timeout={self.timeout[1]:.0f}s)")
+        start_time = time.time()
+        first_token_time = None
+        
+        with span("RAGService.call_llama_stream") as stream_span, self._post(payload, stream=True) as response:
+            stream_span.set_attribute("status_code", response.status_code)
+            if response.status_code != 200:
+                logger.error(f"❌ Ollama error: {response.status_code}")
+                raise RuntimeError(f"Ollama returned HTTP {response.status_code}")
+            
+            # Ollama stream = NDJSON, mỗi dòng 1 chunk
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise RuntimeError(chunk['error'])
+                
+                token = chunk.get('response', '')
+                if token:
+                    if first_token_time is None:
+                        first_token_time = time.time() - start_time
+                        STAGE_SECONDS.observe(first_token_time, stage="llm_ttft")
+                        stream_span.set_attribute("ttft_ms", round(first_token_time * 1000, 1))
+                        logger.info(f"⏱️  First token: {first_token_time:.2f}s")
+                    yield token
+                
+                if chunk.get('done'):
+                    STAGE_SECONDS.observe(time.time() - start_time, stage="llm_total")
+                    eval_count = chunk.get('eval_count', 0)
+                    eval_duration = chunk.get('eval_duration', 0) / 1e9
+                    self._record_generation(eval_count, eval_duration, mode="stream")
+                    if eval_duration > 0:
+                        logger.info(f"✅ Streamed {eval_count} tokens in {eval_duration:.2f}s ({eval_count / eval_duration:.1f} tok/s)")
+                    break
+    
+    @staticmethod
+    def _record_generation(eval_count: int, eval_duration: float, mode: str):
+        """Tokens + tokens/s theo số liệu của Ollama (eval_duration tính bằng s)"""
+        LLM_GENERATED_TOKENS.inc(eval_count, mode=mode)
+        current_span().set_attribute("eval_count", eval_count)
+        if eval_duration > 0:
+            LLM_TOKENS_PER_SECOND.observe(eval_count / eval_duration, mode=mode)
+            current_span().set_attribute("tokens_per_s", round(eval_count / eval_duration, 1))
+    
+    def _format_products(self, products: List[Tuple[Dict, float]]) -> List[Dict]:
+        """Convert search results sang product dicts trả về cho client"""
+        return [
+            {
+                "id": p[0]['ProductID'],
+                "name": p[0]['ProductName'],
+                "price": float(p[0].get('MinPrice', p[0].get('BasePrice', 0))),
+                "category": p[0].get('CategoryName', ''),
+                "image": p[0].get('MainImageURL', ''),
+                "score": p[1]
+            }
+            for p in products[:3]
+        ]
+    
+    @staticmethod
+    def _record_chat(start_time: float, mode: str, outcome: str):
+        CHAT_REQUESTS.inc(mode=mode, outcome=outcome)
+        CHAT_SECONDS.observe(time.time() - start_time, mode=mode)
+    
+    @traced()
+    def _lookup_response_cache(
+        self,
+        user_query: str,
+        category: Optional[str],
+        min_price: Optional[float],
+        max_price: Optional[float],
+        conversation_history: Optional[List[Dict]],
+        top_k: int
+    ) -> Tuple[Optional[Dict], Optional[np.ndarray], Optional[Tuple]]:
+        """
+        Check the semantic response cache
+        
+        Requests with conversation history are not cached, since the answer
+        depends on the previous turns. The key includes the index version
+        and the live stats generation, read before the search runs: an
+        answer built while the index or prices change is stored under the
+        older key and never served for the new state.
+        
+        Returns:
+            (cached_response, query_vector, cache_key) - vector/key là None
+            nếu request không cache được
+        """
+        if not self.response_cache.enabled or conversation_history:
+            return None, None, None
+        
+        query_vector = self.em.encode_query(user_query)[0]
+        cache_key = (
+            category.lower() if category else None,
+            min_price,
+            max_price,
+            top_k,
+            self.em.index_version,
+            self.live_stats.table.generation if self.live_stats is not None else None
+        )
+        return self.response_cache.lookup(query_vector, cache_key), query_vector, cache_key
+    
+    @traced()
     def chat(
         self,
         user_query: str,
@@ -271,6 +587,16 @@ QUY TẮC:
         start_time = time.time()
         logger.info(f"🔍 Query: {user_query}")
         
+        # 0. Semantic response cache
+        cached, query_vector, cache_key = self._lookup_response_cache(
+            user_query, category, min_price, max_price, conversation_history, top_k
+        )
+        current_span().set_attribute("response_cache_hit", cached is not None)
+        if cached is not None:
+            logger.info(f"⚡ Response cache hit: {(time.time()-start_time)*1000:.1f}ms")
+            self._record_chat(start_time, mode="chat", outcome="cache_hit")
+            return cached
+        
         # 1. Search relevant products
         t1 = time.time()
         products = self.search_products(
@@ -280,17 +606,23 @@ QUY TẮC:
             max_price=max_price,
             top_k=top_k
         )
-        logger.info(f"⏱️  Search: {time.time()-t1:.2f}s")
+        search_time = time.time() - t1
+        STAGE_SECONDS.observe(search_time, stage="search")
+        logger.info(f"⏱️  Search: {search_time:.2f}s")
         
         # 2. Generate context
         t2 = time.time()
         context = self.generate_context(products)
-        logger.info(f"⏱️  Context: {time.time()-t2:.2f}s")
+        context_time = time.time() - t2
+        STAGE_SECONDS.observe(context_time, stage="context")
+        logger.info(f"⏱️  Context: {context_time:.2f}s")
         
         # 3. Create prompt
         t3 = time.time()
         prompt = self.create_prompt(user_query, context, conversation_history)
-        logger.info(f"⏱️  Prompt: {time.time()-t3:.2f}s | Length: {len(prompt)} chars")
+        prompt_time = time.time() - t3
+        STAGE_SECONDS.observe(prompt_time, stage="prompt")
+        logger.info(f"⏱️  Prompt: {prompt_time:.2f}s | Length: {len(prompt)} chars")
         
         # 4. Call Llama (main bottleneck)
         t4 = time.time()
@@ -306,28 +638,179 @@ QUY TẮC:
         logger.info(f"✅ Total: {total_time:.2f}s")
         
         if not response:
+            self._record_chat(start_time, mode="chat", outcome="error")
             return {
                 "success": False,
                 "message": "Xin lỗi, hệ thống đang bận. Vui lòng thử lại sau ít phút.",
                 "products": []
             }
         
+        self._record_chat(start_time, mode="chat", outcome="success")
+        
         # 5. Return results
-        return {
+        result = {
             "success": True,
             "message": response,
-            "products": [
-                {
-                    "id": p[0]['ProductID'],
-                    "name": p[0]['ProductName'],
-                    "price": p[0].get('MinPrice', p[0].get('BasePrice', 0)),
-                    "category": p[0].get('CategoryName', ''),
-                    "image": p[0].get('MainImageURL', ''),
-                    "score": p[1]
-                }
-                for p in products[:3]
-            ]
+            "products": self._format_products(products)
         }
+        
+        if cache_key is not None:
+            self.response_cache.store(query_vector, cache_key, result)
+        
+        return result
+    
+    def chat_stream(
+        self,
+        user_query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        top_k: int = 3
+    ) -> Iterator[Dict]:
+        """
+        Streaming version of chat()
+        
+        Products are emitted as soon as retrieval finishes, then Llama tokens
+        are relayed one by one, so time to first output ≈ search latency.
+        
+        Yields:
+            Event dicts:
+            - {"type": "products", "products": [...]}
+            - {"type": "token", "content": "..."}
+            - {"type": "done", "success": True}
+            - {"type": "error", "message": "..."}
+        """
+        start_time = time.time()
+        logger.info(f"🔍 Query (stream): {user_query}")
+        
+        # 0. Semantic response cache → trả nguyên câu trả lời trong 1 token
+        cached, query_vector, cache_key = self._lookup_response_cache(
+            user_query, category, min_price, max_price, conversation_history, top_k
+        )
+        current_span().set_attribute("response_cache_hit", cached is not None)
+        if cached is not None:
+            logger.info(f"⚡ Response cache hit: {(time.time()-start_time)*1000:.1f}ms")
+            self._record_chat(start_time, mode="stream", outcome="cache_hit")
+            yield {"type": "products", "products": [dict(p) for p in cached['products']]}
+            yield {"type": "token", "content": cached['message']}
+            yield {"type": "done", "success": True}
+            return
+        
+        # 1. Search → gửi products ngay
+        with STAGE_SECONDS.time(stage="search"):
+            products = self.search_products(
+                query=user_query,
+                category=category,
+                min_price=min_price,
+                max_price=max_price,
+                top_k=top_k
+            )
+        formatted_products = self._format_products(products)
+        yield {"type": "products", "products": [dict(p) for p in formatted_products]}
+        logger.info(f"⏱️  Products sent: {time.time()-start_time:.2f}s")
+        
+        # 2. Context + prompt
+        with STAGE_SECONDS.time(stage="context"):
+            context = self.generate_context(products)
+        with STAGE_SECONDS.time(stage="prompt"):
+            prompt = self.create_prompt(user_query, context, conversation_history)
+        
+        # 3. Relay Llama tokens
+        tokens = []
+        try:
+            for token in self.call_llama_stream(prompt, max_tokens=120, temperature=0.3):
+                tokens.append(token)
+                yield {"type": "token", "content": token}
+        except Exception as e:
+            logger.error(f"❌ Streaming error: {e}")
+            LLM_ERRORS.inc(mode="stream")
+            self._record_chat(start_time, mode="stream", outcome="error")
+            yield {
+                "type": "error",
+                "message": "Xin lỗi, hệ thống đang bận. Vui lòng thử lại sau ít phút."
+            }
+            return
+        
+        logger.info(f"✅ Total (stream): {time.time()-start_time:.2f}s")
+        self._record_chat(start_time, mode="stream", outcome="success")
+        
+        if cache_key is not None and tokens:
+            self.response_cache.store(query_vector, cache_key, {
+                "success": True,
+                "message": "".join(tokens),
+                "products": formatted_products
+            })
+        
+        yield {"type": "done", "success": True}
+    
+    async def achat(
+        self,
+        user_query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        top_k: int = 3
+    ) -> Dict:
+        """
+        Async version of chat() - chạy toàn bộ pipeline trên worker pool
+        
+        The event loop only awaits the result, so one uvicorn worker can
+        serve many concurrent chats while /health stays responsive.
+        
+        Returns:
+            Same dictionary as chat()
+        """
+        return await self.run_in_executor(
+            self.chat,
+            user_query=user_query,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            conversation_history=conversation_history,
+            top_k=top_k
+        )
+
+    
+    async def achat_stream(
+        self,
+        user_query: str,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        conversation_history: Optional[List[Dict]] = None,
+        top_k: int = 3
+    ) -> AsyncIterator[Dict]:
+        """
+        Async iterator over chat_stream() events
+        
+        Mỗi bước của generator (search, đọc chunk từ Ollama) chạy trên
+        worker pool nên event loop không bị block giữa các token.
+        """
+        events = self.chat_stream(
+            user_query=user_query,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            conversation_history=conversation_history,
+            top_k=top_k
+        )
+        sentinel = object()
+        
+        # Mọi bước của generator chạy trong cùng 1 context → span mở trong
+        # chat_stream đóng được ở bước sau
+        context = contextvars.copy_context()
+        
+        try:
+            while True:
+                event = await self.run_in_executor(context.run, next, events, sentinel)
+                if event is sentinel:
+                    break
+                yield event
+        finally:
+            # Client ngắt kết nối → đóng generator để giải phóng HTTP stream tới Ollama
+            await self.run_in_executor(context.run, events.close)
 
 
 # ===== USAGE EXAMPLE =====
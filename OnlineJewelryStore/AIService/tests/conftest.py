@@ -0,0 +1,107 @@
+"""
+Shared fixtures cho AIService tests
+Encoder giả (vector xác định theo text) thay cho sentence-transformers để test
+index/search logic mà không cần tải model.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+
+import numpy as np
+import pytest
+
+# Modules của AIService nằm phẳng ở thư mục cha (như khi chạy uvicorn main:app)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class HashEncoder:
+    """Encoder giả: mỗi text (đã chuẩn hóa như query) → 1 vector ngẫu nhiên cố định"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self.calls = 0
+        self.texts_encoded = 0
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        self.calls += 1
+        self.texts_encoded += len(texts)
+        vectors = np.empty((len(texts), self.dimension), dtype='float32')
+        for i, text in enumerate(texts):
+            # Cùng chuẩn hóa với EmbeddingsManager.normalize_query → query = product text khớp đúng 1 sản phẩm
+            key = " ".join(text.casefold().split())
+            seed = int(hashlib.md5(key.encode('utf-8')).hexdigest()[:8], 16)
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.dimension)
+        return vectors
+
+
+CATEGORIES = ("Rings", "Necklaces", "Earrings", "Bracelets")
+
+
+def make_product(product_id: int, **overrides) -> dict:
+    product = {
+        "ProductID": product_id,
+        "ProductName": f"Product {product_id}",
+        "Description": f"Handmade jewelry piece number {product_id}",
+        "CategoryID": product_id % len(CATEGORIES) + 1,
+        "CategoryName": CATEGORIES[product_id % len(CATEGORIES)],
+        "ParentCategoryID": None,
+        "BasePrice": 1000.0 * product_id,
+        "MinPrice": 1000.0 * product_id,
+        "MaxPrice": 1000.0 * product_id + 500,
+        "AvailableMetals": "Gold, Silver",
+        "TotalStock": 5,
+        "ReviewCount": 0,
+        "AvgRating": None,
+        "MainImageURL": f"/images/{product_id}.jpg",
+        "IsActive": True
+    }
+    product.update(overrides)
+    return product
+
+
+def top_id(em, product, **filters):
+    """ProductID của kết quả đầu tiên khi search đúng text của product"""
+    results = em.search(em.create_product_text(product), top_k=1, min_score=-1.0, **filters)
+    return results[0][0]["ProductID"] if results else None
+
+
+def write_legacy_index(path: str, em, products: list):
+    """Ghi index như bản gốc: IndexFlatIP theo vị trí + list products trong .pkl"""
+    import faiss
+
+    vectors = em.model.encode([em.create_product_text(p) for p in products]).astype('float32')
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    faiss.write_index(index, f"{path}.index")
+    with open(f"{path}.pkl", "wb") as f:
+        pickle.dump(products, f)
+
+
+@pytest.fixture
+def encoder():
+    return HashEncoder()
+
+
+@pytest.fixture
+def products():
+    """Factory: products(n, start=1) → list product dict"""
+    def factory(n: int, start: int = 1):
+        return [make_product(pid) for pid in range(start, start + n)]
+    return factory
+
+
+@pytest.fixture
+def make_manager(encoder):
+    """Factory: EmbeddingsManager với encoder giả, không micro-batching"""
+    from embeddings_manager import EmbeddingsManager
+
+    def factory(**kwargs):
+        kwargs.setdefault("micro_batching", False)
+        kwargs.setdefault("nlist", 8)
+        em = EmbeddingsManager(**kwargs)
+        em.model = encoder
+        return em
+    return factory
@@ -0,0 +1,78 @@
+"""
+AsyncDatabaseConnector: query chạy ngoài event loop, tối đa max_concurrency
+query cùng lúc
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("pyodbc")  # db_connector import pyodbc ở module level
+
+from async_db import AsyncDatabaseConnector  # noqa: E402
+from db_connector import ConnectionPool  # noqa: E402
+
+
+class SlowQueries:
+    """Thay DatabaseConnector: mỗi query chờ 50ms và đếm số query đang chạy"""
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def get_product_by_id(self, product_id):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.threads.add(threading.get_ident())
+        time.sleep(0.05)
+        with self._lock:
+            self.running -= 1
+        return {"ProductID": product_id}
+
+
+@pytest.fixture
+def adb():
+    pool = ConnectionPool("Driver={SQL Server};", min_size=0, max_size=3)
+    adb = AsyncDatabaseConnector(pool, max_concurrency=2)
+    adb._db = SlowQueries()
+    yield adb
+    adb.close()
+
+
+def test_concurrency_is_bounded(adb):
+    async def main():
+        return await asyncio.gather(*(adb.get_product_by_id(pid) for pid in range(8)))
+
+    results = asyncio.run(main())
+
+    assert [p["ProductID"] for p in results] == list(range(8))
+    assert adb._db.peak == 2
+    assert threading.get_ident() not in adb._db.threads
+
+
+def test_event_loop_stays_responsive(adb):
+    async def main():
+        queries = asyncio.gather(*(adb.get_product_by_id(pid) for pid in range(4)))
+        ticks = 0
+        while not queries.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        await queries
+        return ticks
+
+    # 4 query × 50ms / 2 thread ≈ 100ms, loop vẫn chạy trong lúc chờ
+    assert asyncio.run(main()) >= 5
+
+
+def test_default_concurrency_is_pool_size():
+    pool = ConnectionPool("Driver={SQL Server};", min_size=0, max_size=3)
+    adb = AsyncDatabaseConnector(pool)
+    try:
+        assert adb.max_concurrency == 3
+    finally:
+        adb.close()
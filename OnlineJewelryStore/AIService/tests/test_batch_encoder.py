@@ -0,0 +1,74 @@
+"""
+Micro-batching: request đơn lẻ không chờ max_wait, request đồng thời được gom batch
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from batch_encoder import BatchingEncoder
+
+
+class GatedEncoder:
+    """encode_fn ghi lại kích thước batch; batch đầu tiên chờ gate để query sau xếp hàng"""
+
+    def __init__(self):
+        self.batches = []
+        self.first_started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if len(self.batches) == 1:
+            self.first_started.set()
+            self.gate.wait(timeout=5)
+        return np.array([[float(len(text))] for text in texts], dtype='float32')
+
+
+@pytest.fixture
+def batcher():
+    """Batcher với max_wait rất lớn (1s) để thấy rõ có chờ hay không"""
+    encode_fn = GatedEncoder()
+    encoder = BatchingEncoder(encode_fn, max_batch_size=8, max_wait_ms=1000)
+    encoder.start()
+    yield encoder, encode_fn
+    encode_fn.gate.set()
+    encoder.stop()
+
+
+def test_single_request_skips_wait(batcher):
+    encoder, encode_fn = batcher
+    encode_fn.gate.set()
+
+    for text in ("ring", "gold necklace"):
+        start = time.perf_counter()
+        assert encoder.encode(text)[0] == len(text)
+        assert time.perf_counter() - start < 0.5
+
+    assert encode_fn.batches == [["ring"], ["gold necklace"]]
+
+
+def test_concurrent_requests_share_batch(batcher):
+    encoder, encode_fn = batcher
+    texts = ["ring", "pearl earrings", "silver bracelet", "ring"]
+
+    with ThreadPoolExecutor(max_workers=len(texts) + 1) as pool:
+        first = pool.submit(encoder.encode, "gold necklace")
+        assert encode_fn.first_started.wait(timeout=5)
+
+        # Batch đầu đang encode → các query sau xếp hàng và được gom chung
+        futures = [pool.submit(encoder.encode, text) for text in texts]
+        deadline = time.monotonic() + 5
+        while encoder.stats()["pending"] < len(texts) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        encode_fn.gate.set()
+
+        assert first.result(timeout=5)[0] == len("gold necklace")
+        assert [f.result(timeout=5)[0] for f in futures] == [len(text) for text in texts]
+
+    # Query trùng nhau trong batch chỉ encode 1 lần
+    assert encode_fn.batches[1:] == [["ring", "pearl earrings", "silver bracelet"]]
+    assert encoder.stats()["queries"] == 5
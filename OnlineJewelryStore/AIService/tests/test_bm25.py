@@ -0,0 +1,157 @@
+"""
+BM25 CSR postings: điểm đúng công thức, index delta / merged() khớp với build
+lại từ đầu, lưu/đọc file; RRF gộp kết quả vector + BM25
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from bm25_index import BM25Index
+from conftest import make_product
+from rag_service import RAGService
+
+TEXTS = {
+    1: "Nhẫn Vàng 18K đính kim cương",
+    2: "Rose Gold halo ring with diamond",
+    3: "Silver pearl necklace",
+    4: "Gold chain necklace 18K gold",
+    5: "Dây chuyền bạc ngọc trai",
+    6: "Rose quartz silver bracelet"
+}
+
+
+def build(texts):
+    return BM25Index().build(list(texts), list(texts.values()))
+
+
+def reference_scores(texts, query, k1=1.2, b=0.75):
+    """BM25 tính trực tiếp trên text (không dùng postings)"""
+    docs = {pid: Counter(BM25Index.tokenize(text)) for pid, text in texts.items()}
+    avg_length = sum(sum(tf.values()) for tf in docs.values()) / len(docs)
+    scores = {}
+    for pid, tf in docs.items():
+        length, score = sum(tf.values()), 0.0
+        for term in set(BM25Index.tokenize(query)):
+            df = sum(term in other for other in docs.values())
+            if tf[term]:
+                idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf[term] * (k1 + 1) / (tf[term] + k1 * (1 - b + b * length / avg_length))
+        if score > 0:
+            scores[pid] = score
+    return scores
+
+
+def assert_same_index(actual, expected):
+    assert actual.vocabulary == expected.vocabulary
+    assert np.array_equal(actual.doc_ids, expected.doc_ids)
+    assert np.array_equal(actual.indptr, expected.indptr)
+    assert np.array_equal(actual.postings, expected.postings)
+    assert np.array_equal(actual.tfs, expected.tfs)
+    assert np.array_equal(actual.doc_lengths, expected.doc_lengths)
+    assert actual.avg_length == pytest.approx(expected.avg_length)
+    assert np.allclose(actual.weights, expected.weights, rtol=1e-5)
+
+
+def test_tokenize_strips_vietnamese_accents():
+    assert BM25Index.tokenize("Nhẫn Vàng 18K, Đá quý") == ["nhan", "vang", "18k", "da", "quy"]
+
+
+def test_csr_postings_match_bm25_formula():
+    index = build(TEXTS)
+
+    assert np.array_equal(index.doc_ids, sorted(TEXTS))
+    assert len(index.indptr) == len(index.vocabulary) + 1
+    assert index.indptr[-1] == len(index.postings) == len(index.weights)
+    # Mỗi posting list sort theo doc, không trùng
+    for term, i in index.vocabulary.items():
+        docs = index.postings[index.indptr[i]:index.indptr[i + 1]]
+        assert np.all(np.diff(docs) > 0)
+        assert index.document_frequency(term) == len(docs)
+
+    for query in ("gold necklace", "nhan vang 18k", "rose silver", "dây chuyền"):
+        expected = reference_scores(TEXTS, query)
+        results = index.search(query, top_k=len(TEXTS))
+        assert dict(results) == pytest.approx(expected, rel=1e-5)
+        assert [pid for pid, _ in results] == sorted(expected, key=expected.get, reverse=True)
+
+
+def test_search_filters():
+    index = build(TEXTS)
+
+    assert index.search("unobtainium") == []
+    assert [pid for pid, _ in index.search("gold", top_k=1)] == [4]
+    assert {pid for pid, _ in index.search("silver", allowed_ids=np.array([3, 5]))} == {3}
+    assert {pid for pid, _ in index.search("silver", excluded_ids=np.array([3]))} == {6}
+
+
+def test_delta_is_scored_against_corpus():
+    main = build({pid: text for pid, text in TEXTS.items() if pid <= 4})
+    delta = BM25Index()
+    for pid in (5, 6):
+        delta.add_document(pid, TEXTS[pid])
+    delta.finalize(corpus=main)
+    full = build(TEXTS)
+
+    # Doc mới trong delta có cùng điểm như khi build lại toàn bộ
+    assert delta.avg_length == pytest.approx(full.avg_length)
+    for query in ("silver", "rose quartz bracelet"):
+        expected = dict(full.search(query, top_k=len(TEXTS)))
+        for pid, score in delta.search(query, top_k=len(TEXTS)):
+            assert score == pytest.approx(expected[pid], rel=1e-5)
+
+
+def test_merged_equals_fresh_build():
+    main = build(TEXTS)
+    delta = BM25Index()
+    changed = {2: "White gold solitaire ring", 7: "Emerald stud earrings"}
+    for pid, text in changed.items():
+        delta.add_document(pid, text)
+    delta.finalize(corpus=main)
+
+    # Doc 3 bị xóa, doc 2 có text mới trong delta
+    merged = main.merged(np.array([2, 3]), delta)
+    expected = {**{pid: text for pid, text in TEXTS.items() if pid != 3}, **changed}
+    assert_same_index(merged, build(dict(sorted(expected.items()))))
+
+    assert_same_index(main.merged(np.array([6])), build({pid: TEXTS[pid] for pid in range(1, 6)}))
+
+
+def test_save_and_load(tmp_path):
+    index = build(TEXTS)
+    path = str(tmp_path / "faiss_index.bm25")
+    index.save(path)
+
+    loaded = BM25Index.load(path)
+    assert_same_index(loaded, index)
+    assert loaded.search("rose gold") == index.search("rose gold")
+
+
+def test_reciprocal_rank_fusion():
+    rag = RAGService(None, response_cache_size=0, rrf_k=60)
+    vector = [(make_product(pid), 0.9 - pid / 100) for pid in (1, 2, 3)]
+    lexical = [(make_product(pid), 10.0 - pid) for pid in (2, 4)]
+
+    fused = rag._reciprocal_rank_fusion(vector, lexical, top_k=3)
+
+    # 2: hạng 2 + hạng 1 > 1: hạng 1 > 3: hạng 3; 4 chỉ khớp từ khóa → bỏ
+    assert [p["ProductID"] for p, _ in fused] == [2, 1, 3]
+    assert [score for _, score in fused] == pytest.approx([0.88, 0.89, 0.87])  # Cosine của vector search
+    assert rag._reciprocal_rank_fusion([], lexical, top_k=3) == []
+
+
+def test_hybrid_search_needs_a_vector_candidate(make_manager, products):
+    em = make_manager()
+    catalog = products(100) + [make_product(101, ProductName="Rose Gold Halo Ring")]
+    assert em.build_index(catalog)
+    hybrid = RAGService(em, response_cache_size=0)
+
+    # Chỉ BM25 khớp (vector giả ngẫu nhiên < min_score) → không trả về
+    assert hybrid.search_products("rose gold halo", top_k=3) == []
+
+    # Vector hit đứng đầu giữ cosine score, không phải điểm RRF
+    results = hybrid.search_products(em.create_product_text(catalog[-1]), top_k=3)
+    assert results[0][0]["ProductID"] == 101
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
@@ -0,0 +1,138 @@
+"""
+Columnar catalog: write_catalog → CatalogStore trả lại đúng product dict,
+kể cả catalog chuyển từ pickle cũ (giá Decimal như pyodbc trả về)
+"""
+
+import os
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from catalog_store import CatalogOverlay, CatalogStore, write_catalog
+from conftest import make_product, write_legacy_index
+from embeddings_manager import GENERATION_FILES, read_manifest
+
+
+def db_product(product_id: int, **overrides) -> dict:
+    """Product dict đủ cột như DatabaseConnector.get_all_products"""
+    return make_product(product_id, **{"MinAdditionalPrice": 0.0, "MaxAdditionalPrice": 500.0, **overrides})
+
+
+@pytest.fixture
+def catalog_file(tmp_path):
+    return str(tmp_path / "products.catalog")
+
+
+def test_round_trip(catalog_file):
+    products = [
+        db_product(3, AvgRating=4.5, ReviewCount=2),
+        db_product(1, ProductName="Nhẫn vàng 18K 💍", ParentCategoryID=7, TotalStock=None),
+        db_product(2, Description=None, MinPrice=None, BasePrice=1500.0, MaxAdditionalPrice=None, Collection="Spring")
+    ]
+    hashes = {1: "a" * 40, 3: "c" * 40}
+    write_catalog(catalog_file, products, hashes, meta={"text_format": 2})
+
+    store = CatalogStore(catalog_file)
+    assert len(store) == 3
+    assert list(store) == [1, 2, 3]  # Sorted theo ProductID
+    assert store.meta == {"text_format": 2}
+    for product in products:
+        assert store[product["ProductID"]] == product
+
+    assert 4 not in store and store.row_of(4) == -1
+    with pytest.raises(KeyError):
+        store[4]
+
+    # Filter dùng MinPrice, NULL → BasePrice
+    assert store.min_prices().tolist() == [1000.0, 1500.0, 3000.0]
+    assert store.category_names() == {p["CategoryID"]: p["CategoryName"] for p in products}
+    assert dict(store.content_hashes()) == hashes
+
+
+def test_legacy_pickle_with_decimal_prices(make_manager, products, tmp_path):
+    catalog = products(20)
+    path = str(tmp_path / "faiss_index")
+
+    # Bản cũ lưu nguyên row của pyodbc: cột money / decimal là Decimal
+    legacy = [
+        {
+            **p,
+            "BasePrice": Decimal(f"{p['BasePrice']:.2f}"),
+            "MinPrice": Decimal(f"{p['MinPrice']:.2f}") + Decimal("0.25"),
+            "MaxPrice": Decimal(f"{p['MaxPrice']:.2f}"),
+            "AvgRating": Decimal("4.50") if p["ProductID"] % 2 else None
+        }
+        for p in catalog
+    ]
+    em = make_manager()
+    write_legacy_index(path, em, legacy)
+    assert em.load_index(path)
+    assert em.save_index(path)  # Ghi lại dạng catalog
+
+    store = CatalogStore(read_manifest(path)[".catalog"])
+    for before in legacy:
+        after = store[before["ProductID"]]
+        for name in ("BasePrice", "MinPrice", "MaxPrice"):
+            assert isinstance(after[name], float)
+            assert after[name] == float(before[name])
+        assert after["AvgRating"] == (4.5 if before["ProductID"] % 2 else None)
+    assert np.allclose(store.min_prices(), [1000.0 * pid + 0.25 for pid in range(1, 21)])
+
+    reloaded = make_manager()
+    assert reloaded.load_index(path)
+    assert isinstance(reloaded.product_data, CatalogStore)
+    assert sorted(reloaded.snapshot.id_map[reloaded.candidate_positions(max_price=5000.25)].tolist()) == [1, 2, 3, 4, 5]
+
+
+def test_each_save_writes_a_new_generation(make_manager, products, tmp_path):
+    path = str(tmp_path / "faiss_index")
+    em = make_manager()
+    assert em.build_index(products(20))
+    assert em.save_index(path)
+    first = read_manifest(path)
+
+    reader = make_manager()
+    assert reader.load_index(path)  # Catalog generation 1 đang được mmap
+
+    em.upsert_products([make_product(21)])
+    assert em.save_index(path)
+    second = read_manifest(path)
+    assert second["generation"] == first["generation"] + 1
+    assert all(os.path.exists(first[ext]) for ext in GENERATION_FILES)  # Generation trước được giữ
+
+    assert em.save_index(path)
+    assert not any(os.path.exists(first[ext]) for ext in GENERATION_FILES)
+    assert all(os.path.exists(second[ext]) for ext in GENERATION_FILES)
+
+    # Reader vẫn đọc được catalog cũ cho tới khi reload
+    assert len(reader.product_data) == 20 and reader.product_data[1]["ProductID"] == 1
+    assert reader.reload_if_changed()
+    assert len(reader.product_data) == 21
+    assert not reader.reload_if_changed()
+    assert not em.reload_if_changed()  # Không reload file chính mình vừa lưu
+
+
+def test_overlay_is_copy_on_write(catalog_file):
+    write_catalog(catalog_file, [db_product(pid) for pid in range(1, 6)])
+    store = CatalogStore(catalog_file)
+
+    overlay = CatalogOverlay.of(store)
+    assert CatalogOverlay.of(overlay) is overlay
+
+    changed = overlay.apply({2: db_product(2, ProductName="Ruby Ring"), 9: db_product(9)}, [4])
+    assert changed.base is store
+    assert list(changed) == [1, 2, 3, 5, 9]  # Thứ tự của base, sản phẩm mới ở cuối
+    assert len(changed) == 5
+    assert changed[2]["ProductName"] == "Ruby Ring"
+    assert 4 not in changed
+
+    # Overlay cũ không đổi
+    assert len(overlay) == 5 and 4 in overlay and 9 not in overlay
+    assert overlay[2]["ProductName"] == "Product 2"
+
+    # Thêm lại sản phẩm đã xóa, xóa sản phẩm mới thêm
+    restored = changed.apply({4: db_product(4, ProductName="Onyx Pendant")}, [9])
+    assert list(restored) == [1, 2, 3, 4, 5]
+    assert restored.removed == frozenset()
+    assert restored[4]["ProductName"] == "Onyx Pendant"
@@ -0,0 +1,143 @@
+"""
+Change feed → apply_changes: mỗi vòng poll chỉ chạm vào sản phẩm thay đổi
+(index delta + overlay), không copy catalog / build lại BM25 / clone index
+"""
+
+import pytest
+
+from conftest import make_product, top_id
+
+pytest.importorskip("pyodbc")  # db_connector import pyodbc ở module level
+
+from change_feed import ChangeFeedConsumer  # noqa: E402
+from catalog_store import CatalogOverlay, CatalogStore  # noqa: E402
+
+N_PRODUCTS = 300
+
+
+class FakeDatabase:
+    """Change tracking giả: mỗi lần sửa tăng version và ghi lại ProductID"""
+
+    def __init__(self, products):
+        self.products = {p["ProductID"]: p for p in products}
+        self.version = 1
+        self.changes = []  # (version, ProductID)
+
+    def change(self, *products, removed=()):
+        self.version += 1
+        for product in products:
+            self.products[product["ProductID"]] = product
+            self.changes.append((self.version, product["ProductID"]))
+        for pid in removed:
+            self.products.pop(pid, None)
+            self.changes.append((self.version, pid))
+
+    def get_change_tracking_version(self):
+        return self.version
+
+    def get_changed_product_ids(self, since_version):
+        return {pid for version, pid in self.changes if version > since_version}, False
+
+    def get_products_by_ids(self, product_ids):
+        return [self.products[pid] for pid in sorted(product_ids) if pid in self.products]
+
+    def get_all_products(self):
+        return list(self.products.values())
+
+
+@pytest.fixture
+def feed(make_manager, products, tmp_path):
+    """Index đã lưu rồi load lại (catalog mmap) + consumer đã start"""
+    catalog = products(N_PRODUCTS)
+    builder = make_manager()
+    assert builder.build_index(catalog)
+    assert builder.save_index(str(tmp_path / "faiss_index"))
+
+    em = make_manager(mmap_index=True, delta_max_size=50)
+    assert em.load_index(str(tmp_path / "faiss_index"))
+
+    db = FakeDatabase(catalog)
+    applied = []
+    consumer = ChangeFeedConsumer(db, em, on_change=applied.append)
+    consumer.start()
+    return consumer, db, em, applied
+
+
+def test_poll_applies_delta_without_copying_catalog(feed, encoder):
+    consumer, db, em, applied = feed
+    main = em.snapshot
+
+    renamed = make_product(10, ProductName="Sapphire Eternity Band")
+    repriced = make_product(11, MinPrice=5.0)  # Text không đổi → không encode lại
+    db.change(renamed, repriced, make_product(N_PRODUCTS + 1), removed=[12])
+
+    encoded_before = encoder.texts_encoded
+    counts = consumer.poll()
+
+    assert counts == {"added": 1, "updated": 1, "unchanged": 1, "removed": 1}
+    assert applied[-1] == counts
+    assert encoder.texts_encoded - encoded_before == 2
+
+    # Index chính, lookups và catalog mmap dùng chung với snapshot trước
+    snapshot = em.snapshot
+    assert snapshot.index is main.index
+    assert snapshot.category_positions is main.category_positions
+    assert isinstance(snapshot.product_data, CatalogOverlay)
+    assert isinstance(snapshot.product_data.base, CatalogStore)
+    assert snapshot.delta.size == 4
+    assert snapshot.version == main.version + 1
+
+    assert len(em.product_data) == N_PRODUCTS
+    assert 12 not in em.product_data
+    assert top_id(em, renamed) == 10
+    assert top_id(em, make_product(N_PRODUCTS + 1)) == N_PRODUCTS + 1
+    assert top_id(em, make_product(12)) != 12
+    assert top_id(em, repriced, max_price=10) == 11
+    assert em.product_data[11]["MinPrice"] == 5.0
+
+    # BM25: tên mới tìm được, sản phẩm đã xóa thì không
+    assert em.lexical_search("sapphire eternity", top_k=1)[0][0]["ProductID"] == 10
+    assert 12 not in [p["ProductID"] for p, _ in em.lexical_search("number 12", top_k=20)]
+
+
+def test_readers_keep_their_snapshot(feed):
+    consumer, db, em, _ = feed
+    before = em.snapshot
+
+    db.change(make_product(20, ProductName="Pearl Drop Earrings"), removed=[21])
+    consumer.poll()
+
+    assert before.delta is None
+    assert before.product_data[20]["ProductName"] == "Product 20"
+    assert 21 in before.product_data
+    assert em.product_data[20]["ProductName"] == "Pearl Drop Earrings"
+    assert 21 not in em.product_data
+
+
+def test_no_changes_keeps_snapshot(feed):
+    consumer, db, em, applied = feed
+    before = em.snapshot
+
+    db.change(make_product(5))  # Ghi lại đúng record cũ
+    assert consumer.poll() == {"added": 0, "updated": 0, "unchanged": 1, "removed": 0}
+    assert em.snapshot is before
+    assert consumer.poll() is None  # Không có thay đổi mới
+
+
+def test_large_delta_is_compacted(feed):
+    consumer, db, em, _ = feed
+    main = em.snapshot
+
+    changed = [make_product(pid, Description=f"Reworked piece {pid}") for pid in range(1, 61)]
+    db.change(*changed, removed=[100])
+    consumer.poll()
+
+    # delta_max_size=50 → gộp vào index chính mới, catalog mmap vẫn là base
+    snapshot = em.snapshot
+    assert snapshot.delta is None
+    assert snapshot.index is not main.index
+    assert snapshot.index.ntotal == N_PRODUCTS - 1
+    assert isinstance(snapshot.product_data.base, CatalogStore)
+    assert all(top_id(em, p) == p["ProductID"] for p in changed[::7])
+    assert top_id(em, make_product(100)) != 100
+    assert em.lexical_search("reworked piece 33", top_k=1)[0][0]["ProductID"] == 33
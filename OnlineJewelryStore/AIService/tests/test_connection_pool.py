@@ -0,0 +1,176 @@
+"""
+ConnectionPool: tái sử dụng connection, giới hạn max_size, bỏ connection chết,
+giữ đúng số chỗ khi connect lỗi / đóng pool
+"""
+
+import threading
+
+import pytest
+
+pytest.importorskip("pyodbc")  # db_connector import pyodbc ở module level
+
+import db_connector  # noqa: E402
+from db_connector import ConnectionPool, DatabaseConnector  # noqa: E402
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        if not self.alive:
+            raise ConnectionError("connection lost")
+        return FakeCursor()
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def execute(self, sql, *params):
+        self.sql = sql
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """pyodbc.connect giả; list ghi lại mọi connection đã tạo"""
+    created = []
+
+    def connect(connection_string):
+        conn = FakeConnection(len(created) + 1)
+        created.append(conn)
+        return conn
+
+    monkeypatch.setattr(db_connector.pyodbc, "connect", connect)
+    return created
+
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def factory(**kwargs):
+        pool = ConnectionPool("Driver={SQL Server};", **kwargs)
+        pools.append(pool)
+        return pool
+
+    yield factory
+    for pool in pools:
+        pool.close()
+
+
+def test_connections_are_reused(connections, make_pool):
+    pool = make_pool(min_size=2, max_size=4)
+    assert pool.open()
+    assert len(connections) == 2
+
+    for _ in range(5):
+        with pool.connection() as conn:
+            assert conn in connections
+    assert pool.created == 2
+    assert pool.stats()["idle"] == 2
+
+    # Connection trả về sau cùng được dùng lại trước (LIFO)
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    assert first.rollbacks >= 2
+
+
+def test_max_size_bounds_open_connections(connections, make_pool):
+    pool = make_pool(min_size=0, max_size=2)
+    held = [pool.acquire(), pool.acquire()]
+
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()["timeouts"] == 1
+
+    # Caller đang chờ nhận connection ngay khi có người trả
+    threading.Timer(0.05, pool.release, args=(held[0],)).start()
+    assert pool.acquire(timeout=5) is held[0]
+    assert len(connections) == 2
+    assert pool.stats()["in_use"] == 2
+
+
+def test_dead_connection_is_replaced(connections, make_pool):
+    pool = make_pool(min_size=0, max_size=2, health_check_after_s=0)
+    conn = pool.acquire()
+    pool.release(conn)
+
+    conn.alive = False
+    replacement = pool.acquire()
+
+    assert replacement is not conn and conn.closed
+    assert pool.failed_health_checks == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_failed_block_forces_health_check(connections, make_pool):
+    pool = make_pool(min_size=0, max_size=2, health_check_after_s=3600)
+
+    with pytest.raises(ValueError):
+        with pool.connection() as conn:
+            conn.alive = False
+            raise ValueError("query failed")
+
+    # Vừa trả về nhưng bị đánh dấu lỗi → vẫn health-check
+    assert pool.acquire() is not conn
+    assert pool.failed_health_checks == 1
+
+
+def test_connect_failure_frees_the_slot(connections, make_pool, monkeypatch):
+    pool = make_pool(min_size=1, max_size=1)
+
+    def refuse(connection_string):
+        raise ConnectionError("server down")
+
+    monkeypatch.setattr(db_connector.pyodbc, "connect", refuse)
+    assert not pool.open()
+    with pytest.raises(ConnectionError):
+        pool.acquire()
+    assert pool.stats()["size"] == 0
+
+
+def test_close_drains_pool(connections, make_pool):
+    pool = make_pool(min_size=2, max_size=2)
+    assert pool.open()
+    in_use = pool.acquire()
+
+    pool.close()
+    idle = [conn for conn in connections if conn is not in_use]
+    assert all(conn.closed for conn in idle) and not in_use.closed
+
+    pool.release(in_use)
+    assert in_use.closed
+    assert pool.stats()["size"] == 0
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_connector_borrows_from_pool(connections, make_pool):
+    pool = make_pool(min_size=1, max_size=2)
+    assert pool.open()
+
+    with DatabaseConnector("unused", pool=pool) as db:
+        assert db.conn is connections[0]
+        assert pool.stats()["in_use"] == 1
+    assert db.conn is None
+    assert pool.stats()["in_use"] == 0 and pool.stats()["idle"] == 1
+
+    # Không connect(): mỗi query mượn 1 connection rồi trả lại
+    db = DatabaseConnector("unused", pool=pool)
+    with db._connection() as conn:
+        assert conn is connections[0]
+    assert len(connections) == 1
@@ -0,0 +1,49 @@
+"""
+Model ONNX chưa verify / verify không đạt: create_encoder dùng torch thay thế,
+trừ khi allow_unverified
+"""
+
+import json
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("tokenizers")
+
+from encoders import CONFIG_FILE, OnnxEncoder, UnverifiedModelError, create_encoder  # noqa: E402
+
+
+@pytest.fixture
+def torch_encoder(monkeypatch):
+    """SentenceTransformer giả: ghi lại model name được load"""
+    module = types.SimpleNamespace(SentenceTransformer=lambda name: ("torch", name))
+    monkeypatch.setitem(sys.modules, "sentence_transformers", module)
+
+
+def write_config(model_dir, verification):
+    config = {"model_name": "all-MiniLM-L6-v2", "dimension": 384, "max_seq_length": 256, "verification": verification}
+    (model_dir / CONFIG_FILE).write_text(json.dumps(config), encoding="utf-8")
+    return str(model_dir)
+
+
+FAILED = {"min_cosine": 0.91, "mean_cosine": 0.97, "tolerance": 0.99, "passed": False}
+
+
+@pytest.mark.parametrize("verification", [{}, {"onnx_int8": FAILED}], ids=["missing", "failed"])
+def test_falls_back_to_torch(tmp_path, torch_encoder, verification):
+    model_dir = write_config(tmp_path, verification)
+
+    with pytest.raises(UnverifiedModelError):
+        OnnxEncoder(model_dir, quantized=True)
+    assert create_encoder("onnx_int8", "all-MiniLM-L6-v2", model_dir) == ("torch", "all-MiniLM-L6-v2")
+
+
+def test_override_uses_unverified_model(tmp_path, torch_encoder):
+    model_dir = write_config(tmp_path, {"onnx_int8": FAILED})
+
+    # Qua bước verify → lỗi tiếp theo là thiếu file model (không fallback)
+    with pytest.raises(Exception) as error:
+        create_encoder("onnx_int8", "all-MiniLM-L6-v2", model_dir, allow_unverified=True)
+    assert not isinstance(error.value, UnverifiedModelError)
@@ -0,0 +1,54 @@
+"""
+FileLock: loại trừ giữa các process, reentrant trong cùng thread
+"""
+
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import file_lock
+from file_lock import FileLock
+
+# Process con: chờ lock rồi in thời điểm lấy được
+CHILD = """
+import sys, time
+from file_lock import FileLock
+with FileLock(sys.argv[1]):
+    print(time.time())
+"""
+
+
+def test_other_process_waits(tmp_path):
+    path = str(tmp_path / "faiss_index.lock")
+
+    with FileLock(path):
+        child = subprocess.Popen(
+            [sys.executable, "-c", CHILD, path], stdout=subprocess.PIPE, text=True, cwd=os.path.dirname(file_lock.__file__)
+        )
+        time.sleep(0.5)
+        released = time.time()
+
+    out, _ = child.communicate(timeout=30)
+    assert child.returncode == 0
+    assert float(out) >= released
+
+
+def test_reentrant_in_thread_exclusive_across_threads(tmp_path):
+    lock = FileLock(str(tmp_path / "faiss_index.lock"))
+    acquired = threading.Event()
+
+    def other():
+        with lock:
+            acquired.set()
+
+    with lock:
+        with lock:  # rebuild giữ lock rồi gọi save_index
+            thread = threading.Thread(target=other)
+            thread.start()
+            assert not acquired.wait(0.2)
+        assert not acquired.wait(0.1)
+
+    thread.join(timeout=5)
+    assert acquired.is_set()
@@ -0,0 +1,56 @@
+"""
+Filter category / giá áp dụng trong FAISS search: 1 lần search trả đủ top_k
+kết quả khớp filter, kể cả khi filter loại phần lớn catalog
+"""
+
+import pytest
+
+from conftest import CATEGORIES
+
+N_PRODUCTS = 400
+
+
+@pytest.fixture
+def em(make_manager, products):
+    em = make_manager()
+    assert em.build_index(products(N_PRODUCTS))
+    return em
+
+
+def search(em, top_k=10, **filters):
+    return em.search("handmade jewelry piece", top_k=top_k, min_score=-1.0, **filters)
+
+
+def test_category_filter_returns_full_top_k(em):
+    results = search(em, top_k=20, category="Rings")
+
+    assert len(results) == 20
+    assert all(p["CategoryName"] == "Rings" for p, _ in results)
+
+
+def test_price_range_returns_full_top_k(em):
+    # 10 sản phẩm trong khoảng giá (2.5% catalog)
+    results = search(em, top_k=10, min_price=100_000, max_price=109_000)
+
+    assert sorted(p["ProductID"] for p, _ in results) == list(range(100, 110))
+
+
+def test_combined_filters(em):
+    results = search(em, top_k=50, category="Earrings", max_price=40_000)
+
+    # Earrings: ProductID % 4 == CATEGORIES.index("Earrings")
+    expected = [pid for pid in range(1, 41) if pid % len(CATEGORIES) == CATEGORIES.index("Earrings")]
+    assert sorted(p["ProductID"] for p, _ in results) == expected
+
+
+def test_results_sorted_by_score(em):
+    results = search(em, top_k=15, category="Bracelets", min_price=50_000)
+
+    scores = [score for _, score in results]
+    assert len(results) == 15
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_no_match(em):
+    assert search(em, category="Watches") == []
+    assert search(em, min_price=10_000_000) == []
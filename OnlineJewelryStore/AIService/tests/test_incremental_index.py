@@ -0,0 +1,175 @@
+"""
+Incremental upsert/remove trên mọi index type: sau mỗi thay đổi, search theo
+đúng text của sản phẩm phải trả về chính ProductID đó
+
+Mỗi index type chạy 2 lần: thay đổi nằm trong index delta (mặc định) và
+delta_max_size=0 (gộp vào index chính sau mỗi update)
+"""
+
+import pytest
+
+from conftest import make_product, top_id
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw"]
+N_PRODUCTS = 600  # Đủ để train IVF-PQ (>= 256 vector)
+
+
+def assert_self_hits(em, catalog):
+    misses = [p["ProductID"] for p in catalog if top_id(em, p) != p["ProductID"]]
+    assert misses == []
+
+
+def assert_compacts_to(em, catalog):
+    """Sau khi gộp delta, index chính chứa đúng 1 vector mỗi sản phẩm"""
+    assert len(em.product_data) == len(catalog)
+    em.compact()
+    assert em.snapshot.delta is None
+    assert em.index.ntotal == len(catalog)
+    assert_self_hits(em, sample(catalog, step=31))
+
+
+@pytest.fixture(params=[(t, d) for t in INDEX_TYPES for d in (2000, 0)], ids=lambda p: f"{p[0]}-delta{p[1]}")
+def built(request, make_manager, products):
+    index_type, delta_max_size = request.param
+    em = make_manager(index_type=index_type, delta_max_size=delta_max_size)
+    catalog = products(N_PRODUCTS)
+    assert em.build_index(catalog)
+    return em, {p["ProductID"]: p for p in catalog}
+
+
+def sample(catalog, step=37):
+    return list(catalog.values())[::step]
+
+
+def test_build_returns_own_product(built):
+    em, catalog = built
+    assert_self_hits(em, sample(catalog))
+
+
+def test_remove_keeps_ids_aligned(built):
+    em, catalog = built
+
+    assert em.remove_products([5]) == 1
+    del catalog[5]
+    assert 5 not in em.product_data
+    assert_self_hits(em, sample(catalog))
+
+    # Lần xóa thứ 2 trên index đã sửa
+    assert em.remove_products([7, 500]) == 2
+    del catalog[7], catalog[500]
+    assert top_id(em, make_product(7)) != 7
+    assert_self_hits(em, sample(catalog, step=23))
+    assert_compacts_to(em, catalog)
+
+
+def test_upsert_changed_product_is_reembedded(built):
+    em, catalog = built
+
+    changed = make_product(100, ProductName="Rose Gold Halo Ring")
+    counts = em.upsert_products([changed])
+    assert counts == {"added": 0, "updated": 1, "unchanged": 0, "removed": 0}
+    catalog[100] = changed
+
+    assert top_id(em, changed) == 100
+    assert em.product_data[100]["ProductName"] == "Rose Gold Halo Ring"
+    assert_self_hits(em, sample(catalog))
+    assert_compacts_to(em, catalog)
+
+
+def test_upsert_adds_new_and_skips_unchanged(built, encoder):
+    em, catalog = built
+
+    new = make_product(N_PRODUCTS + 1)
+    encoded_before = encoder.texts_encoded
+    counts = em.upsert_products([new, catalog[1]])
+
+    assert counts == {"added": 1, "updated": 0, "unchanged": 1, "removed": 0}
+    assert encoder.texts_encoded - encoded_before == 1  # Chỉ encode sản phẩm mới
+    catalog[new["ProductID"]] = new
+    assert top_id(em, new) == N_PRODUCTS + 1
+    assert_self_hits(em, sample(catalog))
+
+    # Gộp delta không encode lại (HNSW dựng graph từ vector đã lưu)
+    encoded_before = encoder.texts_encoded
+    em.compact()
+    assert encoder.texts_encoded == encoded_before
+    assert_compacts_to(em, catalog)
+
+
+def test_filtered_search_after_changes(built):
+    em, catalog = built
+
+    em.remove_products([12])
+    em.upsert_products([make_product(16, ProductName="Vintage Pearl Ring")])
+
+    # Product 16: category Rings (16 % 4 == 0), price 16000
+    product = em.product_data[16]
+    assert top_id(em, product, category="Rings", min_price=10_000, max_price=20_000) == 16
+
+    results = em.search(
+        em.create_product_text(product), top_k=5, min_score=-1.0,
+        category="Rings", min_price=10_000, max_price=20_000
+    )
+    ids = [p["ProductID"] for p, _ in results]
+    assert 12 not in ids
+    assert all(p["CategoryName"] == "Rings" and 10_000 <= p["MinPrice"] <= 20_000 for p, _ in results)
+
+    # Record đổi category / giá: filter theo giá trị mới, không theo lookups cũ
+    em.upsert_products([make_product(20, CategoryName="Earrings", MinPrice=5)])
+    assert top_id(em, em.product_data[20], category="Earrings", max_price=10) == 20
+    assert 20 not in [p["ProductID"] for p, _ in em.search(
+        em.create_product_text(em.product_data[20]), top_k=50, min_score=-1.0, category="Rings"
+    )]
+
+
+def test_sync_removes_missing_products(built):
+    em, catalog = built
+
+    keep = [p for pid, p in catalog.items() if pid % 10 != 0]
+    counts = em.sync_products(keep)
+
+    assert counts["removed"] == N_PRODUCTS // 10
+    assert counts["unchanged"] == len(keep)
+    assert_self_hits(em, keep[::29])
+    assert_compacts_to(em, {p["ProductID"]: p for p in keep})
+
+
+def test_saved_index_updates_after_reload(built, make_manager, tmp_path):
+    em, catalog = built
+    assert em.save_index(str(tmp_path / "faiss_index"))
+
+    reloaded = make_manager(index_type=em.index_type, mmap_index=True, delta_max_size=em.delta_max_size)
+    assert reloaded.load_index(str(tmp_path / "faiss_index"))
+    # Chỉ IVF được mmap (các worker dùng chung page cache); flat/HNSW đọc vào RAM
+    assert bool(reloaded.snapshot.mmap_path) == em.index_type.startswith("ivf")
+
+    reloaded.remove_products([3])
+    del catalog[3]
+    assert_self_hits(reloaded, sample(catalog))
+
+    # Lưu lại: delta được gộp, catalog mới (mmap) thay cho overlay
+    assert reloaded.save_index(str(tmp_path / "faiss_index"))
+    assert type(reloaded.product_data).__name__ == "CatalogStore"
+    assert reloaded.index.ntotal == len(catalog)
+    assert_self_hits(reloaded, sample(catalog))
+
+
+def test_first_changes_build_the_index(make_manager, products):
+    em = make_manager()
+    catalog = products(20)
+
+    counts = em.apply_changes(upserts=catalog + [make_product(3, ProductName="Opal Ring")], removed_ids=[5, 99])
+
+    assert counts == {"added": 19, "updated": 0, "unchanged": 0, "removed": 0}
+    assert em.index.ntotal == 19
+    assert 5 not in em.product_data
+    assert em.product_data[3]["ProductName"] == "Opal Ring"
+
+
+def test_changes_require_model(make_manager, products):
+    em = make_manager()
+    em.model = None
+
+    with pytest.raises(RuntimeError):
+        em.apply_changes(upserts=products(3), removed_ids=[])
+    assert em.index is None
@@ -0,0 +1,98 @@
+"""
+Price filter theo giá LiveStats: sản phẩm có giá mới lọt vào khoảng được tìm
+thấy, sản phẩm có giá mới ra ngoài khoảng không chiếm chỗ trong top_k
+"""
+
+import pytest
+
+from conftest import make_product, top_id
+
+pytest.importorskip("pyodbc")  # live_stats → db_connector import pyodbc ở module level
+
+from live_stats import LiveStats  # noqa: E402
+from rag_service import RAGService  # noqa: E402
+
+N_PRODUCTS = 200
+
+
+def live_row(product_id, price, stock=5):
+    """Row theo LIVE_STATS_COLUMNS"""
+    return (product_id, price, 0, 500, stock, 0, None)
+
+
+@pytest.fixture
+def market(make_manager, products):
+    """Index build với MinPrice = 1000 * ProductID, rồi giá live đổi sau build"""
+    em = make_manager()
+    assert em.build_index(products(N_PRODUCTS))
+
+    prices = {pid: 1000.0 * pid for pid in range(1, N_PRODUCTS + 1)}
+    prices.update({3: 900_000.0, 4: 900_000.0, 150: 5_000.0})  # 3, 4 tăng giá; 150 giảm giá
+    live = LiveStats()
+    live.load([live_row(pid, price, stock=pid % 7) for pid, price in prices.items()])
+    return em, live
+
+
+def candidate_ids(em, **filters):
+    return sorted(em.snapshot.id_map[em.candidate_positions(**filters)].tolist())
+
+
+def test_candidates_use_live_prices(market):
+    em, live = market
+
+    assert candidate_ids(em, max_price=10_000) == list(range(1, 11))
+    assert candidate_ids(em, max_price=10_000, live_prices=live.table) == [1, 2, 5, 6, 7, 8, 9, 10, 150]
+    assert 150 not in candidate_ids(em, min_price=100_000, live_prices=live.table)
+    assert top_id(em, make_product(150), max_price=10_000, live_prices=live.table) == 150
+
+
+def test_live_prices_apply_to_delta_records(market):
+    em, live = market
+
+    renamed, new = make_product(150, ProductName="Opal Cluster Ring"), make_product(N_PRODUCTS + 1)
+    em.upsert_products([renamed, new])
+    assert em.snapshot.delta is not None
+
+    assert top_id(em, renamed, max_price=10_000, live_prices=live.table) == 150
+    hits = em.lexical_search("opal cluster", top_k=1, max_price=10_000, live_prices=live.table)
+    assert hits[0][0]["ProductID"] == 150
+    # Không có trong bảng live → giữ giá trong snapshot
+    assert top_id(em, new, min_price=150_000, live_prices=live.table) == N_PRODUCTS + 1
+    assert top_id(em, new, max_price=10_000, live_prices=live.table) != N_PRODUCTS + 1
+
+
+def test_search_products_returns_full_top_k(market):
+    em, live = market
+    rag = RAGService(em, live_stats=live, response_cache_size=0, min_score=-1.0)
+
+    results = rag.search_products("handmade jewelry piece", max_price=10_000, top_k=9)
+    ids = sorted(p["ProductID"] for p, _ in results)
+
+    assert ids == [1, 2, 5, 6, 7, 8, 9, 10, 150]
+    assert all(p["MinPrice"] <= 10_000 for p, _ in results)
+    assert all(p["TotalStock"] == p["ProductID"] % 7 for p, _ in results)  # Join từ bảng live
+
+
+
+def test_cache_key_follows_live_stats_generation(make_manager, products):
+    em = make_manager()
+    assert em.build_index(products(20))
+    rows = [live_row(pid, 1000.0 * pid) for pid in range(1, 21)]
+    live = LiveStats()
+    live.load(rows)
+    rag = RAGService(em, live_stats=live)
+
+    def lookup():
+        return rag._lookup_response_cache("gold ring", None, None, 10_000, None, 3)
+
+    _, vector, key = lookup()
+    rag.response_cache.store(vector, key, {"success": True})
+
+    # Refresh không đổi gì → cùng generation, vẫn hit
+    assert live.load(rows) == 0
+    assert lookup()[0] == {"success": True}
+
+    # Giá đổi → key mới, câu trả lời cũ không được dùng
+    assert live.load([live_row(1, 2000.0)] + rows[1:]) == 1
+    cached, _, new_key = lookup()
+    assert cached is None and new_key != key
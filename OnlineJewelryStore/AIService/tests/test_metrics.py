@@ -0,0 +1,81 @@
+"""
+Registry.render: text exposition format 0.0.4 mà Prometheus scrape được
+"""
+
+import pytest
+
+from metrics import Registry, cache_families
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_and_gauge(registry):
+    requests = registry.counter("rag_chat_requests", "Chat requests", ["mode", "outcome"])
+    in_flight = registry.gauge("rag_in_flight", "In flight")
+    requests.inc(mode="chat", outcome="success")
+    requests.inc(2, mode="chat", outcome="success")
+    requests.inc(mode="stream", outcome="error")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render() == (
+        "# HELP rag_chat_requests Chat requests\n"
+        "# TYPE rag_chat_requests counter\n"
+        'rag_chat_requests_total{mode="chat",outcome="success"} 3\n'
+        'rag_chat_requests_total{mode="stream",outcome="error"} 1\n'
+        "# HELP rag_in_flight In flight\n"
+        "# TYPE rag_in_flight gauge\n"
+        "rag_in_flight 1\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = registry.histogram("rag_stage_duration_seconds", "Stage latency", ["stage"], buckets=(0.1, 1, 0.5))
+    for value in (0.05, 0.2, 0.7, 3):
+        latency.observe(value, stage="encode")
+
+    assert registry.render().splitlines()[2:] == [
+        'rag_stage_duration_seconds_bucket{stage="encode",le="0.1"} 1',
+        'rag_stage_duration_seconds_bucket{stage="encode",le="0.5"} 2',
+        'rag_stage_duration_seconds_bucket{stage="encode",le="1"} 3',
+        'rag_stage_duration_seconds_bucket{stage="encode",le="+Inf"} 4',
+        'rag_stage_duration_seconds_sum{stage="encode"} 3.95',
+        'rag_stage_duration_seconds_count{stage="encode"} 4'
+    ]
+    assert latency.count(stage="encode") == 4
+
+
+def test_escaping(registry):
+    errors = registry.counter("rag_errors", 'Errors with "quotes" \\ and\nnewline', ["reason"])
+    errors.inc(reason='bad "value"\n\\')
+
+    lines = registry.render().splitlines()
+    assert lines[0] == '# HELP rag_errors Errors with "quotes" \\\\ and\\nnewline'
+    assert lines[2] == 'rag_errors_total{reason="bad \\"value\\"\\n\\\\"} 1'
+
+
+def test_collectors_render_at_scrape_time(registry):
+    stats = {"hits": 1, "misses": 3, "hit_ratio": 0.25, "entries": 4}
+    registry.register_collector(lambda: cache_families("rag_cache", {"query": lambda: stats, "response": None}))
+
+    assert 'rag_cache_hits_total{cache="query"} 1' in registry.render()
+    stats["hits"] = 5
+    rendered = registry.render()
+    assert 'rag_cache_hits_total{cache="query"} 5' in rendered
+    assert 'rag_cache_hit_ratio{cache="query"} 0.25' in rendered
+    assert 'cache="response"' not in rendered
+
+
+def test_invalid_usage(registry):
+    counter = registry.counter("rag_requests", "Requests", ["mode"])
+
+    with pytest.raises(ValueError):
+        registry.counter("rag_requests", "Duplicate")
+    with pytest.raises(ValueError):
+        counter.inc(outcome="success")
+    with pytest.raises(ValueError):
+        counter.inc(-1, mode="chat")
@@ -0,0 +1,55 @@
+"""
+ParallelEncoder ghép vector theo thứ tự shard đã submit, không theo thứ tự
+worker hoàn thành
+
+Worker process được thay bằng thread pool (cùng submit/result) và encoder giả
+để test không phải load model trong từng process.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import parallel_encoder
+from parallel_encoder import ParallelEncoder
+
+
+class SlowFirstEncoder:
+    """Shard chứa text đầu tiên xong sau cùng"""
+
+    def __init__(self, encoder):
+        self.encoder = encoder
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        if texts and texts[0] == "text 0":
+            time.sleep(0.2)
+        return self.encoder.encode(texts)
+
+
+@pytest.fixture
+def parallel(monkeypatch, encoder):
+    monkeypatch.setattr(parallel_encoder, "_worker_model", SlowFirstEncoder(encoder))
+    pe = ParallelEncoder("torch", "unused", workers=4)
+    pe._executor = ThreadPoolExecutor(max_workers=4)
+    yield pe
+    pe.stop()
+
+
+@pytest.mark.parametrize("n_texts", [1, 3, 4, 10, 101])
+def test_output_follows_input_order(parallel, encoder, n_texts):
+    texts = [f"text {i}" for i in range(n_texts)]
+
+    embeddings = parallel.encode(texts)
+
+    assert embeddings.dtype == np.float32
+    assert np.array_equal(embeddings, encoder.encode(texts))
+    assert parallel.encoded == n_texts
+
+
+def test_requires_start():
+    with pytest.raises(RuntimeError):
+        ParallelEncoder("torch", "unused", workers=2).encode(["text"])
+    with pytest.raises(ValueError):
+        ParallelEncoder("torch", "unused", workers=0)
@@ -0,0 +1,57 @@
+"""
+Query embedding cache: các dạng viết khác nhau của cùng 1 query dùng chung
+1 vector, model chỉ encode 1 lần
+"""
+
+import unicodedata
+
+import numpy as np
+
+from cache import LRUCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" thành mới dùng nhất
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 3, "misses": 1, "hit_ratio": 0.75}
+
+
+def test_disabled_cache_stores_nothing():
+    cache = LRUCache(max_entries=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_normalize_query(make_manager):
+    em = make_manager()
+    nfd = unicodedata.normalize('NFD', "Nhẫn Cưới")
+
+    assert em.normalize_query("  Nhẫn \t Cưới\n") == "nhẫn cưới"
+    assert em.normalize_query(nfd) == em.normalize_query("nhẫn cưới")
+    assert em.normalize_query("ROSE   GOLD") == "rose gold"
+
+
+def test_equivalent_queries_share_one_encode(make_manager, encoder):
+    em = make_manager()
+    queries = ["Nhẫn cưới vàng", "  nhẫn   CƯỚI vàng ", unicodedata.normalize('NFD', "NHẪN CƯỚI VÀNG")]
+
+    vectors = [em.encode_query(q) for q in queries]
+
+    assert encoder.calls == 1
+    assert all(v is vectors[0] for v in vectors)
+    assert vectors[0].shape == (1, encoder.dimension)
+    assert np.isclose(np.linalg.norm(vectors[0]), 1.0)
+    assert not vectors[0].flags.writeable  # Dùng chung giữa các request
+    assert (em.query_cache.hits, em.query_cache.misses) == (2, 1)
+
+    em.encode_query("nhẫn bạc")
+    assert encoder.calls == 2
+    assert len(em.query_cache) == 2
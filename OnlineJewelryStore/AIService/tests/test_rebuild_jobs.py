@@ -0,0 +1,56 @@
+"""
+Status của rebuild job ghi ra file: poll tới worker khác vẫn thấy job
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("pyodbc")  # main import db_connector
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def jobs_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(main.state, "rebuild_jobs_dir", str(tmp_path / "rebuild_jobs"))
+    monkeypatch.setattr(main.state, "rebuild_jobs", main.OrderedDict())
+    return tmp_path / "rebuild_jobs"
+
+
+def make_job(job_id: str, **fields) -> dict:
+    return {
+        "job_id": job_id, "request_id": job_id, "status": "queued", "message": "Index rebuild queued",
+        "products_indexed": 0, "created_at": "2026-01-01T00:00:00", "encode_workers": None, **fields
+    }
+
+
+def test_other_worker_reads_job_file(jobs_dir):
+    job = make_job("0123456789ab", future=object())
+    main._save_job(job)
+    job.update(status="completed", products_indexed=42, encode_stats={"workers": 2})
+    main._save_job(job)
+
+    # Worker khác: rebuild_jobs trong RAM không có job này
+    assert "0123456789ab" not in main.state.rebuild_jobs
+    loaded = main._load_job("0123456789ab")
+    assert loaded["status"] == "completed"
+    assert loaded["products_indexed"] == 42
+    assert "future" not in loaded and "encode_workers" not in loaded
+    assert main.RebuildJobResponse(**loaded).encode_stats == {"workers": 2}
+
+
+def test_job_files_are_pruned(jobs_dir, monkeypatch):
+    monkeypatch.setattr(main.state, "max_rebuild_jobs", 3)
+    for i in range(5):
+        main._save_job(make_job(f"{i:012x}"))
+        os.utime(jobs_dir / f"{i:012x}.json", (1_000_000 + i, 1_000_000 + i))
+
+    assert sorted(p.name for p in jobs_dir.iterdir()) == [f"{i:012x}.json" for i in (2, 3, 4)]
+
+
+def test_unknown_or_invalid_job_id(jobs_dir):
+    main._save_job(make_job("0123456789ab"))
+
+    assert main._load_job("ffffffffffff") is None
+    assert main._load_job("../0123456789ab") is None
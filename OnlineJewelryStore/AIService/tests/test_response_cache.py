@@ -0,0 +1,87 @@
+"""
+Semantic response cache: hit khi query vector đủ gần và cùng filter key,
+entry hết hạn theo TTL, bị loại theo LRU khi đầy
+"""
+
+import time
+
+import numpy as np
+
+from cache import SemanticResponseCache
+
+
+def unit(*values):
+    vector = np.array(values, dtype='float32')
+    return vector / np.linalg.norm(vector)
+
+
+def test_similarity_threshold():
+    cache = SemanticResponseCache(similarity_threshold=0.95)
+    cache.store(unit(1, 0, 0), "key", {"response": "A"})
+
+    assert cache.lookup(unit(1, 0.1, 0), "key") == {"response": "A"}  # cosine ≈ 0.995
+    assert cache.lookup(unit(1, 0.5, 0), "key") is None                # cosine ≈ 0.894
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_filter_key_must_match():
+    cache = SemanticResponseCache()
+    cache.store(unit(1, 0, 0), ("Rings", None, 5_000_000, 1), {"response": "A"})
+
+    assert cache.lookup(unit(1, 0, 0), ("Rings", None, 5_000_000, 2)) is None
+    assert cache.lookup(unit(1, 0, 0), ("Rings", None, 5_000_000, 1)) == {"response": "A"}
+
+
+def test_best_match_wins():
+    cache = SemanticResponseCache(similarity_threshold=0.9)
+    cache.store(unit(1, 0.3, 0), "key", {"response": "near"})
+    cache.store(unit(1, 0, 0), "key", {"response": "exact"})
+    cache.store(unit(0, 1, 0), "key", {"response": "far"})
+
+    assert cache.lookup(unit(1, 0.01, 0), "key") == {"response": "exact"}
+
+
+def test_entries_expire():
+    cache = SemanticResponseCache(ttl_seconds=0.05)
+    cache.store(unit(1, 0, 0), "key", {"response": "A"})
+    assert cache.lookup(unit(1, 0, 0), "key") is not None
+
+    time.sleep(0.1)
+    assert cache.lookup(unit(1, 0, 0), "key") is None
+    assert len(cache) == 0
+
+
+def test_expiry_follows_creation_order():
+    cache = SemanticResponseCache(ttl_seconds=0.1)
+    cache.store(unit(1, 0, 0), "key", {"response": "A"})
+    time.sleep(0.06)
+    cache.store(unit(0, 1, 0), "key", {"response": "B"})
+    assert cache.lookup(unit(1, 0, 0), "key") == {"response": "A"}  # Dùng lại không gia hạn TTL
+
+    time.sleep(0.06)
+    assert cache.lookup(unit(1, 0, 0), "key") is None
+    assert cache.lookup(unit(0, 1, 0), "key") == {"response": "B"}
+    assert len(cache) == 1
+
+
+def test_lru_eviction():
+    cache = SemanticResponseCache(max_entries=2)
+    cache.store(unit(1, 0, 0), "key", {"response": "A"})
+    cache.store(unit(0, 1, 0), "key", {"response": "B"})
+    assert cache.lookup(unit(1, 0, 0), "key") == {"response": "A"}  # A thành mới dùng nhất
+
+    cache.store(unit(0, 0, 1), "key", {"response": "C"})
+
+    assert len(cache) == 2
+    assert cache.lookup(unit(0, 1, 0), "key") is None
+    assert cache.lookup(unit(1, 0, 0), "key") == {"response": "A"}
+    assert cache.lookup(unit(0, 0, 1), "key") == {"response": "C"}
+
+
+def test_disabled_cache():
+    cache = SemanticResponseCache(max_entries=0)
+    cache.store(unit(1, 0, 0), "key", {"response": "A"})
+
+    assert not cache.enabled
+    assert cache.lookup(unit(1, 0, 0), "key") is None
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
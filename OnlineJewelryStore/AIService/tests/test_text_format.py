@@ -0,0 +1,58 @@
+"""
+Index lưu với create_product_text cũ phải được nhận ra và encode lại toàn bộ
+"""
+
+from catalog_store import CatalogStore
+from conftest import write_legacy_index
+from embeddings_manager import read_manifest
+
+N_PRODUCTS = 50
+
+
+def saved_index(make_manager, products, tmp_path):
+    em = make_manager()
+    catalog = products(N_PRODUCTS)
+    assert em.build_index(catalog)
+    path = str(tmp_path / "faiss_index")
+    assert em.save_index(path)
+    return em, catalog, path
+
+
+def test_saved_catalog_records_text_format(make_manager, products, tmp_path):
+    em, _, path = saved_index(make_manager, products, tmp_path)
+
+    assert CatalogStore(read_manifest(path)[".catalog"]).meta["text_format"] == em.TEXT_FORMAT
+
+    reloaded = make_manager()
+    assert reloaded.load_index(path)
+    assert not reloaded.text_format_stale
+
+
+def test_legacy_pickle_is_fully_reembedded(make_manager, products, tmp_path, encoder):
+    catalog = products(N_PRODUCTS)
+    path = str(tmp_path / "faiss_index")
+    legacy = make_manager()
+    write_legacy_index(path, legacy, catalog)  # Không có content hash
+
+    assert legacy.load_index(path)
+    assert legacy.text_format_stale
+
+    # Không có hash của text mới → sync encode lại mọi sản phẩm
+    encoded_before = encoder.texts_encoded
+    counts = legacy.sync_products(catalog)
+    assert counts["updated"] == N_PRODUCTS
+    assert encoder.texts_encoded - encoded_before == N_PRODUCTS
+
+
+def test_saving_keeps_stale_text_format(make_manager, products, tmp_path):
+    catalog = products(N_PRODUCTS)
+    path = str(tmp_path / "faiss_index")
+    stale = make_manager()
+    write_legacy_index(path, stale, catalog)
+    assert stale.load_index(path)
+
+    # Lưu lại không làm index cũ thành "mới"; rebuild thì có
+    assert stale.save_index(path)
+    assert CatalogStore(read_manifest(path)[".catalog"]).meta["text_format"] == 1
+    assert stale.build_index(catalog)
+    assert not stale.text_format_stale
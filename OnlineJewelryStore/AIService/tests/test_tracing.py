@@ -0,0 +1,58 @@
+"""
+JsonlExporter: trace được ghi trên thread nền, file rotate theo kích thước
+"""
+
+import json
+import threading
+
+from tracing import JsonlExporter, Tracer
+
+
+def run_traces(tracer, n):
+    for i in range(n):
+        with tracer.start_trace("POST /chat", request_id=f"req-{i}"):
+            with tracer.span("EmbeddingsManager.search", top_k=3):
+                pass
+
+
+def test_traces_written_after_close(tmp_path):
+    path = tmp_path / "logs" / "traces.jsonl"
+    exporter = JsonlExporter(str(path))
+    writers = []
+    exporter._handler.emit = lambda record, emit=exporter._handler.emit: (
+        writers.append(threading.get_ident()), emit(record)
+    )
+    tracer = Tracer([exporter])
+
+    run_traces(tracer, 20)
+    tracer.close()
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [t["trace_id"] for t in lines] == [f"req-{i}" for i in range(20)]
+    assert lines[0]["spans"][1]["name"] == "EmbeddingsManager.search"
+    assert set(writers) != {threading.get_ident()}  # Không ghi trên thread của request
+    assert not tracer.enabled
+
+
+def test_rotation(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer([JsonlExporter(str(path), max_bytes=2000, backup_count=2)])
+
+    run_traces(tracer, 50)
+    tracer.close()
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    assert all(p.stat().st_size <= 2000 for p in tmp_path.iterdir())
+
+
+def test_min_duration_and_full_queue(tmp_path):
+    exporter = JsonlExporter(str(tmp_path / "traces.jsonl"), max_queue=1)
+    exporter._listener.stop()  # Không có thread ghi → queue đầy sau 1 trace
+    tracer = Tracer([exporter])
+
+    run_traces(tracer, 3)
+
+    assert exporter.dropped == 2
+    exporter.min_duration_ms = 60_000
+    run_traces(tracer, 3)
+    assert exporter.dropped == 2
@@ -0,0 +1,391 @@
+"""
+Tracing - span theo từng request cho RAG pipeline (kiểu OpenTelemetry, không cần collector)
+Mỗi request là 1 trace (trace_id = X-Request-ID), các bước là span lồng nhau
+(encode, FAISS, DB, Ollama...). Span hiện tại nằm trong contextvars nên đi theo
+request qua await; khi chuyển sang thread pool phải chạy trong
+contextvars.copy_context() (xem RAGService.run_in_executor).
+
+Khi trace kết thúc nó được gửi cho các exporter: ConsoleExporter (log cây span)
+hoặc JsonlExporter (1 dòng JSON / request, đọc offline). Không có exporter
+→ span là no-op.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+MAX_REQUEST_ID_LENGTH = 64
+
+
+class Span:
+    """1 bước trong trace; thời gian đo bằng perf_counter, start_time để hiển thị"""
+
+    def __init__(self, name: str, trace: "Trace", parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_time = time.time()
+        self.duration_ms = None
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: Any):
+        """Đánh dấu span lỗi khi exception đã được xử lý (không raise ra ngoài span)"""
+        self.status = "error"
+        self.attributes["error"] = str(error)
+
+    def end(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    @property
+    def offset_ms(self) -> float:
+        """Thời điểm bắt đầu tính từ đầu trace"""
+        return (self._start - self.trace.root._start) * 1000
+
+    def to_dict(self) -> Dict:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.start_time).isoformat(),
+            "offset_ms": round(self.offset_ms, 3),
+            "duration_ms": round(self.duration_ms, 3) if self.duration_ms is not None else None,
+            "status": self.status,
+            "attributes": self.attributes
+        }
+
+
+class _NoopSpan:
+    """Dùng khi không có trace đang chạy: set_attribute không làm gì"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: Any):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.root: Optional[Span] = None
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        with self._lock:
+            if self.root is None:
+                self.root = span
+            self.spans.append(span)
+
+    def children(self) -> Dict[Optional[str], List[Span]]:
+        with self._lock:
+            spans = list(self.spans)
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in spans:
+            children.setdefault(span.parent_id, []).append(span)
+        return children
+
+    @staticmethod
+    def _self_ms(span: Span, children: Dict[Optional[str], List[Span]]) -> float:
+        """Thời gian không nằm trong span con nào (giả định span con chạy tuần tự)"""
+        return max(0.0, span.duration_ms - sum(c.duration_ms or 0 for c in children.get(span.span_id, [])))
+
+    def critical_path(self) -> List[Dict]:
+        """
+        Chuỗi span quyết định latency: từ root, mỗi bước đi vào span con kết thúc muộn nhất
+
+        Returns:
+            [{"name", "duration_ms", "self_ms"}, ...] từ root xuống
+        """
+        children = self.children()
+        path, span = [], self.root
+        while span is not None and span.duration_ms is not None:
+            path.append({
+                "name": span.name,
+                "duration_ms": round(span.duration_ms, 3),
+                "self_ms": round(self._self_ms(span, children), 3)
+            })
+            finished = [c for c in children.get(span.span_id, []) if c.duration_ms is not None]
+            span = max(finished, key=lambda c: c.offset_ms + c.duration_ms, default=None)
+        return path
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "start": datetime.fromtimestamp(self.root.start_time).isoformat(),
+            "duration_ms": round(self.root.duration_ms, 3),
+            "status": self.root.status,
+            "critical_path": self.critical_path(),
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+
+class ConsoleExporter:
+    def __init__(self, min_duration_ms: float = 0.0):
+        """
+        Log mỗi trace thành cây span (offset, duration) + critical path
+
+        Args:
+            min_duration_ms: Chỉ log trace chậm hơn N ms
+        """
+        self.min_duration_ms = min_duration_ms
+
+    def export(self, trace: Trace):
+        if trace.root.duration_ms < self.min_duration_ms:
+            return
+
+        children = trace.children()
+        lines = [f"🔎 Trace {trace.trace_id} {trace.root.name}: {trace.root.duration_ms:.1f}ms"]
+
+        def walk(span: Span, depth: int):
+            status = "" if span.status == "ok" else f" [{span.status}]"
+            lines.append(
+                f"{'   ' * depth}├─ {span.name} +{span.offset_ms:.1f}ms {span.duration_ms or 0:.1f}ms"
+                f" (self {trace._self_ms(span, children):.1f}ms){status}"
+            )
+            for child in sorted(children.get(span.span_id, []), key=lambda c: c.offset_ms):
+                walk(child, depth + 1)
+
+        for child in sorted(children.get(trace.root.span_id, []), key=lambda c: c.offset_ms):
+            walk(child, 1)
+
+        lines.append("   Critical path: " + " → ".join(
+            f"{step['name']} ({step['self_ms']:.1f}ms self)" for step in trace.critical_path()
+        ))
+        logger.info("\n".join(lines))
+
+
+class _TraceRecord(logging.LogRecord):
+    """LogRecord mà message (dòng JSON) chỉ được tạo trên thread ghi file"""
+
+    def __init__(self, trace: Trace):
+        super().__init__("tracing.jsonl", logging.INFO, __file__, 0, "", None, None)
+        self.trace = trace
+        self._line = None
+
+    def getMessage(self) -> str:
+        # RotatingFileHandler format 2 lần (kiểm tra rollover + ghi)
+        if self._line is None:
+            self._line = json.dumps(self.trace.to_dict(), ensure_ascii=False, default=str)
+        return self._line
+
+
+class JsonlExporter:
+    def __init__(
+        self,
+        path: str,
+        min_duration_ms: float = 0.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        backup_count: int = 5,
+        max_queue: int = 10_000
+    ):
+        """
+        Ghi mỗi trace thành 1 dòng JSON để phân tích offline
+
+        export() chỉ đưa trace vào queue; serialize + ghi file chạy trên
+        thread nền (QueueListener) nên request không chờ disk I/O. File
+        được rotate (RotatingFileHandler): rotation không an toàn khi nhiều
+        process ghi cùng 1 file → mỗi worker process dùng file riêng.
+        Queue đầy (disk chậm) → bỏ trace, đếm vào `dropped`.
+
+        Args:
+            path: File .jsonl
+            min_duration_ms: Chỉ ghi trace chậm hơn N ms
+            max_bytes: Rotate khi file vượt N bytes
+            backup_count: Số file cũ giữ lại (path.1 ... path.N)
+            max_queue: Số trace tối đa chờ ghi
+        """
+        self.path = path
+        self.min_duration_ms = min_duration_ms
+        self.dropped = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+        )
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._listener = QueueListener(self._queue, self._handler)
+        self._listener.start()
+
+    def export(self, trace: Trace):
+        if trace.root.duration_ms < self.min_duration_ms:
+            return
+
+        try:
+            self._queue.put_nowait(_TraceRecord(trace))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Ghi nốt các trace trong queue rồi đóng file"""
+        self._listener.stop()
+        self._handler.close()
+
+
+class Tracer:
+    def __init__(self, exporters: Optional[List] = None):
+        """
+        Tạo trace/span và gửi trace hoàn chỉnh cho exporters
+
+        Args:
+            exporters: ConsoleExporter / JsonlExporter (rỗng = tắt tracing)
+        """
+        self.exporters = list(exporters or [])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def configure(self, exporters: List):
+        self.exporters = list(exporters)
+
+    def close(self):
+        """Tắt tracing và flush các exporter chạy nền (JsonlExporter)"""
+        exporters, self.exporters = self.exporters, []
+        for exporter in exporters:
+            if hasattr(exporter, "close"):
+                exporter.close()
+
+    @contextmanager
+    def start_trace(self, name: str, request_id: Optional[str] = None, **attributes) -> Iterator[Span]:
+        """
+        Root span của 1 request; export trace khi block kết thúc
+
+        Args:
+            name: Tên root span, vd. "POST /chat"
+            request_id: X-Request-ID của request (None → tự sinh)
+            **attributes: Thuộc tính của root span
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        trace = Trace(request_id or new_request_id())
+        root = Span(name, trace, None, attributes)
+        trace.add(root)
+
+        try:
+            with self._activate(root):
+                yield root
+        finally:
+            # Export cả trace lỗi - chính là trace cần xem nhất
+            for exporter in self.exporters:
+                try:
+                    exporter.export(trace)
+                except Exception as e:
+                    logger.warning(f"⚠️  Trace export failed ({type(exporter).__name__}): {e}")
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        Span con của span hiện tại (no-op nếu không có trace đang chạy)
+
+        Args:
+            name: Tên span, vd. "EmbeddingsManager.search"
+            **attributes: Thuộc tính của span
+        """
+        parent = _current_span.get()
+        if parent is None:
+            yield NOOP_SPAN
+            return
+
+        span = Span(name, parent.trace, parent.span_id, attributes)
+        parent.trace.add(span)
+
+        with self._activate(span):
+            yield span
+
+    @staticmethod
+    @contextmanager
+    def _activate(span: Span) -> Iterator[None]:
+        token = _current_span.set(span)
+        try:
+            yield
+        except BaseException as e:
+            if isinstance(e, GeneratorExit):
+                span.status = "cancelled"
+            else:
+                span.record_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.end()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Generator bị đóng từ context khác (client ngắt stream)
+                pass
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Span con trên tracer mặc định"""
+    return tracer.span(name, **attributes)
+
+
+def current_span():
+    """Span đang chạy (NOOP_SPAN nếu không có) để gắn thêm attributes"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def current_request_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current else None
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def sanitize_request_id(value: Optional[str]) -> str:
+    """Request ID từ header client: giữ ký tự an toàn, giới hạn độ dài; rỗng → sinh mới"""
+    if value:
+        value = "".join(ch for ch in value.strip() if ch.isalnum() or ch in "-_.:")[:MAX_REQUEST_ID_LENGTH]
+    return value or new_request_id()
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator: chạy hàm trong 1 span (mặc định tên = Class.method)
+
+    Không dùng cho generator - span sẽ đóng trước khi generator chạy.
+    """
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -20,6 +20,8 @@ namespace OnlineJewelryStore.Controllers
         // AI Service configuration
         private static readonly string AI_SERVICE_URL = System.Configuration.ConfigurationManager.AppSettings["AIServiceUrl"];
         private const int REQUEST_TIMEOUT_SECONDS = 180;  // ✅ 3 phút cho lần đầu load model
+        private const int REBUILD_WAIT_SECONDS = 240;  // RebuildIndex chờ job tối đa (< executionTimeout 300s)
+        private const int REBUILD_POLL_SECONDS = 2;
 
         // HttpClient singleton với proper configuration
         private static readonly HttpClient httpClient = new HttpClient
@@ -37,11 +39,29 @@ namespace OnlineJewelryStore.Controllers
             );
         }
 
+        // Request ID cho 1 lời gọi AI service: dùng lại X-Request-ID của request hiện tại nếu có
+        private string NewRequestId()
+        {
+            var incoming = Request?.Headers["X-Request-ID"];
+            return string.IsNullOrWhiteSpace(incoming) ? Guid.NewGuid().ToString("N") : incoming;
+        }
+
+        // HttpClient dùng chung → header theo từng request phải gắn vào HttpRequestMessage
+        private static HttpRequestMessage CreateAIRequest(HttpMethod method, string path, HttpContent content, string requestId)
+        {
+            var request = new HttpRequestMessage(method, path) { Content = content };
+            request.Headers.Add("X-Request-ID", requestId);
+            return request;
+        }
+
         // POST: /Chatbot/Chat
         // Main endpoint để gửi message đến AI service
         [HttpPost]
         public async Task<JsonResult> Chat(ChatRequestViewModel model)
         {
+            // Request ID gửi sang AI service (X-Request-ID) để tra trace của đúng request này
+            var requestId = NewRequestId();
+
             try
             {
                 // Validate model
@@ -89,16 +109,16 @@ namespace OnlineJewelryStore.Controllers
                 );
 
                 // ✅ LOG REQUEST (optional - for debugging)
-                System.Diagnostics.Debug.WriteLine($"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] AI Request: {jsonContent}");
+                System.Diagnostics.Debug.WriteLine($"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] AI Request {requestId}: {jsonContent}");
 
                 // Call AI service
-                var response = await httpClient.PostAsync("/chat", httpContent);
+                var response = await httpClient.SendAsync(CreateAIRequest(HttpMethod.Post, "/chat", httpContent, requestId));
 
                 // Read response
                 var responseContent = await response.Content.ReadAsStringAsync();
 
                 // ✅ LOG RESPONSE (optional - for debugging)
-                System.Diagnostics.Debug.WriteLine($"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] AI Response [{response.StatusCode}]: {responseContent.Substring(0, Math.Min(200, responseContent.Length))}...");
+                System.Diagnostics.Debug.WriteLine($"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] AI Response {requestId} [{response.StatusCode}]: {responseContent.Substring(0, Math.Min(200, responseContent.Length))}...");
 
                 if (response.IsSuccessStatusCode)
                 {
@@ -138,6 +158,7 @@ namespace OnlineJewelryStore.Controllers
                 {
                     // ✅ AI service error - LOG CHI TIẾT
                     var errorDetail = $"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] AI Service Error: {response.StatusCode}\n" +
+                                     $"Request ID: {requestId}\n" +
                                      $"Request: {jsonContent}\n" +
                                      $"Response: {responseContent}\n";
 
@@ -175,6 +196,7 @@ namespace OnlineJewelryStore.Controllers
             {
                 // ✅ Timeout - LOG CHI TIẾT
                 var timeoutDetail = $"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] TIMEOUT after {REQUEST_TIMEOUT_SECONDS}s\n" +
+                                   $"Request ID: {requestId}\n" +
                                    $"Exception: {ex.Message}\n";
 
                 System.Diagnostics.Debug.WriteLine(timeoutDetail);
@@ -199,6 +221,7 @@ namespace OnlineJewelryStore.Controllers
             {
                 // ✅ Connection error - LOG CHI TIẾT
                 var connError = $"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] CONNECTION ERROR\n" +
+                               $"Request ID: {requestId}\n" +
                                $"Exception: {ex.Message}\n" +
                                $"AI Service URL: {AI_SERVICE_URL}\n";
 
@@ -224,6 +247,7 @@ namespace OnlineJewelryStore.Controllers
             {
                 // ✅ General error - LOG CHI TIẾT
                 var generalError = $"[{DateTime.Now:yyyy-MM-dd HH:mm:ss}] GENERAL ERROR\n" +
+                                  $"Request ID: {requestId}\n" +
                                   $"Exception: {ex.Message}\n" +
                                   $"StackTrace: {ex.StackTrace}\n";
 
@@ -288,34 +312,46 @@ namespace OnlineJewelryStore.Controllers
 
         // POST: /Chatbot/RebuildIndex
         // Trigger AI service to rebuild product index | chỉ có Admin, tương lai phát triển tự động rebuild mỗi 7 ngày
+        // AI service trả 202 + job_id ngay (rebuild chạy nền) → poll /index-rebuild/{job_id} tới khi xong
         [HttpPost]
         [Authorize(Roles = "Administrator")]
         public async Task<JsonResult> RebuildIndex()
         {
             try
             {
-                var response = await httpClient.PostAsync("/index-rebuild", null);
+                var requestId = NewRequestId();
+                var response = await httpClient.SendAsync(CreateAIRequest(HttpMethod.Post, "/index-rebuild", null, requestId));
                 var content = await response.Content.ReadAsStringAsync();
 
-                if (response.IsSuccessStatusCode)
+                if (!response.IsSuccessStatusCode)
                 {
-                    var result = JsonConvert.DeserializeObject<dynamic>(content);
                     return Json(new
                     {
-                        success = true,
-                        message = (string)result.message,
-                        products_indexed = (int)result.products_indexed
+                        success = false,
+                        error = "Failed to start index rebuild",
+                        details = content
                     });
                 }
-                else
+
+                var started = JsonConvert.DeserializeObject<dynamic>(content);
+                string jobId = started.job_id;
+
+                // Chờ trong giới hạn executionTimeout (300s); job lâu hơn thì trả status "running",
+                // admin xem tiếp qua /Chatbot/RebuildStatus?jobId=...
+                var deadline = DateTime.UtcNow.AddSeconds(REBUILD_WAIT_SECONDS);
+                dynamic job = null;
+                while (true)
                 {
-                    return Json(new
+                    job = await GetRebuildJob(jobId, requestId);
+                    string status = job.status;
+                    if (status == "completed" || status == "failed" || DateTime.UtcNow >= deadline)
                     {
-                        success = false,
-                        error = "Failed to rebuild index",
-                        details = content
-                    });
+                        break;
+                    }
+                    await Task.Delay(TimeSpan.FromSeconds(REBUILD_POLL_SECONDS));
                 }
+
+                return RebuildJobResult(job);
             }
             catch (Exception ex)
             {
@@ -327,6 +363,57 @@ namespace OnlineJewelryStore.Controllers
             }
         }
 
+        // GET: /Chatbot/RebuildStatus?jobId=...
+        // Trạng thái job rebuild (dùng khi RebuildIndex trả về status "running")
+        [HttpGet]
+        [Authorize(Roles = "Administrator")]
+        public async Task<JsonResult> RebuildStatus(string jobId)
+        {
+            try
+            {
+                return RebuildJobResult(await GetRebuildJob(jobId, NewRequestId()), JsonRequestBehavior.AllowGet);
+            }
+            catch (Exception ex)
+            {
+                return Json(new
+                {
+                    success = false,
+                    error = ex.Message
+                }, JsonRequestBehavior.AllowGet);
+            }
+        }
+
+        // GET /index-rebuild/{job_id} của AI service
+        private static async Task<dynamic> GetRebuildJob(string jobId, string requestId)
+        {
+            var path = "/index-rebuild/" + Uri.EscapeDataString(jobId ?? "");
+            var response = await httpClient.SendAsync(CreateAIRequest(HttpMethod.Get, path, null, requestId));
+            var content = await response.Content.ReadAsStringAsync();
+
+            if (!response.IsSuccessStatusCode)
+            {
+                throw new HttpRequestException($"Rebuild job {jobId} status unavailable ({(int)response.StatusCode}): {content}");
+            }
+            return JsonConvert.DeserializeObject<dynamic>(content);
+        }
+
+        // Job status → JSON cho admin: failed thì success = false kèm lỗi của job
+        private JsonResult RebuildJobResult(dynamic job, JsonRequestBehavior behavior = JsonRequestBehavior.DenyGet)
+        {
+            string status = job.status;
+            return Json(new
+            {
+                success = status != "failed",
+                job_id = (string)job.job_id,
+                status = status,
+                completed = status == "completed",
+                message = (string)job.message,
+                products_indexed = (int)job.products_indexed,
+                duration_s = (double?)job.duration_s,
+                error = (string)job.error
+            }, behavior);
+        }
+
         // GET: /Chatbot/GetProductImage/{id}
         // Helper method để lấy product hình ảnh từ database
         [HttpGet]